@@ -0,0 +1,317 @@
+"""The compiler driver.  Parses a set of source files into modules, links each module to the
+modules it imports and binds their members.  Files can be parsed in a pool of worker processes,
+and files that have not changed since an earlier build are loaded from the parse cache."""
+
+import optparse
+import os
+import sys
+
+import err
+import typesys.builtins
+import typesys.strings
+import typesys.struct
+import typesys.type
+
+from gen import transform_cache
+from mparser import incremental
+from mparser import tokenizer
+
+import cache
+import serial
+import tests
+
+#  The compiler version.  Cached units are only reused by the same version, so change this
+# whenever the parsed representation changes.
+VERSION = "0.1.4"
+
+class Unit:
+    "The result of parsing one source file."
+    def __init__(self, filename, name, imports, module):
+        self.filename = filename
+        self.name = name
+        
+        # The names of the modules this one imports.
+        self.imports = imports
+        
+        # The typesys module holding the file's definitions.
+        self.module = module
+        
+        # True once the module's members have been bound.
+        self.bound = False
+        
+        # The number of warnings and errors logged while handling the file.
+        self.warnings = 0
+        self.errors = 0
+        
+def find_sources(paths):
+    "Returns the .metal files named in paths.  Directories are searched recursively."
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(".metal"):
+                        sources.append(os.path.join(root, name))
+        else:
+            sources.append(path)
+            
+    return sources
+
+def find_imports(text, tokens):
+    """Returns the names of the modules imported at the top level of the text, from statements
+    like 'import A, B' and 'from package import A, B'."""
+    imports = []
+    depth = 0
+    idx = 0
+    count = len(tokens)
+    while idx<count:
+        start = tokens.starts[idx]
+        kind = tokens.kinds[idx]
+        idx+=1
+        
+        if kind==tokenizer.OP:
+            if text[start]=="{": depth+=1
+            elif text[start]=="}": depth=max(depth-1, 0)
+            continue
+        
+        if depth!=0 or kind!=tokenizer.IDENT or text[start:start+tokens.lengths[idx-1]]!="import":
+            continue
+        
+        # Collect the comma separated list of names.
+        while idx<count and tokens.kinds[idx]==tokenizer.IDENT:
+            start = tokens.starts[idx]
+            imports.append(text[start:start+tokens.lengths[idx]])
+            idx+=1
+            if idx<count and tokens.kinds[idx]==tokenizer.OP and text[tokens.starts[idx]]==",":
+                idx+=1
+            else:
+                break
+            
+    return imports
+
+def read_source(filename):
+    "Returns the text of a source file."
+    f = open(filename)
+    text = f.read()
+    f.close()
+    return text
+
+def parse_source(filename, text, log):
+    "Parses the text of a source file, returns a Unit for it.  Modules without imports are bound right away."
+    warnings, errors = log.warnings, log.errors
+    result = incremental.parse(text, filename, log)
+    unit = Unit(filename, result.module.name, find_imports(text, result.tokens), result.module)
+    
+    if len(unit.imports)==0:
+        unit.module.bindMembers(log)
+        unit.bound = True
+        
+    unit.warnings = log.warnings-warnings
+    unit.errors = log.errors-errors
+    return unit
+
+def init_worker(word, char, type_info, reorder_members):
+    "Sets up the type system in a worker process."
+    typesys.type.setMachineSizes(word, char)
+    typesys.builtins.setTypeInfoMode(type_info)
+    typesys.builtins.initialize()
+    typesys.struct.setMemberReordering(reorder_members)
+    
+def parse_job(job):
+    "Parses a (filename, text) pair in a worker process.  Returns the serialized Unit."
+    filename, text = job
+    return serial.dumps(parse_source(filename, text, err.new(sys.stderr)))
+
+def dependency_order(units):
+    """Returns the units ordered so that every unit comes after the units it imports.  Imports
+    that form a cycle are ordered by the first unit that reaches them."""
+    order = []
+    state = {}
+    for name in sorted(units.keys()):
+        if name in state:
+            continue
+        
+        # Depth first walk with an explicit stack of (name, remaining imports).
+        state[name] = 1
+        stack = [(name, list(units[name].imports))]
+        while len(stack):
+            current, remaining = stack[-1]
+            if len(remaining)==0:
+                stack.pop()
+                state[current] = 2
+                order.append(units[current])
+                continue
+            
+            dep = remaining.pop(0)
+            if dep in units and dep not in state:
+                state[dep] = 1
+                stack.append((dep, list(units[dep].imports)))
+                
+    return order
+        
+class Driver:
+    "Runs the front end over a set of source files."
+    def __init__(self, log, jobs=1, word=typesys.type.UINT32, char=typesys.type.UINT8, parse_cache=None,
+                 type_info=typesys.builtins.TYPE_INFO_ALL, reorder_members=False):
+        self.log = log
+        
+        # The number of worker processes. 1 parses in this process, 0 uses one per cpu.
+        self.jobs = jobs
+        
+        # The cache.Cache of parsed units, or None to always parse.
+        self.cache = parse_cache
+        
+        # The machine sizes the modules are compiled for.
+        self.word = word
+        self.char = char
+        
+        # The typesys.builtins type info mode.
+        self.type_info = type_info
+        
+        # True to reorder struct fields to leave less padding when the modules are bound.
+        self.reorder_members = reorder_members
+        
+        # Dictionary of module name to Unit.
+        self.units = {}
+        
+        # The strings of every module, pooled when the modules are linked.
+        self.strings = typesys.strings.new()
+        
+    def parse(self, sources):
+        "Parses the source files, returns a list of Units in the same order."
+        units = [None]*len(sources)
+        jobs = []
+        for i, filename in enumerate(sources):
+            text = read_source(filename)
+            key = None
+            if self.cache!=None:
+                key = cache.make_key(filename, text, VERSION)
+                data = self.cache.get(key)
+                if data!=None:
+                    units[i] = serial.loads(data)
+                    continue
+            jobs.append((i, key, filename, text))
+            
+        for (i, key, filename, text), (unit, data) in zip(jobs, self.parseJobs([job[2:] for job in jobs])):
+            # Units with diagnostics are parsed again next time so their messages are repeated.
+            if key!=None and unit.warnings==0 and unit.errors==0:
+                self.cache.put(key, data or serial.dumps(unit))
+            units[i] = unit
+            
+        return units
+    
+    def parseJobs(self, jobs):
+        """Parses a list of (filename, text) pairs.  Returns a list of (Unit, serialized Unit) pairs
+        in the same order, the serialized Unit is None when the file was parsed in this process."""
+        if self.jobs==1 or len(jobs)<2:
+            return [(parse_source(filename, text, self.log), None) for filename, text in jobs]
+        
+        import multiprocessing
+        
+        count = self.jobs if self.jobs>0 else multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(min(count, len(jobs)), init_worker, (self.word, self.char, self.type_info, self.reorder_members))
+        try:
+            results = pool.map(parse_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+            
+        units = []
+        for data in results:
+            unit = serial.loads(data)
+            self.log.warnings+=unit.warnings
+            self.log.errors+=unit.errors
+            units.append((unit, data))
+            
+        return units
+    
+    def link(self):
+        """Adds the imports of every module in dependency order, then binds the modules that are not
+        bound yet.  The string tables of the modules are pooled, so each string is stored once."""
+        for unit in dependency_order(self.units):
+            for name in unit.imports:
+                if name in self.units:
+                    unit.module.addImport(self.units[name].module)
+                else:
+                    self.log.error(unit.module.loc or err.location(unit.filename, 1, 1), 
+                                   "Module '%s' imports '%s', which is not part of the build." % (unit.name, name))
+                    
+            if not unit.bound:
+                unit.module.bindMembers(self.log)
+                unit.bound = True
+                
+        self.strings = typesys.strings.link([unit.module.string_table for unit in dependency_order(self.units)])
+        
+    def build(self, paths):
+        "Parses, links and binds every source file under paths.  Returns the dictionary of module name to Unit."
+        typesys.type.setMachineSizes(self.word, self.char)
+        typesys.builtins.setTypeInfoMode(self.type_info)
+        typesys.builtins.initialize()
+        typesys.struct.setMemberReordering(self.reorder_members)
+        
+        for unit in self.parse(find_sources(paths)):
+            if unit.name in self.units:
+                self.log.warning(err.location(unit.filename, 1, 1), 
+                                 "Module '%s' is defined again, replacing the one from '%s'." % (unit.name, self.units[unit.name].filename))
+            self.units[unit.name] = unit
+            
+        self.link()
+        return self.units
+    
+def new(log, jobs=1, word=typesys.type.UINT32, char=typesys.type.UINT8, parse_cache=None,
+        type_info=typesys.builtins.TYPE_INFO_ALL, reorder_members=False):
+    return Driver(log, jobs, word, char, parse_cache, type_info, reorder_members)
+
+def main(argv):
+    "Runs the front end from the command line.  Returns the process exit code."
+    parser = optparse.OptionParser(usage="%prog [options] file_or_directory ...")
+    parser.add_option("-j", "--jobs", type="int", default=1,
+                      help="number of worker processes to parse with, 0 for one per cpu [default: %default]")
+    parser.add_option("--word-type", default="uint32_t", help="type of a machine word [default: %default]")
+    parser.add_option("--char-type", default="uint8_t", help="type of a character [default: %default]")
+    parser.add_option("--type-info", type="choice", default=typesys.builtins.TYPE_INFO_ALL,
+                      choices=[typesys.builtins.TYPE_INFO_ALL, typesys.builtins.TYPE_INFO_REACHABLE],
+                      help="generate type info for all types, or only the reachable ones [default: %default]")
+    parser.add_option("--reorder-members", action="store_true", default=False, 
+                      help="lay out struct fields by decreasing alignment to leave less padding")
+    parser.add_option("--cache-dir", default=cache.default_path(), 
+                      help="directory of the parse cache [default: %default]")
+    parser.add_option("--cache-size", type="int", default=cache.DEFAULT_SIZE/(1024*1024),
+                      help="size limit of the parse cache in megabytes [default: %default]")
+    parser.add_option("--no-cache", action="store_true", default=False, help="parse every file, don't use the parse cache")
+    parser.add_option("--clear-cache", action="store_true", default=False, help="empty the parse cache first")
+    parser.add_option("--template-cache-dir", default=None, 
+                      help="directory to cache the parsed backend templates in, e.g. %s [default: not cached on disk]" % transform_cache.default_path())
+    parser.add_option("--stats", action="store_true", default=False, help="print parse cache and string table statistics")
+    options, args = parser.parse_args(argv)
+    
+    if len(args)==0 and not options.clear_cache:
+        parser.error("no source files given")
+        
+    parse_cache = None
+    if not options.no_cache or options.clear_cache:
+        parse_cache = cache.new(options.cache_dir, options.cache_size*1024*1024)
+        if options.clear_cache:
+            parse_cache.clear()
+        if options.no_cache:
+            parse_cache = None
+            
+    if len(args)==0:
+        return 0
+        
+    transform_cache.setCachePath(options.template_cache_dir)
+    
+    log = err.new(sys.stderr)
+    d = new(log, options.jobs, typesys.type.type_map[options.word_type], typesys.type.type_map[options.char_type], parse_cache,
+            options.type_info, options.reorder_members)
+    d.build(args)
+    
+    if options.stats:
+        if parse_cache!=None:
+            print >>sys.stderr, "cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions, %(entries)d entries, %(size)d bytes" % parse_cache.getStats()
+        stats = d.strings.getStats()
+        stats["hit_rate"]*=100
+        print >>sys.stderr, "strings: %(entries)d entries, %(bytes)d bytes, %(stored)d bytes stored, %(lookups)d lookups, %(hit_rate).1f%% hit rate" % stats
+        
+    return 1 if log.errors else 0
@@ -0,0 +1,147 @@
+"""An on-disk cache of parsed source files.  Each entry holds a serialized Unit and is keyed by a
+hash of the file's name and content, the compiler version, and the machine sizes, type info
+mode and member reordering it was parsed for, so a change to any of those misses the cache.  The cache is bounded in
+bytes and the least recently used entries are evicted first.  The modification time of an entry
+is its last use."""
+
+import hashlib
+import os
+import tempfile
+
+import typesys.builtins
+import typesys.struct
+import typesys.type
+
+# The default size limit, in bytes.
+DEFAULT_SIZE = 64*1024*1024
+
+SUFFIX = ".unit"
+
+def default_path():
+    "Returns the cache directory used when none is given."
+    return os.path.join(os.path.expanduser("~"), ".metalc", "cache")
+
+def make_key(filename, text, version):
+    """Returns the cache key of the source file filename holding text.  The file name is part of
+    the key because the parsed locations and the module name are taken from it."""
+    h = hashlib.sha1()
+    h.update("%s\0%s\0%s\0%s\0%s\0%s\0" % (version, typesys.type.WORD_TYPENAME, typesys.type.CHARACTER_TYPENAME,
+                                           typesys.builtins.type_info_mode, typesys.struct.member_reordering,
+                                           os.path.abspath(filename)))
+    h.update(text)
+    return h.hexdigest()
+
+class Cache:
+    "A directory of cached units."
+    def __init__(self, path, max_size=DEFAULT_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Dictionary of key to [last use, size in bytes] for every entry in the directory.
+        self.entries = {}
+        self.size = 0
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        for name in os.listdir(path):
+            if not name.endswith(SUFFIX):
+                continue
+
+            try:
+                st = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+
+            self.entries[name[:-len(SUFFIX)]] = [st.st_mtime, st.st_size]
+            self.size+=st.st_size
+
+    def entryPath(self, key):
+        return os.path.join(self.path, key+SUFFIX)
+
+    def get(self, key):
+        "Returns the data cached under key, or None."
+        if key not in self.entries:
+            self.misses+=1
+            return None
+
+        try:
+            f = open(self.entryPath(key), "rb")
+            data = f.read()
+            f.close()
+            os.utime(self.entryPath(key), None)
+        except (IOError, OSError):
+            # Removed by somebody else, maybe another compiler sharing the cache.
+            self.forget(key)
+            self.misses+=1
+            return None
+
+        self.entries[key][0] = os.stat(self.entryPath(key)).st_mtime
+        self.hits+=1
+        return data
+
+    def put(self, key, data):
+        "Caches data under key, then evicts the least recently used entries until the cache fits."
+        if len(data)>self.max_size:
+            return
+
+        # Write to a temporary file and rename it so readers never see a partial entry.
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+        f = os.fdopen(fd, "wb")
+        f.write(data)
+        f.close()
+
+        self.forget(key)
+        os.rename(tmp, self.entryPath(key))
+        self.entries[key] = [os.stat(self.entryPath(key)).st_mtime, len(data)]
+        self.size+=len(data)
+
+        self.evict(key)
+
+    def forget(self, key):
+        "Drops key from the entry table."
+        if key in self.entries:
+            self.size-=self.entries[key][1]
+            del self.entries[key]
+
+    def remove(self, key):
+        "Deletes the entry for key."
+        self.forget(key)
+        try:
+            os.remove(self.entryPath(key))
+        except OSError:
+            pass
+
+    def evict(self, keep=None):
+        "Removes the least recently used entries, except keep, until the cache fits in max_size."
+        if self.size<=self.max_size:
+            return
+
+        for last_use, key in sorted([(v[0], k) for k, v in self.entries.items()]):
+            if self.size<=self.max_size:
+                break
+            if key==keep:
+                continue
+
+            self.remove(key)
+            self.evictions+=1
+
+    def clear(self):
+        "Deletes every entry."
+        for key in self.entries.keys():
+            self.remove(key)
+
+    def getStats(self):
+        "Returns a dictionary of the cache statistics."
+        return { "hits"      : self.hits,
+                 "misses"    : self.misses,
+                 "evictions" : self.evictions,
+                 "entries"   : len(self.entries),
+                 "size"      : self.size }
+
+def new(path=None, max_size=DEFAULT_SIZE):
+    return Cache(path or default_path(), max_size)
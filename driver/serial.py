@@ -0,0 +1,46 @@
+"""Serializes parsed modules so they can be handed between processes.  The builtin types are
+shared singletons that are compared by identity, so they are written as references by name and
+bound to the builtins of the loading process.  Interned primitive types are written as their
+intern key and interned again when loaded."""
+
+import cPickle
+import cStringIO
+
+import typesys.builtins
+import typesys.type
+
+def builtin_objects():
+    "Returns a dictionary of name to builtin singleton."
+    return { "NULL_TYPE"        : typesys.builtins.NULL_TYPE,
+             "STRING_STRUCT"    : typesys.builtins.STRING_STRUCT,
+             "TYPE_STRUCT"      : typesys.builtins.TYPE_STRUCT,
+             "TYPE_NODE_STRUCT" : typesys.builtins.TYPE_NODE_STRUCT }
+
+def dumps(obj):
+    "Returns obj serialized to a string."
+    ids = {}
+    for name, value in builtin_objects().items():
+        if value!=None:
+            ids[id(value)] = name
+            
+    for key, value in typesys.type.interned_types.items():
+        ids[id(value)] = "type:%d:%d:%d:%d" % key
+    
+    f = cStringIO.StringIO()
+    p = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+    p.persistent_id = lambda o: ids.get(id(o), None)
+    p.dump(obj)
+    return f.getvalue()
+
+def loads(data):
+    "Returns the object serialized in data, bound to this process's builtins."
+    builtins = builtin_objects()
+    def persistent_load(name):
+        if name.startswith("type:"):
+            type_id, is_const, is_ref, elem_count = [int(v) for v in name.split(":")[1:]]
+            return typesys.type.intern(type_id, bool(is_const), bool(is_ref), elem_count)
+        return builtins[name]
+    
+    u = cPickle.Unpickler(cStringIO.StringIO(data))
+    u.persistent_load = persistent_load
+    return u.load()
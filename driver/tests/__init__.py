@@ -0,0 +1,2 @@
+from test_driver import *
+from test_cache import *
@@ -0,0 +1,107 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import err
+import typesys.builtins
+import typesys.struct
+import typesys.type
+
+import driver
+from driver import cache
+from mparser import incremental
+
+sources = { "a.metal" : "import b\nconst uint32_t A := 1;\n",
+            "b.metal" : "const uint32_t B := 2+3;\n" }
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.log = err.new(sys.stderr)
+        self.log.setIgnoreLevel(err.TRACE)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+        self.path = tempfile.mkdtemp()
+        self.src = os.path.join(self.path, "src")
+        os.mkdir(self.src)
+        for name in sources:
+            self.write(name, sources[name])
+            
+        self.cache_path = os.path.join(self.path, "cache")
+            
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        
+    def write(self, name, text):
+        f = open(os.path.join(self.src, name), "w")
+        f.write(text)
+        f.close()
+        
+    def build(self, jobs=1, parse_cache=None):
+        parse_cache = parse_cache or cache.new(self.cache_path)
+        return driver.new(self.log, jobs, parse_cache=parse_cache).build([self.src]), parse_cache
+        
+    def testWarmBuild(self):
+        "A warm build loads every unchanged file from the cache without parsing it."
+        units, c = self.build()
+        self.assertEqual(c.getStats()["misses"], 2)
+        self.assertEqual(c.getStats()["entries"], 2)
+        
+        parse = incremental.parse
+        def fail(*args, **kwargs):
+            self.fail("parsed a cached file")
+        incremental.parse = fail
+        try:
+            units, c = self.build()
+        finally:
+            incremental.parse = parse
+            
+        self.assertEqual(c.getStats()["hits"], 2)
+        self.assertTrue(units["a"].module.imports["b"] is units["b"].module)
+        self.assertTrue(units["b"].module.hasConstant("B"))
+        
+    def testReorderKey(self):
+        "Units parsed with and without member reordering are cached apart."
+        key = cache.make_key("a.metal", sources["a.metal"], driver.VERSION)
+        typesys.struct.setMemberReordering(True)
+        try:
+            self.assertNotEqual(cache.make_key("a.metal", sources["a.metal"], driver.VERSION), key)
+        finally:
+            typesys.struct.setMemberReordering(False)
+            
+    def testChangedFile(self):
+        "Changing a file, or the machine sizes, misses the cache."
+        self.build(jobs=2)
+        self.write("b.metal", "const uint32_t B := 4;\n")
+        units, c = self.build(jobs=2)
+        self.assertEqual(c.getStats()["hits"], 1)
+        self.assertEqual(c.getStats()["misses"], 1)
+        
+        c = cache.new(self.cache_path)
+        driver.new(self.log, word=typesys.type.UINT64, parse_cache=c).build([self.src])
+        self.assertEqual(c.getStats()["misses"], 2)
+        
+    def testEviction(self):
+        "The least recently used entries are evicted once the cache is full."
+        c = cache.new(self.cache_path, 250)
+        c.put("a", "a"*100)
+        c.put("b", "b"*100)
+        for key, when in [("a", 1), ("b", 2)]:
+            os.utime(c.entryPath(key), (when, when))
+            c.entries[key][0] = when
+        self.assertEqual(c.get("a"), "a"*100)
+        
+        c.put("c", "c"*100)
+        self.assertEqual(c.getStats()["evictions"], 1)
+        self.assertEqual(c.get("b"), None)
+        self.assertFalse(os.path.exists(c.entryPath("b")))
+        self.assertEqual(cache.new(self.cache_path, 250).getStats()["size"], 200)
+        
+    def testClear(self):
+        "Clearing the cache from the command line empties it."
+        self.build()
+        self.assertEqual(driver.main(["--cache-dir", self.cache_path, "--clear-cache"]), 0)
+        self.assertEqual(cache.new(self.cache_path).getStats()["entries"], 0)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import err
+import expr
+import typesys.builtins
+import typesys.struct
+import typesys.type
+
+import driver
+from driver import serial
+
+sources = { "a.metal" : "import b\nconst uint32_t A := 1;\n",
+            "b.metal" : "const uint32_t B := 2+3;\nconst string_t NAME := 'b';\n",
+            "c.metal" : "from lib import a, b\nconst uint8_t C := 7;\n" }
+
+class TestDriver(unittest.TestCase):
+    def setUp(self):
+        self.log = err.new(sys.stderr)
+        self.log.setIgnoreLevel(err.TRACE)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+        self.path = tempfile.mkdtemp()
+        for name in sources:
+            f = open(os.path.join(self.path, name), "w")
+            f.write(sources[name])
+            f.close()
+            
+    def tearDown(self):
+        typesys.struct.setMemberReordering(False)
+        shutil.rmtree(self.path)
+        
+    def checkUnits(self, units):
+        self.assertEqual(sorted(units.keys()), ["a", "b", "c"])
+        self.assertEqual(units["a"].imports, ["b"])
+        self.assertEqual(units["c"].imports, ["a", "b"])
+        
+        self.assertTrue(units["a"].module.imports["b"] is units["b"].module)
+        self.assertTrue(units["c"].module.imports["a"] is units["a"].module)
+        self.assertTrue(units["b"].module.hasConstant("B"))
+        self.assertTrue(units["b"].module.hasConstant("NAME"))
+        self.assertTrue(units["c"].module.hasConstant("C"))
+        
+        for unit in units.values():
+            self.assertTrue(unit.bound)
+        
+    def testSerialBuild(self):
+        "Build the modules in this process."
+        units = driver.new(self.log).build([self.path])
+        self.checkUnits(units)
+        
+    def testParallelBuild(self):
+        "Build the modules in a pool of worker processes."
+        units = driver.new(self.log, jobs=2).build([self.path])
+        self.checkUnits(units)
+        
+        # Expressions that came back from the workers still use this process's builtins.
+        initializer = units["b"].module.constants["B"].initializer
+        self.assertTrue(initializer.type is typesys.builtins.NULL_TYPE)
+        self.assertEqual(initializer.getType().name, "uint8_t")
+        
+    def testWorkerReorder(self):
+        "Worker processes are set up to reorder struct fields when the build does."
+        driver.init_worker(typesys.type.UINT32, typesys.type.UINT8, typesys.builtins.TYPE_INFO_ALL, True)
+        self.assertTrue(typesys.struct.member_reordering)
+        driver.init_worker(typesys.type.UINT32, typesys.type.UINT8, typesys.builtins.TYPE_INFO_ALL, False)
+        self.assertFalse(typesys.struct.member_reordering)
+        
+    def testDependencyOrder(self):
+        "Modules come after the modules they import."
+        units = driver.new(self.log).build([self.path])
+        order = [unit.name for unit in driver.dependency_order(units)]
+        self.assertEqual(order, ["b", "a", "c"])
+        
+    def testSerialRoundTrip(self):
+        "Builtin singletons keep their identity through serialization."
+        loc = err.location("unittest::testSerialRoundTrip", 1, 1)
+        e = expr.Binary("+", loc, (expr.newInt(loc, 1), expr.newInt(loc, 2)))
+        t = typesys.type.newStruct(typesys.builtins.STRING_STRUCT, loc)
+        
+        e2, t2 = serial.loads(serial.dumps((e, t)))
+        self.assertTrue(e2.type is typesys.builtins.NULL_TYPE)
+        self.assertTrue(t2.struct_def is typesys.builtins.STRING_STRUCT)
+        self.assertEqual(e2.children[1].value, 2)
+        self.assertTrue(e2.children[1].type is expr.newInt(loc, 2).type)
+        
+    def testStringPool(self):
+        "The strings of every module are pooled at link time, each stored by one module."
+        d = driver.new(self.log)
+        d.build([self.path])
+        self.assertTrue("b" in d.strings)
+        self.assertEqual(d.strings.getStats()["entries"], 
+                         len(set([s for unit in d.units.values() for s in unit.module.string_table])))
+        
+        for unit in d.units.values():
+            table = unit.module.string_table
+            self.assertTrue(table.pool is d.strings)
+            for idx, s in enumerate(table):
+                owner, offset = table.getLinkedPlacement(idx)
+                self.assertEqual(d.strings[owner][offset:], s)
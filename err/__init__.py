@@ -38,6 +38,56 @@ class location:
     def __repr__(self):
         return "%s:%s" % (self.line, self.col)
 
+class relative_location(location):
+    """A location whose line is kept as an offset from an origin, anything with a file and a line.
+    Moving the origin moves every location made relative to it, without visiting them."""
+    def __init__(self, origin, line, col):
+        self.file   = origin.file
+        self.origin = origin
+        self.offset = line-origin.line
+        self.col    = col
+        
+    line = property(lambda self: self.origin.line+self.offset)
+
+#  Locations can be packed into a single integer holding a file id, the line and the column, for
+# things like expression nodes that are made by the million.  The file ids index this table and
+# are only meaningful inside the process that made them.
+LINE_BITS = 24
+COL_BITS  = 20
+
+files = []
+file_ids = {}
+
+def pack_location(loc):
+    """Returns loc packed into an integer.  Locations that don't fit, relative locations, so they
+    still follow their origin, and None, are returned as they are."""
+    if loc==None or isinstance(loc, relative_location) or loc.line>=(1<<LINE_BITS) or loc.col>=(1<<COL_BITS) or loc.line<0 or loc.col<0:
+        return loc
+    
+    file_id = file_ids.get(loc.file, None)
+    if file_id==None:
+        file_id = file_ids[loc.file] = len(files)
+        files.append(loc.file)
+        
+    return (((file_id<<LINE_BITS)|loc.line)<<COL_BITS)|loc.col
+
+def expand_location(packed):
+    "Returns the location for a value returned by pack_location."
+    if type(packed)!=int and type(packed)!=long:
+        return packed
+    
+    col = packed&((1<<COL_BITS)-1)
+    packed>>=COL_BITS
+    return location(files[packed>>LINE_BITS], packed&((1<<LINE_BITS)-1), col)
+
+def shift_location(packed, lines):
+    """Returns a value returned by pack_location moved by lines lines.  Locations that weren't packed
+    are returned as they are, whoever made them is expected to move them."""
+    if type(packed)!=int and type(packed)!=long:
+        return packed
+    
+    return packed+(lines<<COL_BITS)
+
 class ErrorLog:
     "An error logging object."
     def __init__(self, err_file):
@@ -84,7 +134,11 @@ class ErrorLog:
         
     def trace(self, loc, msg):
     	if self.ignore_level>=TRACE: return        
-        self.write("[TRACE   ]", "@%s:%s:%s" % (loc.file, loc, msg))
+    	
+    	if loc!=None:
+            self.write("[TRACE   ]", "@%s:%s:%s" % (loc.file, loc, msg))
+        else:
+            self.write("[TRACE   ]", "%s" % (msg))
         
     def warning(self, loc, msg):
     	self.warnings+=1
@@ -123,4 +177,4 @@ class ErrorLog:
 
 def new(err_file):
 	return ErrorLog(err_file)
-	            
\ No newline at end of file
+	            
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 import types
 
+import err
 import tests
 import typesys.builtins
 
@@ -9,12 +10,42 @@ class Expr(object):
     """Root expression class.  We know that every expression is going to have an op type, 
     at least one input and at least one output.  Expressions generally resolve input expressions from left to right.
     Child nodes are expected to be expressions, with the singular exception of leaf nodes.  These expect their values
-    to be dictionaries containing {value_object, type}."""
+    to be dictionaries containing {value_object, type}.
+    
+    Expressions are made in large numbers, so every node class declares __slots__ and the location
+    is kept packed into an integer, see err.pack_location.  It is expanded when loc is read."""
+    __slots__ = ("op", "packed_loc", "type")
+    
     def __init__(self, op, loc):
         self.op=op
         self.loc=loc
         self.type = typesys.builtins.NULL_TYPE
         
+    def getLoc(self):
+        return err.expand_location(self.packed_loc)
+    
+    def setLoc(self, loc):
+        self.packed_loc = err.pack_location(loc)
+        
+    loc = property(getLoc, setLoc)
+    
+    def __getstate__(self):
+        "Packed locations only mean something in this process, so they are pickled expanded."
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+                    
+        state["packed_loc"] = self.loc
+        return state
+    
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+            
+        self.loc = state["packed_loc"]
+        
     def resolve(self, scope, log):
         """Intended to resolve any outstanding references that the expression may have.  The resolve step is not intended
         to do error checking, except by failures in the resolve process of itself."""
@@ -55,6 +86,8 @@ class Expr(object):
         
     
 class Leaf(Expr):
+    __slots__ = ("value",)
+    
     def __init__(self, op, loc, value):
         Expr.__init__(self, op, loc)
         self.value=value
@@ -67,6 +100,8 @@ class Leaf(Expr):
         return 0
        
 class Binary(Expr):
+    __slots__ = ("children",)
+    
     def __init__(self, op, loc, children):
         Expr.__init__(self, op, loc)
         
@@ -84,6 +119,8 @@ class Binary(Expr):
         return 2
        
 class Unary(Expr):
+    __slots__ = ("child",)
+    
     def __init__(self, op, loc, child):
         Expr.__init__(self, op, loc)
         self.child=child
@@ -92,6 +129,8 @@ class Unary(Expr):
         return self.child.getType().isConst()
         
 class StructConstructor(Unary):
+    __slots__ = ("struct_def",)
+    
     def __init__(self, loc, struct_def, initializer):
         Unary.__init__(self,"struct_construct", loc, initializer);
         
@@ -160,6 +199,8 @@ class StructConstructor(Unary):
             
                       
 class PostFix(Expr):
+    __slots__ = ("child",)
+    
     def __init__(self, op, loc, child):
         Expr.__init__(self, op, loc)
         self.child=child
@@ -173,6 +214,8 @@ class PostFix(Expr):
        
 class Index(Expr):
     "Performs the indexing operation."
+    __slots__ = ("src", "idx")
+    
     def __init__(self, loc, source, subscript):
         Expr.__init__(self, "index", loc)
         self.src = source
@@ -195,6 +238,8 @@ class Index(Expr):
         
 class IfExpr(Expr):
     "Performs the value if cond else other_value operation."
+    __slots__ = ("cond", "true_value", "false_value")
+    
     def __init__(self, loc, cond, true_value, false_value):
         Expr.__init__(self, "if", loc)
         self.cond = cond
@@ -229,6 +274,8 @@ class IfExpr(Expr):
 class InitializerList(Leaf):
     """The initializer list expects one or more expressions for use in initializing something.  It is a leaf because it provides
     no operation on the expressions other than grouping.  An initializer list essentially becomes an anonymous type."""  
+    __slots__ = ("num_outputs",)
+    
     def __init__(self, loc, init_leaf, num_elems):
         Leaf.__init__(self, "initializer_list", loc, init_leaf)        
         self.num_outputs = num_elems
@@ -240,7 +287,24 @@ class InitializerList(Leaf):
         return self.value[idx].getType() 
     
 
+class Ident(Leaf):
+    "A reference to a named value.  The value of the leaf is the name."
+    __slots__ = ()
+    
+    def __init__(self, loc, name):
+        Leaf.__init__(self, "ident", loc, name)
+        
+    def resolveType(self):
+        "The type is not known until the name is bound to a definition."
+        pass
+        
+    def isConst(self):
+        "An identifier is only constant once it has been replaced by the constant's value."
+        return False
+
 class LiteralLeaf(Leaf):
+    __slots__ = ()
+    
     def __init__(self, loc, value, type):
         Leaf.__init__(self, "lit", loc, value)
         self.type = type
@@ -250,40 +314,44 @@ class LiteralLeaf(Leaf):
 
 def newString(loc, value):
     "Constructs a new string leaf value."
-    return LiteralLeaf(loc, value, typesys.type.new("string_t", loc, is_const=True))      
+    return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.STRING, is_const=True))      
         
 def newInt(loc, value):
     "Constructs a new integer leaf value."
     if value<0 and value>-257:
-        return LiteralLeaf(loc, value, typesys.type.new("sint8_t", loc, is_const=True))   
+        return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.SINT8, is_const=True))   
     elif value<256:
-        return LiteralLeaf(loc, value, typesys.type.new("uint8_t", loc, is_const=True))        
+        return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.UINT8, is_const=True))        
        
     if value<0 and value>-65537:
-        return LiteralLeaf(loc, value, typesys.type.new("sint16_t", loc, is_const=True))   
+        return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.SINT16, is_const=True))   
     elif value<65536:
-        return LiteralLeaf(loc, value, typesys.type.new("uint16_t", loc, is_const=True)) 
+        return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.UINT16, is_const=True)) 
 
     if value<0 and value>-4294967297:
-        return LiteralLeaf(loc, value, typesys.type.new("sint32_t", loc, is_const=True))   
+        return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.SINT32, is_const=True))   
     elif value<4294967296:
-        return LiteralLeaf(loc, value, typesys.type.new("uint32_t", loc, is_const=True)) 
+        return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.UINT32, is_const=True)) 
    
     if value<0:
-        return LiteralLeaf(loc, value, typesys.type.new("sint64_t", loc, is_const=True))   
+        return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.SINT64, is_const=True))   
     else:
-        return LiteralLeaf(loc, value, typesys.type.new("uint64_t", loc, is_const=True))
+        return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.UINT64, is_const=True))
     
 def newFloat(loc, value):
     "Constructs a new floating point leaf value."
-    return LiteralLeaf(loc, value, typesys.type.new("float_t", loc, is_const=True))
+    return LiteralLeaf(loc, value, typesys.type.intern(typesys.type.FLOAT64, is_const=True))
+
+def newIdent(loc, name):
+    "Constructs a new identifier leaf."
+    return Ident(loc, name)
 
 def newBool(loc, value):
     "Constructs a new boolean leaf value."
     if type(value) in types.StringTypes:
         value=True if value=="true" else False
         
-    return LiteralLeaf(loc, True if value else False, typesys.type.new("bool_t", loc, is_const=True))
+    return LiteralLeaf(loc, True if value else False, typesys.type.intern(typesys.type.BOOL, is_const=True))
        
      
    
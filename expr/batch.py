@@ -0,0 +1,214 @@
+"""Folds large initializer lists in bulk.  Initializer lists whose elements are all numbers of
+one type, or of types promotable to one type, are packed into a buffer of fixed-width values
+which the generator can emit as a single array constant.  Elements that are binary operations on
+literals are folded a whole group at a time with NumPy when it's installed, and one at a time
+with expr.fold when it isn't."""
+
+from __future__ import with_statement
+
+import struct
+
+import typesys.type
+
+import expr
+import fold
+import solver
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Dictionary of type id to the struct format character of its values.
+format_chars = { typesys.type.BOOL    : "?",
+                 typesys.type.UINT8   : "B",
+                 typesys.type.SINT8   : "b",
+                 typesys.type.UINT16  : "H",
+                 typesys.type.SINT16  : "h",
+                 typesys.type.UINT32  : "I",
+                 typesys.type.SINT32  : "i",
+                 typesys.type.UINT64  : "Q",
+                 typesys.type.SINT64  : "q",
+                 typesys.type.FLOAT32 : "f",
+                 typesys.type.FLOAT64 : "d" }
+
+# Dictionary of type id to the NumPy dtype of its values.
+dtypes = { typesys.type.BOOL    : "bool",
+           typesys.type.UINT8   : "uint8",
+           typesys.type.SINT8   : "int8",
+           typesys.type.UINT16  : "uint16",
+           typesys.type.SINT16  : "int16",
+           typesys.type.UINT32  : "uint32",
+           typesys.type.SINT32  : "int32",
+           typesys.type.UINT64  : "uint64",
+           typesys.type.SINT64  : "int64",
+           typesys.type.FLOAT32 : "float32",
+           typesys.type.FLOAT64 : "float64" }
+
+class PackedArray:
+    "The values of an initializer list packed in machine byte order."
+    def __init__(self, type_id, count, data):
+        # The type id of the elements
+        self.type_id = type_id
+
+        # The number of elements
+        self.count = count
+
+        # The packed values, count elements of id_to_size_map[type_id] bytes each.
+        self.data = data
+
+    def getValues(self):
+        "Returns a list of the values."
+        if numpy!=None:
+            return numpy.frombuffer(self.data, dtype=dtypes[self.type_id]).tolist()
+
+        return list(struct.unpack("=%d%s" % (self.count, format_chars[self.type_id]), self.data))
+
+def sdiv(left, right):
+    "Signed division truncating toward zero, on NumPy arrays."
+    q = numpy.floor_divide(left, right)
+    return q+(((left%right)!=0) & ((left<0)!=(right<0)))
+
+def vector_ops(op, cls):
+    "Returns the NumPy function computing op for the type class cls, or None."
+    if cls==fold.SINT and op=="/":
+        return sdiv
+
+    return { ("+", fold.UINT)  : numpy.add,
+             ("+", fold.SINT)  : numpy.add,
+             ("+", fold.FLOAT) : numpy.add,
+             ("-", fold.UINT)  : numpy.subtract,
+             ("-", fold.SINT)  : numpy.subtract,
+             ("-", fold.FLOAT) : numpy.subtract,
+             ("*", fold.UINT)  : numpy.multiply,
+             ("*", fold.SINT)  : numpy.multiply,
+             ("*", fold.FLOAT) : numpy.multiply,
+             ("/", fold.UINT)  : numpy.floor_divide,
+             ("/", fold.FLOAT) : numpy.true_divide,
+             ("%", fold.UINT)  : numpy.remainder,
+             ("%", fold.SINT)  : numpy.fmod,
+             ("%", fold.FLOAT) : numpy.fmod,
+             ("&", fold.UINT)  : numpy.bitwise_and,
+             ("&", fold.SINT)  : numpy.bitwise_and,
+             ("&", fold.BOOL)  : numpy.logical_and,
+             ("|", fold.UINT)  : numpy.bitwise_or,
+             ("|", fold.SINT)  : numpy.bitwise_or,
+             ("|", fold.BOOL)  : numpy.logical_or,
+             ("^", fold.UINT)  : numpy.bitwise_xor,
+             ("^", fold.SINT)  : numpy.bitwise_xor,
+             ("^", fold.BOOL)  : numpy.logical_xor }.get((op, cls), None)
+
+def fold_group(op, left_type, right_type, nodes):
+    """Folds the binary nodes, which all have literal inputs of the types left_type and right_type.
+    Returns a list of literal leaves, or None if the group can't be folded together."""
+    t = fold.result_type(left_type, right_type)
+    cls = fold.type_class(t)
+    fn = vector_ops(op, cls) if t.id in dtypes else None
+    if fn==None or fold.type_class(left_type)==None or fold.type_class(right_type)==None:
+        return None
+    
+    # Both inputs must fit the result type, or wrapping them first would change the result.
+    for input_type in (left_type, right_type):
+        if input_type.id!=t.id and not input_type.isPromotable(t):
+            return None
+
+    dtype = dtypes[t.id]
+    left = numpy.array([n.children[0].value for n in nodes], dtype=dtype)
+    right = numpy.array([n.children[1].value for n in nodes], dtype=dtype)
+    if op in ("/", "%") and cls!=fold.FLOAT and not right.all():
+        return None
+
+    with numpy.errstate(all="ignore"):
+        values = fn(left, right).astype(dtype)
+
+    result_type = typesys.type.intern(t.id, is_const=True)
+    return [expr.LiteralLeaf(n.loc, v, result_type) for n, v in zip(nodes, values.tolist())]
+
+def fold_element(e, scope):
+    "Returns a literal leaf with the value of the element, or the element itself if it isn't constant."
+    return solver.evaluate(scope, e, set()) or e
+
+def fold_elements(elems, scope=None):
+    """Returns a new list of the elements with the constant ones folded into literals.  With NumPy,
+    binary operations on literals are grouped by op and input types and each group is folded at
+    once.  Other elements are folded one at a time.  The elements themselves are left alone."""
+    elems = list(elems)
+    groups = {}
+    for idx, e in enumerate(elems):
+        if isinstance(e, expr.LiteralLeaf):
+            continue
+
+        if numpy!=None and isinstance(e, expr.Binary) and isinstance(e.children[0], expr.LiteralLeaf) and \
+           isinstance(e.children[1], expr.LiteralLeaf):
+            key = (e.op, e.children[0].type, e.children[1].type)
+            groups.setdefault(key, []).append(idx)
+        else:
+            elems[idx] = fold_element(e, scope)
+
+    for (op, left_type, right_type), indices in groups.items():
+        folded = fold_group(op, left_type, right_type, [elems[idx] for idx in indices])
+        if folded==None:
+            folded = [fold_element(elems[idx], scope) for idx in indices]
+
+        for idx, e in zip(indices, folded):
+            elems[idx] = e
+
+    return elems
+
+def fits(elems, t, type_id):
+    "Returns True if the values of the integer elements of the type t are all in the range of type_id."
+    if t.id not in fold.UNSIGNED+fold.SIGNED or type_id not in fold.UNSIGNED+fold.SIGNED:
+        return False
+
+    for e in elems:
+        if e.type is t and fold.wrap(e.value, type_id)!=e.value:
+            return False
+
+    return True
+
+def element_type(elems, type_id=None):
+    """Returns the type id all the literal elements can be stored as, or None if some element is
+    not a number literal or the elements don't share a type.  If type_id is given the elements
+    must be storable as that type: their type is promotable to it, or they are integers in its
+    range, since folded integers have at least the promoted width."""
+    # Literal types are interned, so there are few distinct ones however long the list is.
+    distinct = {}
+    for e in elems:
+        if not isinstance(e, expr.LiteralLeaf):
+            return None
+        distinct[id(e.type)] = e.type
+
+    common = typesys.type.intern(type_id) if type_id!=None else None
+    for t in distinct.values():
+        if t.id not in format_chars:
+            return None
+        if common==None or (type_id==None and common.isPromotable(t)):
+            common = t
+
+    if common==None or common.id not in format_chars:
+        return None
+
+    for t in distinct.values():
+        if t.id!=common.id and not t.isPromotable(common) and not (type_id!=None and fits(elems, t, type_id)):
+            return None
+
+    return common.id
+
+def pack(elems, type_id):
+    "Returns the values of the literal elements packed as type_id."
+    values = [e.value for e in elems]
+    if numpy!=None:
+        return numpy.array(values, dtype=dtypes[type_id]).tostring()
+
+    return struct.pack("=%d%s" % (len(values), format_chars[type_id]), *values)
+
+def pack_initializer_list(init_list, scope=None, type_id=None):
+    """Folds the elements of an initializer list.  Returns a PackedArray of their values if they
+    are all numbers that share a type, or that can all be stored as type_id when it is given,
+    otherwise None.  The list itself is left alone."""
+    elems = fold_elements(init_list.value, scope)
+    type_id = element_type(elems, type_id)
+    if type_id==None:
+        return None
+
+    return PackedArray(type_id, len(elems), pack(elems, type_id))
@@ -0,0 +1,152 @@
+"""Folds operations on constant values the way the target machine performs them.  Integers are
+promoted like C's and wrap to the width of the result type, signed division truncates toward zero, float32 results are rounded
+to single precision and '^' is exclusive or.  The operators are looked up in a table keyed on
+(op, type class), so adding an operation for a class of types is a single entry."""
+
+import exceptions
+import math
+import operator
+import struct
+
+import typesys.type
+
+# Type classes
+UINT   = "uint"
+SINT   = "sint"
+FLOAT  = "float"
+BOOL   = "bool"
+STRING = "string"
+
+UNSIGNED = [typesys.type.UINT8, typesys.type.UINT16, typesys.type.UINT32, typesys.type.UINT64]
+SIGNED   = [typesys.type.SINT8, typesys.type.SINT16, typesys.type.SINT32, typesys.type.SINT64]
+
+def type_class(t):
+    "Returns the type class of the typesys type t, or None if its values can't be folded."
+    if t.isString(): return STRING
+    if t.id in UNSIGNED: return UINT
+    if t.id in SIGNED: return SINT
+    if t.isFloat(): return FLOAT
+    if t.id==typesys.type.BOOL: return BOOL
+    return None
+
+def wrap(value, type_id):
+    "Returns value truncated to the width of the type type_id."
+    if type_id in UNSIGNED:
+        return value & ((1<<(typesys.type.id_to_size_map[type_id]*8))-1)
+
+    if type_id in SIGNED:
+        bits = typesys.type.id_to_size_map[type_id]*8
+        value &= (1<<bits)-1
+        return value-(1<<bits) if value>=(1<<(bits-1)) else value
+
+    if type_id==typesys.type.FLOAT32:
+        try:
+            return struct.unpack("f", struct.pack("f", value))[0]
+        except OverflowError:
+            return math.copysign(float("inf"), value)
+
+    if type_id==typesys.type.FLOAT64:
+        return float(value)
+
+    return value
+
+def sdiv(left, right):
+    "Signed division, truncating toward zero."
+    q = abs(left)//abs(right)
+    return -q if (left<0)!=(right<0) else q
+
+def smod(left, right):
+    "Signed remainder, which has the sign of the dividend."
+    return left-right*sdiv(left, right)
+
+def fdiv(left, right):
+    return float(left)/right
+
+def fmod(left, right):
+    """Floating point remainder.  Like division, a zero divisor raises a ZeroDivisionError so the
+    operation is left to the target.  An infinite dividend gives NaN, as it does on the target."""
+    if right==0:
+        raise exceptions.ZeroDivisionError, "float modulo"
+    try:
+        return math.fmod(left, right)
+    except ValueError:
+        return float("nan")
+
+# Dictionary of (op, type class) to the function computing it.  The operands are already
+# converted to the result type.
+binary_ops = {}
+
+for cls in [UINT, SINT, FLOAT]:
+    binary_ops[("+", cls)] = operator.add
+    binary_ops[("-", cls)] = operator.sub
+    binary_ops[("*", cls)] = operator.mul
+
+for cls in [UINT, SINT, BOOL]:
+    binary_ops[("&", cls)] = operator.and_
+    binary_ops[("|", cls)] = operator.or_
+    binary_ops[("^", cls)] = operator.xor
+
+binary_ops[("/", UINT)] = operator.floordiv
+binary_ops[("%", UINT)] = operator.mod
+binary_ops[("/", SINT)] = sdiv
+binary_ops[("%", SINT)] = smod
+binary_ops[("/", FLOAT)] = fdiv
+binary_ops[("%", FLOAT)] = fmod
+binary_ops[("+", STRING)] = operator.add
+
+# The type integers narrower than it are promoted to before an operation, like C's int.
+INT = typesys.type.SINT32
+
+def promote(type_id):
+    "Returns the type id an integer of the type type_id is promoted to."
+    if type_id in UNSIGNED+SIGNED and typesys.type.id_to_size_map[type_id]<typesys.type.id_to_size_map[INT]:
+        return INT
+
+    return type_id
+
+def result_type(left, right):
+    """Returns the type of the result of a binary operation on values of the types left and right.
+    Integers are promoted and converted like C's usual arithmetic conversions: both sides are
+    promoted to at least INT, the wider side wins, and unsigned wins when both are as wide.  For
+    other types it is the type one side is promotable to, or the left side's type when neither is."""
+    if left.id in UNSIGNED+SIGNED and right.id in UNSIGNED+SIGNED:
+        a = promote(left.id)
+        b = promote(right.id)
+        size_a = typesys.type.id_to_size_map[a]
+        size_b = typesys.type.id_to_size_map[b]
+        if size_a!=size_b:
+            t_id = a if size_a>size_b else b
+        elif a in UNSIGNED:
+            t_id = a
+        else:
+            t_id = b
+
+        return typesys.type.intern(t_id, is_const=True)
+
+    if left.isPromotable(right):
+        return right
+
+    return left
+
+def convert(value, cls):
+    "Converts a folded value to the python type of the type class cls."
+    if cls==FLOAT: return float(value)
+    if cls==BOOL: return bool(value)
+    if cls==STRING: return value
+    return int(value)
+
+def binop(op, left_type, left, right_type, right):
+    """Folds 'left op right'.  Returns a (type, value) pair with the type of the result.  Raises a
+    TypeError if the operation can't be folded, and a ZeroDivisionError for division by zero."""
+    t = result_type(left_type, right_type)
+    cls = type_class(t)
+    fn = binary_ops.get((op, cls), None)
+    if fn==None or type_class(left_type)==None or type_class(right_type)==None:
+        raise exceptions.TypeError, "The operation '%s' can't be folded for the types '%s' and '%s'." % (op, left_type, right_type)
+
+    if (cls==STRING)!=(type_class(left_type)==STRING and type_class(right_type)==STRING):
+        raise exceptions.TypeError, "The operation '%s' can't be folded for the types '%s' and '%s'." % (op, left_type, right_type)
+
+    # Like C, both operands are converted to the result type before the operation.
+    value = fn(wrap(convert(left, cls), t.id), wrap(convert(right, cls), t.id))
+    return (t, wrap(value, t.id))
@@ -0,0 +1,298 @@
+"""A flat representation of expression trees for whole-module passes.  The nodes of one or more
+trees are stored in parallel arrays in post-order, so every node comes after its inputs.  Passes
+are then a single loop over the node numbers instead of a recursive walk over objects.  Shared
+subtrees are stored once.  Graphs are built from expr nodes and turned back into them."""
+
+import array
+
+import err
+import typesys.builtins
+import typesys.type
+
+import expr
+import fold
+
+# Node kinds
+LITERAL           = 0
+IDENT             = 1
+BINARY            = 2
+IF                = 3
+INDEX             = 4
+UNARY             = 5
+POSTFIX           = 6
+INITIALIZER_LIST  = 7
+STRUCT_CONSTRUCT  = 8
+
+#  The expr classes are named rather than referenced, this module is imported by the tests while
+# the expr package is still being imported.
+class_to_kind = { "LiteralLeaf"       : LITERAL,
+                  "Ident"             : IDENT,
+                  "Binary"            : BINARY,
+                  "IfExpr"            : IF,
+                  "Index"             : INDEX,
+                  "Unary"             : UNARY,
+                  "PostFix"           : POSTFIX,
+                  "InitializerList"   : INITIALIZER_LIST,
+                  "StructConstructor" : STRUCT_CONSTRUCT }
+
+kind_to_class = dict([(v, k) for k, v in class_to_kind.items()])
+
+def kind_of(node):
+    "Returns the kind of an expr node."
+    return class_to_kind[type(node).__name__]
+
+# The attributes holding the inputs of each kind, in order.  Initializer lists hold theirs in value.
+input_names = { LITERAL          : [],
+                IDENT            : [],
+                BINARY           : None,
+                IF               : ["cond", "true_value", "false_value"],
+                INDEX            : ["src", "idx"],
+                UNARY            : ["child"],
+                POSTFIX          : ["child"],
+                INITIALIZER_LIST : None,
+                STRUCT_CONSTRUCT : ["child"] }
+
+class ExprGraph:
+    "The nodes of a set of expression trees.  Each column is an array indexed by node number."
+    def __init__(self):
+        # The kind of each node
+        self.kinds = array.array("B")
+
+        # The op of each node, as an index into ops
+        self.op_ids = array.array("l")
+
+        # The inputs of node n are input_list[first_input[n]:first_input[n]+input_count[n]]
+        self.first_input = array.array("l")
+        self.input_count = array.array("l")
+        self.input_list = array.array("l")
+
+        # The type of each node, as an index into types.  -1 is the null type.
+        self.type_ids = array.array("l")
+
+        #  The value of leaves and the struct definition of constructors.  Initializer lists have
+        # their output count, and a list of the (position, value) of the elements that aren't
+        # expressions.  None for other nodes.
+        self.values = []
+
+        # The packed location of each node
+        self.locs = []
+
+        # Tables of the distinct ops and types used by the nodes.
+        self.ops = []
+        self.op_index = {}
+        self.types = []
+        self.type_index = {}
+
+        #  Dictionary of id(node) to (node, node number) for the expr nodes added, so shared subtrees
+        # are added once.  The nodes are kept so their ids can't be reused by other nodes.
+        self.numbers = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def opId(self, op):
+        "Returns the index of op in the op table, adding it if needed."
+        idx = self.op_index.get(op, None)
+        if idx==None:
+            idx = self.op_index[op] = len(self.ops)
+            self.ops.append(op)
+        return idx
+
+    def typeId(self, t):
+        "Returns the index of the type t in the type table, adding it if needed."
+        if t is typesys.builtins.NULL_TYPE:
+            return -1
+
+        idx = self.type_index.get(id(t), None)
+        if idx==None:
+            idx = self.type_index[id(t)] = len(self.types)
+            self.types.append(t)
+        return idx
+
+    def getType(self, n):
+        "Returns the type of node n."
+        idx = self.type_ids[n]
+        return self.types[idx] if idx>=0 else typesys.builtins.NULL_TYPE
+
+    def getInputs(self, n):
+        "Returns the node numbers of the inputs of node n."
+        first = self.first_input[n]
+        return self.input_list[first:first+self.input_count[n]]
+
+    def append(self, kind, op, inputs, t, value, packed_loc):
+        "Adds a node after its inputs, returns its number."
+        self.kinds.append(kind)
+        self.op_ids.append(self.opId(op))
+        self.first_input.append(len(self.input_list))
+        self.input_count.append(len(inputs))
+        self.input_list.extend(inputs)
+        self.type_ids.append(self.typeId(t))
+        self.values.append(value)
+        self.locs.append(packed_loc)
+        return len(self.kinds)-1
+
+    def add(self, root):
+        "Adds the expression tree at root, returns the number of its root node."
+        numbers = self.numbers
+
+        stack = [(root, False)]
+        while len(stack):
+            node, visited = stack.pop()
+            if id(node) in numbers:
+                continue
+
+            inputs = get_inputs(node)
+            if not visited:
+                stack.append((node, True))
+                for child in reversed(inputs):
+                    if id(child) not in numbers:
+                        stack.append((child, False))
+                continue
+
+            kind = kind_of(node)
+            if kind in (LITERAL, IDENT):
+                value = node.value
+            elif kind==STRUCT_CONSTRUCT:
+                value = node.struct_def
+            elif kind==INITIALIZER_LIST:
+                value = (node.num_outputs, [(idx, e) for idx, e in enumerate(node.value) if not isinstance(e, expr.Expr)])
+            else:
+                value = None
+
+            n = self.append(kind, node.op, [numbers[id(c)][1] for c in inputs], node.type, value, node.packed_loc)
+            numbers[id(node)] = (node, n)
+
+        return numbers[id(root)][1]
+
+    def toExpr(self, n):
+        "Returns the expression tree for node n, made of expr nodes."
+        nodes = {}
+        for i in self.reachable(n):
+            kind = self.kinds[i]
+            cls = getattr(expr, kind_to_class[kind])
+            node = cls.__new__(cls)
+            node.op = self.ops[self.op_ids[i]]
+            node.packed_loc = self.locs[i]
+            node.type = self.getType(i)
+
+            inputs = [nodes[c] for c in self.getInputs(i)]
+            if kind in (LITERAL, IDENT):
+                node.value = self.values[i]
+            elif kind==BINARY:
+                node.children = tuple(inputs)
+            elif kind==INITIALIZER_LIST:
+                node.num_outputs, others = self.values[i]
+                node.value = inputs
+                for idx, e in others:
+                    node.value.insert(idx, e)
+            else:
+                if kind==STRUCT_CONSTRUCT:
+                    node.struct_def = self.values[i]
+                for name, value in zip(input_names[kind], inputs):
+                    setattr(node, name, value)
+
+            nodes[i] = node
+
+        return nodes[n]
+
+    def reachable(self, n):
+        "Returns the numbers of the nodes node n depends on, and n itself, in increasing order."
+        seen = set([n])
+        for i in xrange(n, -1, -1):
+            if i in seen:
+                seen.update(self.getInputs(i))
+
+        return sorted(seen)
+
+    def resolveTypes(self):
+        """Sets the type of every node without one, the same way the expr classes resolve their
+        types, in a single sweep."""
+        kinds = self.kinds
+        type_ids = self.type_ids
+        for i in xrange(0, len(kinds)):
+            if type_ids[i]!=-1:
+                continue
+
+            kind = kinds[i]
+            first = self.first_input[i]
+            if kind==BINARY:
+                type_ids[i] = type_ids[self.input_list[first]]
+            elif kind==IF:
+                type_ids[i] = type_ids[self.input_list[first+1]]
+            elif kind==INDEX:
+                src = self.input_list[first]
+                if type_ids[src]!=-1:
+                    type_ids[i] = self.typeId(self.types[type_ids[src]].getIndexedType())
+
+    def fold(self):
+        """Folds in a single sweep, like solver.PropagateConstants without the identifier lookup.
+        Binary operations on literals become literals and if expressions with a literal condition
+        become a copy of the branch taken."""
+        kinds = self.kinds
+        for i in xrange(0, len(kinds)):
+            kind = kinds[i]
+            if kind==BINARY:
+                left, right = self.getInputs(i)
+                if kinds[left]!=LITERAL or kinds[right]!=LITERAL:
+                    continue
+
+                try:
+                    t, value = fold.binop(self.ops[self.op_ids[i]], self.getType(left), self.values[left],
+                                          self.getType(right), self.values[right])
+                except (TypeError, ZeroDivisionError):
+                    continue
+
+                kinds[i] = LITERAL
+                self.op_ids[i] = self.opId("lit")
+                self.input_count[i] = 0
+                self.type_ids[i] = self.typeId(typesys.type.intern(t.id, is_const=True))
+                self.values[i] = value
+
+            elif kind==IF:
+                cond, true_value, false_value = self.getInputs(i)
+                if kinds[cond]!=LITERAL:
+                    continue
+
+                self.copyNode(true_value if self.values[cond] else false_value, i)
+
+    def structTypes(self, first=0):
+        """Returns the struct types of the nodes from node first on, in a single sweep: the types of
+        struct valued nodes, and the types constructors build.  Each type is returned once."""
+        kinds = self.kinds
+        type_ids = self.type_ids
+        seen = set()
+        found = []
+        for i in xrange(first, len(kinds)):
+            if kinds[i]==STRUCT_CONSTRUCT:
+                found.append(typesys.type.newStruct(self.values[i], err.expand_location(self.locs[i])))
+                
+            idx = type_ids[i]
+            if idx>=0 and idx not in seen:
+                seen.add(idx)
+                if self.types[idx].isStruct():
+                    found.append(self.types[idx])
+
+        return found
+
+    def copyNode(self, src, dst):
+        "Makes node dst the same as node src, location included.  src must come before dst."
+        self.kinds[dst] = self.kinds[src]
+        self.op_ids[dst] = self.op_ids[src]
+        self.first_input[dst] = self.first_input[src]
+        self.input_count[dst] = self.input_count[src]
+        self.type_ids[dst] = self.type_ids[src]
+        self.values[dst] = self.values[src]
+        self.locs[dst] = self.locs[src]
+
+def get_inputs(node):
+    "Returns the inputs of an expr node in the order the graph stores them."
+    kind = kind_of(node)
+    if kind==BINARY:
+        return list(node.children)
+    elif kind==INITIALIZER_LIST:
+        return [e for e in node.value if isinstance(e, expr.Expr)]
+
+    return [getattr(node, name) for name in input_names[kind]]
+
+def new():
+    return ExprGraph()
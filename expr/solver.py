@@ -4,40 +4,24 @@ constant branches to a single node, and also to allow deep checking of constrain
 It requires a way to keep track of contexts.  It also follows all branches to ensure
 constraints are not violated."""
 
-import expr
 import types
-import exceptions
+
+import typesys.type
+
+import expr
+import fold
 
 class SolveConstantExpr:
     "Solves a constant expression, returning a single expression as the result."
     def __init__(self, top):
         self.root = top
         
-    def _get_value(self, node):
-        t=node.getType()
-        if t.isString():
-            return '"%s"' % node.value
-        else:
-            return str(node.value)
-                
     def _exec_binop(self, loc, op, left, right):
-        # Create the code to run
-        code = "%s %s %s" % (self._get_value(left), op, self._get_value(right))
-        # Evaluate it
-        result=eval(code)
-        
-        # Now create a new leaf expression of the correct type.
-        rt = type(result)
-        if rt == types.IntType:
-            return expr.newInt(loc, result)
-        elif rt == types.FloatType:
-            return expr.newFloat(loc, result)
-        elif rt == types.StringType:
-            return expr.newString(loc, result)
-        elif rt == types.BooleanType:
-            return expr.newBool(loc, result)
-        
-        raise exceptions.TypeError, "Expected output to be an integer, float, or string."
+        "Folds the operation with the machine's arithmetic and returns a leaf holding the result."
+        t, value = fold.binop(op, left.getType(), left.value, right.getType(), right.value)
+        
+        # The result keeps its own type, a literal of the same value might have a narrower one.
+        return expr.LiteralLeaf(loc, value, typesys.type.intern(t.id, is_const=True))
         
     def _solve_node(self, node):
         """We assume that type checking has already occured, so we don't check for legalities.
@@ -52,7 +36,7 @@ class SolveConstantExpr:
             child = self._solve_node(node.child)
         elif n_inputs==3:
             result=self._solve_node(node.cond)
-            return node.true_value if result.value else node.false_value             
+            return self._solve_node(node.true_value if result.value else node.false_value)
         elif n_inputs==0:
             return node        
         
@@ -60,49 +44,40 @@ class SolveConstantExpr:
         "Perform the solving."
         return self._solve_node(self.root)
     
-    def _find_const(self, node, depth):
-        """Performs the work of finding the tallest constant node."""
-        depth+=1
+    def _find_const(self, node):
+        """Performs the work of finding the tallest constant node.  Returns a (node, height) pair, or
+        None if there is no constant branch below node."""
+        children = get_children(node)
+        if len(children)==0:
+            return None
         
         if node.isConst():
-            return (node, depth)
+            return (node, height(node))
         
-        n_inputs = node.getNumInputs()
-        if n_inputs==2:
-            left = self._find_const(node.children[0])
-            right = self._find_const(node.children[1])
-            
-            if not left: return right
-            if not right: return left
-            
-            if left[1] >= right[1]: return left
-            return right
-            
-        elif n_inputs==1:
-            return self._find_const(self.child, depth)
-            
-        return None
+        best = None
+        for child in children:
+            found = self._find_const(child)
+            if found and (not best or found[1]>best[1]):
+                best = found
+                
+        return best
     
     def findConstBranch(self):
         """Returns the root node of the tallest constant branch, or None if there are None.
         This function will not return leaf nodes."""
-        return self._find_const(self.root, 0)[0]
+        found = self._find_const(self.root)
+        return found[0] if found else None
     
     def _replace_branch(self, node, old, new):
-        """Perform the work of replacing a branch with a different branch."""
-        n_inputs = node.getNumInputs()
-        if n_inputs==2:
-            for idx in len(node.children):
-                if node.children[idx] is old: 
-                    node.children[idx] = new
-                    return
-                else:
-                    self._replace_branch(node.children[idx], old, new)                            
-        elif n_inputs==1:
-            if node.child is old:
-                node.child = new
-            else:
-                self._replace_branch(node.child, old, new)
+        """Perform the work of replacing a branch with a different branch.  Returns True if old was found."""
+        if replace_child(node, old, new):
+            return True
+        
+        for child in get_children(node):
+            if self._replace_branch(child, old, new):
+                return True
+            
+        return False
         
     def replaceBranch(self, old, new):
         """Replace a branch with a different branch.  The root cannot be replaced."""
@@ -110,7 +85,231 @@ class SolveConstantExpr:
     
     def graft(self, scope):
         """Check this tree for places where a constant identifier is used.  Replace the
-        constant with the actual value."""  
-        pass
+        constant with the actual value."""
+        if isinstance(self.root, expr.Ident):
+            value = find_constant(scope, self.root.value, self.root.loc)
+            if value:
+                self.root = value
+            return
+        
+        stack = [self.root]
+        while len(stack):
+            node = stack.pop()
+            for child in get_children(node):
+                value = find_constant(scope, child.value, child.loc) if isinstance(child, expr.Ident) else None
+                if value:
+                    replace_child(node, child, value)
+                else:
+                    stack.append(child)
+                    
+def get_children(node):
+    "Returns a list of the expressions node takes as inputs."
+    if isinstance(node, expr.Binary):
+        return list(node.children)
+    elif isinstance(node, expr.IfExpr):
+        return [node.cond, node.true_value, node.false_value]
+    elif isinstance(node, expr.Index):
+        return [node.src, node.idx]
+    elif isinstance(node, expr.InitializerList):
+        return [e for e in node.value if isinstance(e, expr.Expr)]
+    elif isinstance(node, (expr.Unary, expr.PostFix)):
+        return [node.child]
+    
+    return []
+
+def replace_child(node, old, new):
+    "Replaces the input old of node with new.  Returns True if old is one of node's inputs."
+    if isinstance(node, expr.Binary):
+        if old not in node.children:
+            return False
+        node.children = tuple([new if c is old else c for c in node.children])
+    elif isinstance(node, expr.IfExpr):
+        if node.cond is old: node.cond = new
+        elif node.true_value is old: node.true_value = new
+        elif node.false_value is old: node.false_value = new
+        else: return False
+    elif isinstance(node, expr.Index):
+        if node.src is old: node.src = new
+        elif node.idx is old: node.idx = new
+        else: return False
+    elif isinstance(node, expr.InitializerList):
+        for idx in range(0, len(node.value)):
+            if node.value[idx] is old:
+                node.value[idx] = new
+                return True
+        return False
+    elif isinstance(node, (expr.Unary, expr.PostFix)):
+        if node.child is not old: return False
+        node.child = new
+    else:
+        return False
+    
+    return True
+
+def height(node):
+    "Returns the height of the tree below node, a leaf has height 1."
+    children = get_children(node)
+    if len(children)==0:
+        return 1
+    
+    return 1+max([height(child) for child in children])
+
+def defining_scope(scope, name):
+    """Returns the innermost of scope and the scopes enclosing it that defines the unscoped name: a
+    block by its variables, a function by its parameters and a module by its globals and
+    constants.  Returns None if none of them does."""
+    while scope!=None:
+        if hasattr(scope, "vars"):
+            found = scope.vars.hasMember(name)
+        elif hasattr(scope, "hasParm"):
+            found = scope.hasParm(name)
+        else:
+            found = scope.hasMember(name)
+            
+        if found:
+            return scope
+        scope = getattr(scope, "parent_scope", None)
         
+    return None
+
+def enclosing_module(scope):
+    "Returns the module scope is in, or None."
+    while scope!=None and not hasattr(scope, "constants"):
+        scope = getattr(scope, "parent_scope", None)
+    return scope
 
+def find_constant(scope, name, loc, visiting=None):
+    """Looks name up in scope and the scopes enclosing it, innermost first, and returns a literal
+    leaf holding its value with the constant's type.  Returns None if the first definition of
+    name isn't a constant, so locals and parameters shadow constants, or if the constant has no
+    constant value.  A scoped name, like mod::X, is looked up in the imported module it names.
+    Each constant is folded once, without changing its initializer, and its value is kept in the
+    module's constant values."""
+    if "::" in name:
+        m = enclosing_module(scope)
+        if m==None:
+            return None
+        (scope, name), missing = m.resolveScope(name)
+        if len(missing):
+            return None
+    else:
+        scope = defining_scope(scope, name)
+        
+    if scope==None or not hasattr(scope, "constants") or name not in scope.constants:
+        return None
+    
+    values = scope.getConstantValues()
+    if name not in values:
+        # A constant defined in terms of itself has no value.
+        visiting = visiting or set()
+        if (scope, name) in visiting:
+            return None
+        visiting.add((scope, name))
+        
+        values[name] = fold_constant(scope, scope.constants[name], visiting)
+        
+    found = values[name]
+    if found==None:
+        return None
+    
+    return expr.LiteralLeaf(loc, found[1], typesys.type.intern(found[0], is_const=True))
+
+def fold_constant(scope, the_def, visiting):
+    "Returns the (type id, value) of a constant definition folded at its declared type, or None."
+    t = the_def.type_info
+    if t.isString():
+        if type(the_def.initializer)!=types.IntType:
+            return None
+        return (t.id, scope.getString(the_def.initializer))
+    
+    cls = fold.type_class(t)
+    if cls==None or not isinstance(the_def.initializer, expr.Expr):
+        return None
+    
+    solved = evaluate(scope, the_def.initializer, visiting)
+    if solved==None:
+        return None
+    
+    return (t.id, fold.wrap(fold.convert(solved.value, cls), t.id))
+
+def evaluate(scope, root, visiting):
+    """Returns a literal leaf holding the value of the expression tree at root, or None if it
+    isn't constant.  The tree is left as it is."""
+    values = {}
+    stack = [(root, False)]
+    while len(stack):
+        node, visited = stack.pop()
+        if not visited:
+            stack.append((node, True))
+            for child in get_children(node):
+                stack.append((child, False))
+            continue
+        
+        value = None
+        if isinstance(node, expr.LiteralLeaf):
+            value = node
+        elif isinstance(node, expr.Ident):
+            value = find_constant(scope, node.value, node.loc, set(visiting))
+        elif isinstance(node, expr.Binary):
+            left, right = [values[id(child)] for child in node.children]
+            if left!=None and right!=None:
+                try:
+                    value = SolveConstantExpr(node)._exec_binop(node.loc, node.op, left, right)
+                except (TypeError, ZeroDivisionError):
+                    pass
+        elif isinstance(node, expr.IfExpr):
+            cond = values[id(node.cond)]
+            if cond!=None:
+                value = values[id(node.true_value if cond.value else node.false_value)]
+                
+        values[id(node)] = value
+        
+    return values[id(root)]
+
+class PropagateConstants:
+    """Rewrites an expression tree in one bottom-up walk.  Identifiers naming constants in scope
+    are replaced by their values, operations on literals are folded into literals, and if
+    expressions with a literal condition are replaced by the branch they take.  Operations that
+    can't be folded, like a division by zero, are left for the generator."""
+    def __init__(self, scope):
+        self.scope = scope
+        
+    def __call__(self, root):
+        "Returns the rewritten tree.  Nodes are changed in place, so the result may be root itself."
+        # Post-order walk with an explicit stack of (node, parent).
+        stack = [(root, None, False)]
+        result = root
+        while len(stack):
+            node, parent, visited = stack.pop()
+            if not visited:
+                stack.append((node, parent, True))
+                for child in get_children(node):
+                    stack.append((child, node, False))
+                continue
+            
+            new = self._rewrite(node)
+            if new is not node:
+                if parent==None:
+                    result = new
+                else:
+                    replace_child(parent, node, new)
+                    
+        return result
+    
+    def _rewrite(self, node):
+        "Returns the replacement for node, whose inputs have already been rewritten."
+        if isinstance(node, expr.Ident):
+            return find_constant(self.scope, node.value, node.loc) or node
+        
+        if isinstance(node, expr.Binary):
+            left, right = node.children
+            if isinstance(left, expr.LiteralLeaf) and isinstance(right, expr.LiteralLeaf):
+                try:
+                    return SolveConstantExpr(node)._exec_binop(node.loc, node.op, left, right)
+                except (TypeError, ZeroDivisionError):
+                    return node
+                
+        if isinstance(node, expr.IfExpr) and isinstance(node.cond, expr.LiteralLeaf):
+            return node.true_value if node.cond.value else node.false_value
+        
+        return node
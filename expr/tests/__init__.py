@@ -1,2 +1,7 @@
 from test_struct_expr import *
-from test_init_list import *
\ No newline at end of file
+from test_init_list import *
+from test_fold import *
+from test_propagate import *
+from test_expr import *
+from test_graph import *
+from test_batch import *
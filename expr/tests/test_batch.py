@@ -0,0 +1,127 @@
+import random
+import sys
+import unittest
+
+import err
+import typesys.builtins
+import typesys.type
+
+import expr
+from expr import batch
+from expr import fold
+from expr import solver
+
+class TestBatchFolding(unittest.TestCase):
+    def setUp(self):
+        self.loc = err.location("unittest::TestBatchFolding::setUp", 1, 1)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+        self.numpy = batch.numpy
+        
+    def tearDown(self):
+        batch.numpy = self.numpy
+        
+    def leaf(self, value, type_id):
+        return expr.LiteralLeaf(self.loc, value, typesys.type.intern(type_id, is_const=True))
+        
+    def randomList(self, rand, type_ids, count):
+        "Returns an initializer list of random binary operations on literals of the given types."
+        ranges = { typesys.type.UINT8  : (0, 255), typesys.type.SINT8 : (-128, 127),
+                   typesys.type.UINT32 : (0, 0xffffffff), typesys.type.SINT32 : (-0x80000000, 0x7fffffff),
+                   typesys.type.UINT64 : (0, 0xffffffffffffffff), typesys.type.SINT64 : (-(1<<63), (1<<63)-1) }
+        
+        elems = []
+        for i in range(0, count):
+            op = rand.choice(["+", "-", "*", "/", "%", "^", "&", "|"])
+            operands = []
+            for j in range(0, 2):
+                type_id = rand.choice(type_ids)
+                if type_id in typesys.type.FLOATS:
+                    operands.append(self.leaf(rand.uniform(-1000, 1000), type_id))
+                else:
+                    operands.append(self.leaf(rand.randint(*ranges[type_id]), type_id))
+            elems.append(expr.Binary(op, self.loc, tuple(operands)))
+            
+        return expr.InitializerList(self.loc, elems, count)
+    
+    def expected(self, init_list):
+        "Folds the elements one at a time."
+        return [solver.PropagateConstants(None)(e) for e in init_list.value]
+    
+    def checkList(self, init_list, type_id):
+        elems = list(init_list.value)
+        folded = batch.fold_elements(init_list.value)
+        packed = batch.pack_initializer_list(init_list)
+        self.assertEqual(init_list.value, elems)
+        
+        expected = self.expected(init_list)
+        self.assertEqual([e.value for e in folded], [e.value for e in expected])
+        self.assertEqual([e.type.id for e in folded], [e.type.id for e in expected])
+        
+        self.assertNotEqual(packed, None)
+        self.assertEqual(packed.type_id, type_id)
+        self.assertEqual(packed.count, len(expected))
+        self.assertEqual(len(packed.data), len(expected)*typesys.type.id_to_size_map[type_id])
+        self.assertEqual(packed.getValues(), [e.value for e in expected])
+        
+    def testIntegers(self):
+        "Integer lists fold like the scalar folder, with and without NumPy."
+        for use_numpy in [True, False]:
+            if use_numpy and self.numpy==None:
+                continue
+            batch.numpy = self.numpy if use_numpy else None
+            
+            rand = random.Random(5)
+            for type_id in [typesys.type.UINT8, typesys.type.SINT8, typesys.type.UINT32, typesys.type.SINT32,
+                            typesys.type.UINT64, typesys.type.SINT64]:
+                self.checkList(self.randomList(rand, [type_id], 500), fold.promote(type_id))
+                
+    def testFloats(self):
+        "Float lists fold like the scalar folder, rounded to single precision for float32_t."
+        for use_numpy in [True, False]:
+            if use_numpy and self.numpy==None:
+                continue
+            batch.numpy = self.numpy if use_numpy else None
+            
+            rand = random.Random(6)
+            for type_id in [typesys.type.FLOAT32, typesys.type.FLOAT64]:
+                init_list = self.randomList(rand, [type_id], 300)
+                init_list.value = [e for e in init_list.value if e.op in ("+", "-", "*", "/", "%")]
+                self.checkList(init_list, type_id)
+                
+    def testPromotedElements(self):
+        "Elements of types promotable to a common type are packed as that type."
+        elems = [self.leaf(1, typesys.type.UINT8), self.leaf(70000, typesys.type.UINT32), self.leaf(300, typesys.type.UINT16)]
+        packed = batch.pack_initializer_list(expr.InitializerList(self.loc, elems, 3))
+        self.assertEqual(packed.type_id, typesys.type.UINT32)
+        self.assertEqual(packed.getValues(), [1, 70000, 300])
+        
+        packed = batch.pack_initializer_list(expr.InitializerList(self.loc, elems, 3), type_id=typesys.type.UINT64)
+        self.assertEqual(packed.type_id, typesys.type.UINT64)
+        self.assertEqual(len(packed.data), 24)
+        self.assertEqual(batch.pack_initializer_list(expr.InitializerList(self.loc, elems, 3), type_id=typesys.type.UINT16), None)
+        
+    def testDeclaredType(self):
+        "Elements are folded at the promoted width, and packed as the declared type when they fit it."
+        elems = [expr.Binary("*", self.loc, (expr.newInt(self.loc, 100), expr.newInt(self.loc, 1000))),
+                 expr.Binary("-", self.loc, (expr.newInt(self.loc, 2), expr.newInt(self.loc, 1)))]
+        packed = batch.pack_initializer_list(expr.InitializerList(self.loc, elems, 2), type_id=typesys.type.UINT32)
+        self.assertEqual(packed.type_id, typesys.type.UINT32)
+        self.assertEqual(packed.getValues(), [100000, 1])
+        
+        self.assertEqual(batch.pack_initializer_list(expr.InitializerList(self.loc, elems, 2), type_id=typesys.type.UINT16), None)
+        
+        negative = [expr.Binary("-", self.loc, (expr.newInt(self.loc, 2), expr.newInt(self.loc, 5)))]
+        self.assertEqual(batch.pack_initializer_list(expr.InitializerList(self.loc, negative, 1), type_id=typesys.type.UINT32), None)
+        packed = batch.pack_initializer_list(expr.InitializerList(self.loc, negative, 1), type_id=typesys.type.SINT8)
+        self.assertEqual(packed.getValues(), [-3])
+        
+    def testNotHomogeneous(self):
+        "Lists that mix strings or unrelated types, or that can't be folded, are not packed."
+        for elems in [[self.leaf(1, typesys.type.UINT8), self.leaf("a", typesys.type.STRING)],
+                      [self.leaf(1, typesys.type.UINT8), self.leaf(-1, typesys.type.SINT8)],
+                      [self.leaf(1, typesys.type.UINT8), expr.newIdent(self.loc, "x")],
+                      [expr.Binary("/", self.loc, (self.leaf(1, typesys.type.UINT8), self.leaf(0, typesys.type.UINT8)))]]:
+            self.assertEqual(batch.pack_initializer_list(expr.InitializerList(self.loc, elems, len(elems))), None)
@@ -0,0 +1,47 @@
+import cPickle
+import sys
+import unittest
+
+import err
+import typesys.builtins
+import typesys.type
+
+import expr
+
+class TestExpr(unittest.TestCase):
+    def setUp(self):
+        self.loc = err.location("unittest::TestExpr::setUp", 12, 34)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+    def testCompactNodes(self):
+        "Nodes have no instance dictionary and keep their location packed."
+        e = expr.Binary("+", self.loc, (expr.newInt(self.loc, 1), expr.newIdent(self.loc, "x")))
+        for node in [e, e.children[0], e.children[1]]:
+            self.assertFalse(hasattr(node, "__dict__"))
+            self.assertTrue(isinstance(node.packed_loc, int))
+            
+        loc = e.loc
+        self.assertEqual((loc.file, loc.line, loc.col), (self.loc.file, 12, 34))
+        
+    def testUnpackableLocation(self):
+        "Locations too big to pack, or missing, are kept as they are."
+        loc = err.location("unittest::testUnpackableLocation", 1<<30, 1)
+        self.assertTrue(expr.newInt(loc, 1).loc is loc)
+        self.assertEqual(expr.newInt(None, 1).loc, None)
+        
+    def testShiftLocation(self):
+        "Packed locations can be moved to another line."
+        e = expr.newInt(self.loc, 1)
+        e.packed_loc = err.shift_location(e.packed_loc, 3)
+        self.assertEqual((e.loc.line, e.loc.col), (15, 34))
+        
+    def testPickle(self):
+        "Pickled nodes keep their locations and values."
+        e = expr.IfExpr(self.loc, expr.newBool(self.loc, True), expr.newInt(self.loc, 1), expr.newString(self.loc, "a"))
+        e2 = cPickle.loads(cPickle.dumps(e, cPickle.HIGHEST_PROTOCOL))
+        self.assertEqual(e2.true_value.value, 1)
+        self.assertEqual(e2.false_value.value, "a")
+        self.assertEqual((e2.cond.loc.file, e2.cond.loc.line), (self.loc.file, 12))
+        self.assertTrue(isinstance(e2.cond.packed_loc, int))
@@ -0,0 +1,116 @@
+import sys
+import unittest
+
+import err
+import typesys.builtins
+import typesys.type
+
+import expr
+from expr import fold
+from expr import solver
+
+class TestFold(unittest.TestCase):
+    def setUp(self):
+        self.loc = err.location("unittest::setUp", 1, 1)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+    def leaf(self, value, type_name):
+        return expr.LiteralLeaf(self.loc, value, typesys.type.new(type_name, self.loc, is_const=True))
+        
+    def solve(self, op, left, right):
+        return solver.SolveConstantExpr(expr.Binary(op, self.loc, (left, right)))()
+        
+    def testUnsignedWrap(self):
+        "Unsigned results wrap to the width of their type."
+        result = self.solve("-", self.leaf(3, "uint32_t"), self.leaf(5, "uint32_t"))
+        self.assertEqual(result.value, 0xfffffffe)
+        self.assertEqual(result.getType().id, typesys.type.UINT32)
+        
+        result = self.solve("+", self.leaf(0xffffffffffffffff, "uint64_t"), self.leaf(2, "uint64_t"))
+        self.assertEqual(result.value, 1)
+        
+    def testSignedWrap(self):
+        "Signed results wrap around to negative values."
+        self.assertEqual(self.solve("+", self.leaf(0x7fffffff, "sint32_t"), self.leaf(1, "sint32_t")).value, -0x80000000)
+        self.assertEqual(self.solve("*", self.leaf(-0x80000000, "sint32_t"), self.leaf(-1, "sint32_t")).value, -0x80000000)
+        
+    def testIntegerPromotion(self):
+        "Narrow integers are promoted to sint32_t first, so they don't wrap at their own width."
+        result = self.solve("+", self.leaf(200, "uint8_t"), self.leaf(100, "uint8_t"))
+        self.assertEqual(result.value, 300)
+        self.assertEqual(result.getType().id, typesys.type.SINT32)
+        
+        self.assertEqual(self.solve("+", self.leaf(255, "uint8_t"), self.leaf(1, "uint8_t")).value, 256)
+        self.assertEqual(self.solve("-", self.leaf(2, "uint8_t"), self.leaf(5, "uint8_t")).value, -3)
+        self.assertEqual(self.solve("+", self.leaf(127, "sint8_t"), self.leaf(1, "sint8_t")).value, 128)
+        self.assertEqual(self.solve("*", self.leaf(1000, "uint16_t"), self.leaf(1000, "uint16_t")).value, 1000000)
+        
+    def testLiterals(self):
+        "Parsed literals get the narrowest type that holds them, which must not narrow the result."
+        def solve(op, left, right):
+            return solver.SolveConstantExpr(expr.Binary(op, self.loc, (expr.newInt(self.loc, left), expr.newInt(self.loc, right))))().value
+        
+        self.assertEqual(solve("+", 200, 100), 300)
+        self.assertEqual(solve("-", 2, 5), -3)
+        self.assertEqual(solve("+", 255, 1), 256)
+        self.assertEqual(solve("*", 1000, 1000), 1000000)
+        self.assertEqual(solve("-", -100, 100), -200)
+        
+    def testMixedWidths(self):
+        "The wider side wins, and unsigned wins between sides of the same width."
+        result = self.solve("+", self.leaf(5, "uint32_t"), self.leaf(-1, "sint8_t"))
+        self.assertEqual((result.getType().id, result.value), (typesys.type.UINT32, 4))
+        
+        result = self.solve("-", self.leaf(1, "uint8_t"), self.leaf(2, "uint32_t"))
+        self.assertEqual((result.getType().id, result.value), (typesys.type.UINT32, 0xffffffff))
+        
+        result = self.solve("+", self.leaf(1, "uint32_t"), self.leaf(-2, "sint64_t"))
+        self.assertEqual((result.getType().id, result.value), (typesys.type.SINT64, -1))
+        
+        result = self.solve("+", self.leaf(-1, "sint32_t"), self.leaf(0, "uint64_t"))
+        self.assertEqual((result.getType().id, result.value), (typesys.type.UINT64, 0xffffffffffffffff))
+        
+    def testDivision(self):
+        "Signed division truncates toward zero, unsigned division treats the bits as unsigned."
+        self.assertEqual(self.solve("/", self.leaf(-7, "sint16_t"), self.leaf(2, "sint16_t")).value, -3)
+        self.assertEqual(self.solve("%", self.leaf(-7, "sint16_t"), self.leaf(2, "sint16_t")).value, -1)
+        self.assertEqual(self.solve("/", self.leaf(0xffff, "uint16_t"), self.leaf(2, "uint16_t")).value, 0x7fff)
+        self.assertEqual(self.solve("/", self.leaf(7, "uint8_t"), self.leaf(2.0, "float64_t")).value, 3.5)
+        self.assertRaises(ZeroDivisionError, self.solve, "/", self.leaf(7, "uint8_t"), self.leaf(0, "uint8_t"))
+        self.assertRaises(ZeroDivisionError, self.solve, "%", self.leaf(5.0, "float64_t"), self.leaf(0.0, "float64_t"))
+        self.assertEqual(self.solve("%", self.leaf(5.5, "float64_t"), self.leaf(2.0, "float64_t")).value, 1.5)
+        
+        inf = self.solve("%", self.leaf(float("inf"), "float64_t"), self.leaf(2.0, "float64_t")).value
+        self.assertNotEqual(inf, inf)
+        
+    def testBitwise(self):
+        "'^' is exclusive or."
+        self.assertEqual(self.solve("^", self.leaf(6, "uint8_t"), self.leaf(3, "uint8_t")).value, 5)
+        self.assertEqual(self.solve("&", self.leaf(-1, "sint8_t"), self.leaf(0x7f, "sint8_t")).value, 0x7f)
+        self.assertEqual(self.solve("|", self.leaf(True, "bool_t"), self.leaf(False, "bool_t")).value, True)
+        
+    def testPromotion(self):
+        "The result takes the type the other operand is promotable to."
+        result = self.solve("+", self.leaf(255, "uint8_t"), self.leaf(1, "uint16_t"))
+        self.assertEqual(result.value, 256)
+        self.assertEqual(result.getType().id, typesys.type.SINT32)
+        
+        result = self.solve("+", self.leaf(1, "uint8_t"), self.leaf(0.1, "float32_t"))
+        self.assertEqual(result.getType().id, typesys.type.FLOAT32)
+        self.assertNotEqual(result.value, 1.1)
+        self.assertAlmostEqual(result.value, 1.1, 6)
+        
+    def testNotFoldable(self):
+        "Operations that have no meaning for the types raise a TypeError."
+        self.assertRaises(TypeError, self.solve, "-", self.leaf("a", "string_t"), self.leaf("b", "string_t"))
+        self.assertRaises(TypeError, self.solve, "+", self.leaf("a", "string_t"), self.leaf(1, "uint8_t"))
+        self.assertRaises(TypeError, self.solve, "^", self.leaf(1.0, "float64_t"), self.leaf(1.0, "float64_t"))
+        
+    def testWrap(self):
+        "Wrapping a value to each width."
+        self.assertEqual(fold.wrap(0x1ff, typesys.type.UINT8), 0xff)
+        self.assertEqual(fold.wrap(0x80, typesys.type.SINT8), -128)
+        self.assertEqual(fold.wrap(-1, typesys.type.UINT64), 0xffffffffffffffff)
+        self.assertEqual(fold.wrap(1<<63, typesys.type.SINT64), -(1<<63))
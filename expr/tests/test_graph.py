@@ -0,0 +1,131 @@
+import random
+import sys
+import unittest
+
+import err
+import typesys.builtins
+import typesys.struct
+import typesys.type
+
+import expr
+from expr import graph
+from expr import solver
+
+class TestExprGraph(unittest.TestCase):
+    def setUp(self):
+        self.loc = err.location("unittest::TestExprGraph::setUp", 1, 1)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+    def randomTree(self, rand, depth):
+        "Returns a random tree of integer and bool operations."
+        loc = err.location("random", depth, rand.randint(1, 80))
+        if depth==0 or rand.random()<0.2:
+            choice = rand.randint(0, 5)
+            if choice==0: return expr.newIdent(loc, "x")
+            if choice==1: return expr.newBool(loc, rand.random()<0.5)
+            return expr.newInt(loc, rand.randint(-300, 70000))
+        
+        if rand.random()<0.2:
+            return expr.IfExpr(loc, self.randomTree(rand, depth-1), self.randomTree(rand, depth-1), self.randomTree(rand, depth-1))
+        
+        op = rand.choice(["+", "-", "*", "/", "%", "^", "&", "|"])
+        return expr.Binary(op, loc, (self.randomTree(rand, depth-1), self.randomTree(rand, depth-1)))
+    
+    def dump(self, node):
+        "Returns a nested tuple describing the tree at node."
+        children = tuple([self.dump(c) for c in solver.get_children(node)])
+        value = node.value if isinstance(node, expr.Leaf) else None
+        return (type(node).__name__, node.op, value, node.type.id, (node.loc.line, node.loc.col), children)
+        
+    def testRoundTrip(self):
+        "Trees come back from the graph unchanged."
+        rand = random.Random(4321)
+        g = graph.new()
+        trees = [self.randomTree(rand, 6) for i in range(0, 50)]
+        roots = [g.add(t) for t in trees]
+        
+        for t, n in zip(trees, roots):
+            self.assertEqual(self.dump(g.toExpr(n)), self.dump(t))
+            
+    def testSharedSubtree(self):
+        "A subtree used twice is stored once."
+        shared = expr.Binary("+", self.loc, (expr.newInt(self.loc, 1), expr.newInt(self.loc, 2)))
+        root = expr.Binary("*", self.loc, (shared, shared))
+        g = graph.new()
+        n = g.add(root)
+        self.assertEqual(len(g), 4)
+        
+        e = g.toExpr(n)
+        self.assertTrue(e.children[0] is e.children[1])
+        
+    def testInitializerList(self):
+        "Initializer lists keep their elements and output count."
+        elems = [expr.newInt(self.loc, i) for i in range(0, 5)]
+        g = graph.new()
+        e = g.toExpr(g.add(expr.InitializerList(self.loc, elems, 5)))
+        self.assertEqual([c.value for c in e.value], range(0, 5))
+        self.assertEqual(e.getNumOutputs(), 5)
+        
+        mixed = expr.InitializerList(self.loc, ["a", expr.newInt(self.loc, 1), 2, expr.newInt(self.loc, 3)], 4)
+        e = g.toExpr(g.add(mixed))
+        self.assertEqual([c.value if isinstance(c, expr.Expr) else c for c in e.value], ["a", 1, 2, 3])
+        
+    def testCollectedTrees(self):
+        "Trees added and then dropped by the caller don't hand their numbers to new nodes."
+        g = graph.new()
+        for i in range(0, 200):
+            n = g.add(expr.Binary("+", self.loc, (expr.newInt(self.loc, i), expr.newInt(self.loc, 1))))
+            e = g.toExpr(n)
+            self.assertEqual((e.children[0].value, e.children[1].value), (i, 1))
+        
+    def testResolveTypes(self):
+        "Types are resolved from the inputs the same way the expr classes do it."
+        rand = random.Random(99)
+        g = graph.new()
+        trees = [self.randomTree(rand, 5) for i in range(0, 30)]
+        roots = [g.add(t) for t in trees]
+        g.resolveTypes()
+        
+        for t, n in zip(trees, roots):
+            self.assertEqual(g.getType(n).id, t.getType().id)
+        
+    def testFold(self):
+        "Folding the graph gives what folding the trees gives."
+        rand = random.Random(1234)
+        g = graph.new()
+        trees = [self.randomTree(rand, 6) for i in range(0, 100)]
+        roots = [g.add(t) for t in trees]
+        g.fold()
+        
+        propagate = solver.PropagateConstants(None)
+        for t, n in zip(trees, roots):
+            self.assertEqual(self.dump(g.toExpr(n)), self.dump(propagate(t)))
+            
+    def testFloatModuloByZero(self):
+        "A float remainder by zero is left unfolded in the graph, like in the trees."
+        root = expr.Binary("%", self.loc, (expr.newFloat(self.loc, 5.0), expr.newFloat(self.loc, 0.0)))
+        g = graph.new()
+        n = g.add(root)
+        g.fold()
+        self.assertEqual(g.kinds[n], graph.BINARY)
+        self.assertEqual(self.dump(g.toExpr(n)), self.dump(root))
+        
+    def testStructTypes(self):
+        "The struct types used by the nodes are found in one sweep, from a given node on."
+        point = typesys.struct.new("point", self.loc)
+        line = typesys.struct.new("line", self.loc)
+        g = graph.new()
+        g.add(expr.Binary("+", self.loc, (expr.newInt(self.loc, 1), expr.newInt(self.loc, 2))))
+        self.assertEqual(g.structTypes(), [])
+        
+        first = len(g)
+        g.add(expr.StructConstructor(self.loc, point, expr.newInt(self.loc, 0)))
+        ident = expr.newIdent(self.loc, "a_line")
+        ident.type = typesys.type.newStruct(line, self.loc)
+        g.add(expr.Index(self.loc, ident, expr.newInt(self.loc, 0)))
+        
+        found = g.structTypes(first)
+        self.assertEqual(sorted([t.struct_def.name for t in found]), ["line", "point"])
+        self.assertEqual(g.structTypes(len(g)), [])
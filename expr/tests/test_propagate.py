@@ -0,0 +1,176 @@
+import sys
+import unittest
+
+import err
+import typesys.block
+import typesys.builtins
+import typesys.const
+import typesys.func
+import typesys.module
+import typesys.type
+
+import expr
+from expr import solver
+
+class TestPropagateConstants(unittest.TestCase):
+    def setUp(self):
+        self.loc = loc = err.location("unittest::setUp", 1, 1)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+        self.m = typesys.module.new("test_module")
+        self.m.addConstant(typesys.const.new("SIZE", typesys.type.new("uint32_t", loc), expr.newInt(loc, 4)))
+        self.m.addConstant(typesys.const.new("DOUBLE", typesys.type.new("uint32_t", loc), 
+                                             expr.Binary("*", loc, (self.ident("SIZE"), expr.newInt(loc, 2)))))
+        self.m.addConstant(typesys.const.new("SMALL", typesys.type.new("uint8_t", loc), expr.newInt(loc, 255)))
+        self.m.addConstant(typesys.const.new("NAME", typesys.type.new("string_t", loc), "metal"))
+        self.m.addConstant(typesys.const.new("LOOP", typesys.type.new("uint32_t", loc), self.ident("LOOP")))
+        
+        self.b = typesys.block.Block(loc, "test_block")
+        self.b.setScope(self.m)
+        
+    def ident(self, name):
+        return expr.newIdent(self.loc, name)
+    
+    def binary(self, op, left, right):
+        return expr.Binary(op, self.loc, (left, right))
+        
+    def testSubstituteConstants(self):
+        "Identifiers naming constants are replaced by their values, with the constant's type."
+        self.b.setInitializer("a", self.binary("+", self.ident("DOUBLE"), self.ident("x")))
+        self.b.setInitializer("b", self.binary("+", self.ident("SMALL"), expr.newInt(self.loc, 1)))
+        self.b.setInitializer("c", self.ident("NAME"))
+        self.b.setInitializer("d", self.ident("LOOP"))
+        self.b.simplify()
+        
+        a = self.b.init["a"]
+        self.assertEqual(a.op, "+")
+        self.assertEqual(a.children[0].value, 8)
+        self.assertEqual(a.children[0].getType().id, typesys.type.UINT32)
+        self.assertTrue(isinstance(a.children[1], expr.Ident))
+        
+        # SMALL is a uint8_t, but the sum is promoted like C's, so it doesn't wrap.
+        self.assertEqual(self.b.init["b"].value, 256)
+        self.assertEqual(self.b.init["c"].value, "metal")
+        self.assertTrue(isinstance(self.b.init["d"], expr.Ident))
+        
+    def testShadowedConstants(self):
+        "Block variables and function parameters that shadow a constant are left alone."
+        self.b.addMember("SIZE", typesys.type.new("uint32_t", self.loc))
+        self.b.setInitializer("a", self.ident("SIZE"))
+        self.b.setInitializer("b", self.ident("DOUBLE"))
+        self.b.simplify()
+        self.assertTrue(isinstance(self.b.init["a"], expr.Ident))
+        self.assertEqual(self.b.init["b"].value, 8)
+        
+        f = typesys.func.new("f", self.loc)
+        f.addInboundVar("SMALL", typesys.type.new("uint8_t", self.loc))
+        b = typesys.block.Block(self.loc, "f_block")
+        f.setMainlineBlock(b)
+        self.m.addFunc(f)
+        b.setInitializer("a", self.ident("SMALL"))
+        b.setInitializer("b", self.ident("SIZE"))
+        b.simplify()
+        self.assertTrue(isinstance(b.init["a"], expr.Ident))
+        self.assertEqual(b.init["b"].value, 4)
+        
+    def testScopedConstants(self):
+        "Constants of imported modules are substituted through their scoped names."
+        lib = typesys.module.new("lib")
+        lib.addConstant(typesys.const.new("SIZE", typesys.type.new("uint32_t", self.loc), expr.newInt(self.loc, 6)))
+        lib.addConstant(typesys.const.new("TWICE", typesys.type.new("uint32_t", self.loc),
+                                          self.binary("*", self.ident("SIZE"), expr.newInt(self.loc, 2))))
+        self.m.addImport(lib)
+        
+        self.b.setInitializer("a", self.ident("lib::TWICE"))
+        self.b.setInitializer("b", self.ident("other::SIZE"))
+        self.b.setInitializer("c", self.ident("SIZE"))
+        self.b.simplify()
+        self.assertEqual(self.b.init["a"].value, 12)
+        self.assertTrue(isinstance(self.b.init["b"], expr.Ident))
+        self.assertEqual(self.b.init["c"].value, 4)
+        
+    def testFloatModuloByZero(self):
+        "A float remainder by zero is left for the target instead of stopping the compiler."
+        self.b.setInitializer("a", self.binary("%", expr.newFloat(self.loc, 5.0), expr.newFloat(self.loc, 0.0)))
+        self.b.simplify()
+        self.assertEqual(self.b.init["a"].op, "%")
+        
+    def testFoldSubtrees(self):
+        "Constant subtrees are folded even when the whole tree is not constant."
+        e = self.binary("*", self.binary("+", expr.newInt(self.loc, 1), expr.newInt(self.loc, 2)), self.ident("x"))
+        self.b.setInitializer("a", self.binary("-", self.ident("y"), e))
+        self.b.setInitializer("b", self.binary("/", expr.newInt(self.loc, 1), expr.newInt(self.loc, 0)))
+        self.b.simplify()
+        
+        a = self.b.init["a"]
+        self.assertEqual(a.children[1].children[0].value, 3)
+        self.assertEqual(self.b.init["b"].op, "/")
+        
+    def testConstantIf(self):
+        "If expressions with a constant condition become the branch taken."
+        cond = self.binary("&", expr.newBool(self.loc, True), expr.newBool(self.loc, False))
+        self.b.setInitializer("a", expr.IfExpr(self.loc, cond, self.ident("x"), self.ident("SIZE")))
+        self.b.setInitializer("b", expr.IfExpr(self.loc, self.ident("x"), self.ident("SIZE"), expr.newInt(self.loc, 1)))
+        self.b.simplify()
+        
+        self.assertEqual(self.b.init["a"].value, 4)
+        self.assertEqual(self.b.init["b"].op, "if")
+        self.assertEqual(self.b.init["b"].true_value.value, 4)
+        
+    def testFindAndReplaceBranch(self):
+        "The tallest constant branch can be found and replaced."
+        inner = self.binary("+", expr.newInt(self.loc, 1), expr.newInt(self.loc, 2))
+        root = self.binary("*", self.ident("x"), self.binary("-", inner, expr.newInt(self.loc, 1)))
+        cs = solver.SolveConstantExpr(root)
+        
+        branch = cs.findConstBranch()
+        self.assertTrue(branch is root.children[1])
+        
+        cs.replaceBranch(branch, solver.SolveConstantExpr(branch)())
+        self.assertEqual(root.children[1].value, 2)
+        self.assertEqual(solver.SolveConstantExpr(expr.newInt(self.loc, 1)).findConstBranch(), None)
+        
+    def testGraft(self):
+        "Grafting replaces constant identifiers without folding anything else."
+        root = self.binary("+", self.ident("SIZE"), self.binary("+", expr.newInt(self.loc, 1), self.ident("DOUBLE")))
+        cs = solver.SolveConstantExpr(root)
+        cs.graft(self.m)
+        self.assertEqual(root.children[0].value, 4)
+        self.assertEqual(root.children[1].children[1].value, 8)
+        self.assertEqual(cs().value, 13)
+        
+    def testDeclaredType(self):
+        "Constants are folded at the promoted width and wrapped only to their declared type."
+        loc = self.loc
+        sum_of = lambda: expr.Binary("+", loc, (expr.newInt(loc, 200), expr.newInt(loc, 100)))
+        self.m.addConstant(typesys.const.new("WIDE", typesys.type.new("uint32_t", loc), sum_of()))
+        self.m.addConstant(typesys.const.new("NARROW", typesys.type.new("uint8_t", loc), sum_of()))
+        self.m.addConstant(typesys.const.new("NEGATIVE", typesys.type.new("sint32_t", loc),
+                                             expr.Binary("-", loc, (expr.newInt(loc, 2), expr.newInt(loc, 5)))))
+        self.m.addConstant(typesys.const.new("WRAPPED", typesys.type.new("uint8_t", loc), self.ident("NEGATIVE")))
+        
+        self.assertEqual(solver.find_constant(self.m, "WIDE", loc).value, 300)
+        self.assertEqual(solver.find_constant(self.m, "NARROW", loc).value, 44)
+        self.assertEqual(solver.find_constant(self.m, "NEGATIVE", loc).value, -3)
+        self.assertEqual(solver.find_constant(self.m, "WRAPPED", loc).value, 253)
+        self.assertEqual(solver.find_constant(self.m, "WRAPPED", loc).getType().id, typesys.type.UINT8)
+        
+    def testFoldOnce(self):
+        "Constants are folded once into the module's table, and their initializers are left alone."
+        initializer = self.m.constants["DOUBLE"].initializer
+        self.b.setInitializer("a", self.ident("DOUBLE"))
+        self.b.setInitializer("b", self.binary("+", self.ident("DOUBLE"), self.ident("DOUBLE")))
+        self.b.simplify()
+        
+        self.assertEqual(self.b.init["a"].value, 8)
+        self.assertEqual(self.b.init["b"].value, 16)
+        self.assertTrue(self.m.constants["DOUBLE"].initializer is initializer)
+        self.assertTrue(isinstance(initializer.children[0], expr.Ident))
+        self.assertEqual(self.m.constant_values["DOUBLE"], (typesys.type.UINT32, 8))
+        
+        # Changing the constants throws the folded values away.
+        self.m.addConstant(typesys.const.new("SIZE", typesys.type.new("uint32_t", self.loc), expr.newInt(self.loc, 5)))
+        self.assertEqual(self.m.getConstantValues(), {})
+        self.assertEqual(solver.find_constant(self.m, "DOUBLE", self.loc).value, 10)
@@ -1,8 +1,15 @@
 import frame_parse
 import ops_parse
+import transform_cache
 import transform_parse
 
+import err
+import expr
 import typesys
+import typesys.builtins
+
+from expr import batch
+from expr import graph
 
 import ConfigParser
 import os
@@ -62,26 +69,57 @@ class Formatter:
         if self.indent<0:
             self.indent=0
             
+    def format_line(self, line):
+        "Returns the line indented, with its newline, or None for an indent or dedent mark."
+        l=line.strip()
+        if l.startswith(self.indent_mark):
+            self.enter_block()
+            return None
+        
+        if l.startswith(self.dedent_mark):
+            self.leave_block()
+            return None
+        
+        if self.indent==0:
+            return line+"\n"
+        
+        return (self.indent_item*self.indent)+l+"\n"
+        
     def reformat(self, txt):        
-        lines = txt.split('\n')
-        output = ""        
-        for line in lines:
-            l=line.strip()
-            if l.startswith(self.indent_mark):
-                self.enter_block()
-                continue
-            
-            if l.startswith(self.dedent_mark):
-                self.leave_block()
-                continue
-            
-            if self.indent==0:
-                output+=line+"\n"
-            else:
-                output+=(self.indent_item*self.indent)+l+"\n"
-                
-        return output
+        output = []
+        e = Emitter(output.append, self)
+        e.write(txt)
+        e.close()
+        return "".join(output)
        
+class Emitter:
+    """Writes formatted code as it's produced.  Each line is indented by the formatter as it passes
+    through, so the output never has to be held as a whole.  A line split across writes is held
+    until its end arrives.  out is called with each piece of formatted text, for example the write
+    method of a file."""
+    def __init__(self, out, formatter):
+        self.out = out
+        self.formatter = formatter
+        self.pending = ""
+        
+    def write(self, txt):
+        lines = (self.pending+txt).split("\n")
+        self.pending = lines.pop()
+        formatted = [self.formatter.format_line(line) for line in lines]
+        self.out("".join([line for line in formatted if line!=None]))
+        
+    def writeChunks(self, chunks):
+        for chunk in chunks:
+            self.write(chunk)
+            
+    def close(self):
+        "Writes the last line, which always ends with a newline like every other."
+        line = self.formatter.format_line(self.pending)
+        if line!=None:
+            self.out(line)
+        self.pending = ""
+        
+
 convert_comment_char = { "semicolon" : ";",
 		      	   	     "hash"      : "#",
 		      	   	     "colon"     : ":" }
@@ -115,6 +153,10 @@ class Generator:
         # The dictionary of framework transforms, struct defs, function defs, etc.
         self.frames = {}
         
+        #  Dictionary of (type name, op) to the op transform found for it by get_transform, or
+        # None if there is none.
+        self.transform_table = {}
+        
         # The dictionary of settings from the *.conf file.
         self.settings = {}
         
@@ -135,7 +177,13 @@ class Generator:
                 id: an id that is globally unique to each translation unit. May be (and should be)
                 used for uniqifying labels or other items inside transforms. 
         """
-                
+        self.add_transform_entries(d)
+                       
+        # Render the compiled transform
+        return transform_parse.render(t, d).strip()
+        
+   def add_transform_entries(self, d):
+        "Adds the entries every transform has to d, and gives it a new id."
         d["nl"] = "\n"
         d["tab"] = "\t"
         d["id"] = self.transform_id
@@ -143,14 +191,12 @@ class Generator:
         d["char_type"]=self.get_char_type()
                 
         self.transform_id+=1   
-                       
-        # Preprocess the transform
-        t = transform_parse.preprocess(t,d)
         
-        # Run the filters             
-        t = transform_parse.filter(t,d)        
-         
-        return t.strip()
+   def iter_transform(self, d, t):
+        """Like transform, but yields the result in pieces.  Values of d that are
+        transform_parse.Chunks are yielded an item at a time instead of being joined first."""
+        self.add_transform_entries(d)
+        return transform_parse.strip_chunks(transform_parse.iter_render(t, d))
         
    def get_type_name(self, type_info, log):
         "Returns the name of the type for the target language. MUST be overridden."
@@ -194,37 +240,62 @@ class Generator:
         self.word_type = typesys.type.UINT32
         self.char_type = typesys.type.UINT8
             
-        # Create parser objects for the templates
-        o_parser = ops_parse.OperationsParser()
-        f_parser = frame_parse.FrameworkParser()
-        
-        # Get the filename for the operations template
+        # Get the filenames for the operations and framework templates
         ops_filename = os.path.join(self.path, self.ops_filename)
+        frame_filenames = [os.path.join(self.path, name) for name in self.framework_files]
         
-        # Parse the operations template         
-        self.ops = o_parser.parse(ops_filename, log)
-        
-        # Get and parse the files for the framework templates
-        f_parser.set_comment(self.comment)
-        for name in self.framework_files:
-            filename = os.path.join(self.path, name)
-            f_parser.parse(filename, log)
+        #  Use the templates already parsed in this process or cached by an earlier run, unless
+        # one of the files changed.  The comment character comes from the configuration file.
+        filenames = [conf_filename, ops_filename]+frame_filenames
+        backend = transform_cache.load(self.backend, filenames)
+        if backend==None:
+            files = transform_cache.stamp_files(filenames)
+            
+            # Create parser objects for the templates
+            o_parser = ops_parse.OperationsParser()
+            f_parser = frame_parse.FrameworkParser()
+            
+            # Parse the operations template         
+            o_parser.parse(ops_filename, log)
+            
+            # Get and parse the files for the framework templates
+            f_parser.set_comment(self.comment)
+            for filename in frame_filenames:
+                f_parser.parse(filename, log)
+            
+            backend = transform_cache.store(self.backend, files, o_parser.get_dictionary(), f_parser.get_dictionary())
+            
+        # The backend is shared by every generator, each gets dictionaries of its own.
+        self.ops = dict([(name, dict(odt)) for name, odt in backend.ops.items()])
+        self.frames = dict(backend.frames)
+        self.build_transform_table()
         
-        # Get the dictionary from the framework parser.
-        self.frames = f_parser.get_dictionary()
+   def build_transform_table(self):
+        "Fills in the transform table for every type tier and op."
+        self.transform_table = {}
+        all_ops = set()
+        for odt in self.ops.values():
+            all_ops.update(odt.keys())
+            
+        for tier in set(type_tiers.keys()+self.ops.keys()):
+            for the_op in all_ops:
+                self.transform_table[(tier+"_t", the_op)] = self.find_transform(tier, the_op)
         
         
    def get_register(self):
         self.register+=1
         return "r%d" % self.register
     
-   def get_transform(self, opr_type, the_op):
-        "Gets a transform for an operation on a primitive type."
-        # Assume that the primitive type has a trailing _t
-        opr_type = opr_type[:-2]
-        
-        print "transform operator type: ", opr_type
+   def get_transform(self, opr_type, the_op, log=None):
+        """Gets a transform for an operation on a primitive type from the transform table.  Types
+        that aren't in it have no transforms."""
+        if log!=None and log.ignore_level<err.TRACE:
+            log.trace(None, "transform operator type: %s" % opr_type[:-2])
+            
+        return self.transform_table.get((opr_type, the_op), None)
         
+   def find_transform(self, opr_type, the_op):
+        "Finds the transform for an operation on a type tier, stepping up the tiers until one has it."
         while 1:
             # Get the dictionary for operation transforms
             if opr_type in self.ops:
@@ -262,8 +333,20 @@ class Generator:
    def transform_module(self, is_target, m, log):
        """Transform a module.  If is_target is true, then this module is the code target for this
        run through the generator.  That means we generate functions and type_t structures.  Otherwise
-       we generate type information for structs and extern function pointers, but no executable code."""
-                             
+       we generate type information for structs and extern function pointers, but no executable code.
+       Returns the code and the documentation, which is None unless is_target is true."""
+       output = []
+       doc = self.emit_module(is_target, m, output.append, log)
+       return ("".join(output), doc)
+       
+   def emit_module(self, is_target, m, out, log):
+       """Transforms a module like transform_module, but calls out with each piece of the formatted
+       code as it's produced instead of returning it.  out can be the write method of a file.
+       Returns the documentation."""
+       # The ids start again for each module, so its labels don't depend on what was generated before.
+       self.transform_id = 0
+       self.require_type_info(m, log)
+       
        structs = self.transform_structs(m, set(), m.structs, log)
        consts  = self.transform_constants(m, log)
        globs   = self.transform_globals(m, log)
@@ -271,26 +354,69 @@ class Generator:
        
        # Setup the module transform
        mf = self.frames["module"]
-       d  = { "struct_definitions" : "\n".join(structs),
+       d  = { "struct_definitions" : transform_parse.Chunks(structs),
 			  "object_definitions" : "",
-			  "constants"          : "\n".join(consts),
-			  "globals" 	   	   : "\n".join(globs),
-			  "func_declarations"  : "\n".join(f_decl),
-			  "func_definitions"   : "\n".join(f_def),
+			  "constants"          : transform_parse.Chunks(consts),
+			  "globals" 	   	   : transform_parse.Chunks(globs),
+			  "func_declarations"  : transform_parse.Chunks(f_decl),
+			  "func_definitions"   : transform_parse.Chunks(f_def),
 		    }
        
-       # Transform and reformat the template
-       return (self.formatter.reformat(self.transform(d, mf)),
-			   self.document_module(m, log) if is_target else None)    
+       # Transform and format the template as it's rendered
+       e = Emitter(out, self.formatter)
+       e.writeChunks(self.iter_transform(d, mf))
+       e.close()
+       
+       return self.document_module(m, log) if is_target else None
        
+   def require_type_info(self, m, log):
+        """Defines the type info of every struct the module makes values of: the struct typed
+        constants and globals, including the ones this adds, and the struct values built or cast
+        to in their initializers and in the function blocks.  With builtins.TYPE_INFO_ALL it is
+        all defined already."""
+        if typesys.builtins.isTypeInfoEager():
+            return
+        
+        #  The expressions are flattened into one graph, shared subtrees once, and swept in order.
+        # Requiring type info can add constants and globals, so their initializers are added and
+        # swept until there are no new ones.
+        g = graph.new()
+        for fd in m.funcs.values():
+            for b in [fd.require_block, fd.mainline_block, fd.ensure_block]:
+                if b!=None:
+                    for e in b.init.values() + b.code:
+                        if isinstance(e, expr.Expr):
+                            g.add(e)
+                    
+        done = set()
+        swept = 0
+        while True:
+            pending = [v for v in m.constants.values() + m.global_vars.values() if id(v) not in done]
+            if len(pending)==0 and swept==len(g):
+                break
+            
+            for v in pending:
+                done.add(id(v))
+                if v.type_info.isStruct():
+                    m.requireTypeInfo(v.type_info)
+                if isinstance(v.initializer, expr.Expr):
+                    g.add(v.initializer)
+                    
+            first, swept = swept, len(g)
+            for t in g.structTypes(first):
+                m.requireTypeInfo(t)
+                
    def transform_structs(self, m, processed, to_process, log):
+        """Transforms the structs named in to_process that aren't in processed, each after the
+        structs it depends on.  A cycle needs no declaration, named types can be used before their
+        definition."""
         struct_transforms = []
         stf = self.frames["struct"]        
-        for item in to_process:              
-            st_def = m.structs[item]
-            if item not in processed:                                
+        graph = m.getStructGraph()
+        for item in graph.order:              
+            if item in to_process and item not in processed:                                
                 processed.add(item)    
-                d = { "name" : item, "struct_type" : self.get_struct_sig(st_def, log) }
+                d = { "name" : item, "struct_type" : self.get_struct_sig(m.structs[item], log) }
                 struct_transforms.append(self.transform(d, stf))
             
         return struct_transforms
@@ -298,12 +424,22 @@ class Generator:
    def transform_constants(self, m, log):
        consts=[]
    
-       csf = self.frames["raw_string_constant"]
-       idx=0
-       for s in m.string_table:
-           d={"name" : "SC%d" % idx, "length" : len(s), "value" : s}
-           consts.append(self.transform(d, csf))
-           idx+=1        
+       #  Strings that are the tail of another one are stored inside it.  Once the modules are
+       # linked each string is stored by one of them, and the others refer to it.
+       table = m.string_table
+       if table.isLinked():
+           lsf = self.frames["linked_string_constant"]
+           esf = self.frames["external_string_constant"]
+           for owner, is_stored in table.getLinkedOwners():
+               s = table.pool[owner]
+               d={"name" : "LSC%d" % owner, "length" : len(s), "value" : s}
+               consts.append(self.transform(d, lsf if is_stored else esf))
+       else:
+           csf = self.frames["raw_string_constant"]
+           for idx, s in enumerate(table):
+               if table.isOwner(idx):
+                   d={"name" : "SC%d" % idx, "length" : len(s), "value" : s}
+                   consts.append(self.transform(d, csf))
        
        csf = self.frames["string_constant"]
        for item in m.constants:
@@ -312,8 +448,37 @@ class Generator:
             	d = { "initialized_string_object" : self.get_initialized_string_object(m, const_def.initializer, True),
 					  "name"                      : const_def.name }            	
             	consts.append(self.transform(d, csf))  
+       
+       # Numeric initializer lists are packed and emitted as one array constant each.
+       acf = self.frames["array_constant"]
+       for item in m.constants:
+            const_def = m.constants[item]
+            if isinstance(const_def.initializer, expr.InitializerList):
+                elem_type = const_def.type_info.id if const_def.type_info.id in batch.format_chars else None
+                packed = batch.pack_initializer_list(const_def.initializer, m, elem_type)
+                if packed!=None:
+                    d = { "name"      : const_def.name,
+                          "length"    : packed.count,
+                          "elem_type" : self.get_type_name(typesys.type.intern(packed.type_id), log),
+                          "values"    : self.get_array_constant(packed, log) }
+                    consts.append(self.transform(d, acf))
             
        return consts
+       
+   def get_string_placement(self, m, str_index):
+        """Returns (name, text, offset), where string str_index of the module is stored at offset in
+        the text of the string constant name.  Linked modules use the strings of the whole build."""
+        table = m.string_table
+        if table.isLinked():
+            owner, offset = table.getLinkedPlacement(str_index)
+            return "LSC%d" % owner, table.pool[owner], offset
+        
+        owner, offset = table.getPlacement(str_index)
+        return "SC%d" % owner, table[owner], offset
+        
+   def get_array_constant(self, packed, log):
+        "Returns the initializer for an array constant holding the values of a batch.PackedArray. MUST be overridden."
+        pass
    
    def transform_globals(self, m, log):
        globs=[]
@@ -19,9 +19,11 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #$endlicense
 
+import struct
 import types
 
 import gen
+import typesys.builtins
 import typesys.const
 import typesys.struct
 import typesys.type
@@ -50,6 +52,14 @@ class LLVMGen(gen.Generator):
     def __init__(self):
         gen.Generator.__init__(self, 'llvm')
         
+    def add_transform_entries(self, d):
+        "Also adds the field indices and the size of string_t, which the string ops address it with."
+        gen.Generator.add_transform_entries(self, d)
+        st = typesys.builtins.STRING_STRUCT
+        d["string_length_field"] = st.getFieldIndex("length")
+        d["string_data_field"] = st.getFieldIndex("data")
+        d["string_size"] = st.getLayout().size
+        
     def get_word_type(self):
         return type_map[self.word_type]
     
@@ -64,7 +74,7 @@ class LLVMGen(gen.Generator):
         "Returns the signature of a structure."
         stf = self.frames["struct_type"] if not st.isPacked() else self.frames["packed_struct_type"]
         members=[]
-        for item in st.members:
+        for item in st.getFieldNames():
             t = st.member_types[item]
             members.append(self.get_type_name(t, log))
         
@@ -102,20 +112,34 @@ class LLVMGen(gen.Generator):
                 
         return tname
        
+    def get_array_constant(self, packed, log):
+        "Returns the initializer for an array constant holding the values of a batch.PackedArray."
+        elem_type = type_map[packed.type_id]
+        values = packed.getValues()
+        if packed.type_id==typesys.type.BOOL:
+            values = ["true" if v else "false" for v in values]
+        elif packed.type_id in typesys.type.FLOATS:
+            # LLVM takes floating point constants exactly, as the hex of their double value.
+            values = ["0x%016X" % struct.unpack("<Q", struct.pack("<d", v))[0] for v in values]
+            
+        return "[%s]" % ", ".join(["%s %s" % (elem_type, v) for v in values])
+       
     def get_initialized_string_object(self, m, str_index, is_const):
         d = {}
         flags = 0 if not is_const else typesys.builtins.STR_FLAG_CONST
         the_str = m.getString(str_index)
+        name, owner_str, offset = self.get_string_placement(m, str_index)
         
         # Assign out the values to the correct places
         st_def = m.getStructDef("string_t")
         d = { "flags"  : "$(flags)",
                "length" : "$(length)",
-               "data"   :  "getelementptr([$(length) x $(char_type)]* @$(name), i32 0, i32 0)"}
+               "data"   :  "getelementptr([$(owner_length) x $(char_type)]* @$(name), i32 0, i32 $(offset))"}
         tmpl = self.get_initializer_for_struct(m, st_def, d, None)
         
         # Transform and return
-        d={"flags" : str(flags), "length" : str(len(the_str)), "name" : "SC%d" % str_index}
+        d={"flags" : str(flags), "length" : str(len(the_str)), "name" : name,
+           "owner_length" : str(len(owner_str)), "offset" : str(offset)}
         return self.transform(d, tmpl)     
     
     def get_initializer_for_struct(self, m, st_def, init, log):
@@ -133,7 +157,7 @@ class LLVMGen(gen.Generator):
         
         d = {}
         for item in init:
-            idx = st_def.getMemberIndex(item)
+            idx = st_def.getFieldIndex(item)
             type_name = self.get_type_name(st_def.getMemberType(item), log)
             value = init[item]
             if m.hasMember(value):
@@ -142,11 +166,11 @@ class LLVMGen(gen.Generator):
                 d[idx] = "%s %s" % (type_name, value)
             
         tmp = []
-        for i in range(0, len(st_def.members)):
+        for i, name in enumerate(st_def.getFieldNames()):
             if i in d:
                 tmp.append(d[i])
             else:
-                tmp.append("%s zeroinitializer" % self.get_type_name(st_def.getMemberTypebyIndex(i), log))
+                tmp.append("%s zeroinitializer" % self.get_type_name(st_def.getMemberType(name), log))
                         
         return "{%s}" % ",".join(tmp)
                        
@@ -156,6 +180,9 @@ class LLVMGen(gen.Generator):
         wt = self.get_word_type()
         ct = self.get_char_type()
         
+        length_idx = typesys.builtins.STRING_STRUCT.getFieldIndex("length")
+        data_idx = typesys.builtins.STRING_STRUCT.getFieldIndex("data")
+        
         t1 = self.get_register()
         t2 = self.get_register()
         t3 = self.get_register()
@@ -163,12 +190,12 @@ class LLVMGen(gen.Generator):
         # Make space on the stack
         mkspace = """
             ; Copy the metal string and make it into a c-string.
-            %s = getelementptr %%type.metal_string_t *%s, %s 0, %s 1
+            %s = getelementptr %%type.metal_string_t *%s, %s 0, %s %d
             %s = load %s *%s
             %s = add  %s %s, 1
             %s = alloca %s, %s %s
             call void @llvm.memset.i32(i8 *%s, i8 0, i32 %s, i32 0) 
-        """ % (t1, input, wt, wt, 
+        """ % (t1, input, wt, wt, length_idx,
                t2, wt, t1, 
                t3, wt, t2, 
                output, ct, wt, t3,
@@ -178,11 +205,11 @@ class LLVMGen(gen.Generator):
         t5 = self.get_register()
         # Perform the copy
         copy = """
-            %s = getelementptr %%type.metal_string_t *%s, %s 0, %s 2
+            %s = getelementptr %%type.metal_string_t *%s, %s 0, %s %d
             %s = load %s **%s
             call void @llvm.memcpy.i32(i8 *%s, i8 *%s, i32 %s, i32 0)
             ; End copy into a c-string.
-        """ % (t4, input, wt, wt,
+        """ % (t4, input, wt, wt, data_idx,
                t5, ct, t4, 
                output, t5, t2)
         
@@ -199,10 +226,10 @@ class LLVMGen(gen.Generator):
         # Perform the copy
         thunk = """
             ; Thunk a string to a raw memory buffer.
-            %s=getelementptr %%type.metal_string_t *%s, %s 0, %s 2            
+            %s=getelementptr %%type.metal_string_t *%s, %s 0, %s %d            
             %s = load %s **%s
             ; End thunk
-        """ % (t1, input, wt, wt, 
+        """ % (t1, input, wt, wt, typesys.builtins.STRING_STRUCT.getFieldIndex("data"),
                output, ct, t1)
         
         return (output, thunk)
@@ -289,4 +316,4 @@ class LLVMGen(gen.Generator):
 def new():
     "Return a new instance of an LLVM generator."
     return LLVMGen()
-    
\ No newline at end of file
+    
\ No newline at end of file
@@ -1 +1,3 @@
 from test_llvm_gen import *
+from test_transform import *
+from test_transform_cache import *
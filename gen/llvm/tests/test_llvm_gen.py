@@ -5,11 +5,16 @@ import time
 import unittest
 
 import err
+import expr
 import gen
+import typesys.block
 import typesys.builtins
 import typesys.const
+import typesys.strings
 import typesys.struct
 import typesys.func
+import typesys.globalvar
+import typesys.module
 import typesys.type
 
 class TestLLVMGen(unittest.TestCase):
@@ -43,6 +48,9 @@ class TestLLVMGen(unittest.TestCase):
         
         typesys.builtins.initialize_module(self.m)
         
+    def tearDown(self):
+        typesys.builtins.setTypeInfoMode(typesys.builtins.TYPE_INFO_ALL)
+        
     def llvm_compile(self, filename):
         if sys.platform=="win32":
             cmd =r"f:\projects\llvm\Debug\bin\llvm-as -d -debug -f %s" % filename            
@@ -64,8 +72,169 @@ class TestLLVMGen(unittest.TestCase):
         
     def testLoadTransforms(self):
         self.assertNotEqual(len(self.gen.frames), 0)
+        
+    def testArrayConstant(self):
+        "Numeric initializer lists are emitted as a single array constant."
+        loc=err.location("unittest::testArrayConstant", 1, 1)
+        elems = [expr.Binary("*", loc, (expr.newInt(loc, i), expr.newInt(loc, 1000))) for i in range(0, 4)]
+        self.m.addConstant(typesys.const.new("TABLE", typesys.type.new("uint32_t", loc), expr.InitializerList(loc, elems, 4)))
+        
+        floats = [expr.newFloat(loc, 0.5), expr.newFloat(loc, 1.0)]
+        self.m.addConstant(typesys.const.new("HALVES", typesys.type.new("float64_t", loc), expr.InitializerList(loc, floats, 2)))
+        
+        elems = [expr.Binary("*", loc, (expr.newInt(loc, 100), expr.newInt(loc, 1000))), expr.newInt(loc, 7)]
+        self.m.addConstant(typesys.const.new("WIDE", typesys.type.new("uint32_t", loc), expr.InitializerList(loc, elems, 2)))
+        
+        consts = "\n".join(self.gen.transform_constants(self.m, self.log))
+        self.assertTrue("@TABLE = internal constant [4 x i32] [i32 0, i32 1000, i32 2000, i32 3000]" in consts, consts)
+        self.assertTrue("@WIDE = internal constant [2 x i32] [i32 100000, i32 7]" in consts, consts)
+        
+        # Generating doesn't fold the module's own trees.
+        self.assertTrue(self.m.constants["WIDE"].initializer.value[0] is elems[0])
+        self.assertTrue("@HALVES = internal constant [2 x double] [double 0x3FE0000000000000, double 0x3FF0000000000000]" in consts, consts)
                 
         
+    def testStringSuffix(self):
+        "A string constant that ends another one points into it instead of being stored again."
+        loc=err.location("unittest::testStringSuffix", 1, 1)
+        self.m.addConstant(typesys.const.new("SUFFIX", typesys.type.newStruct(typesys.builtins.STRING_STRUCT, loc), "string for you"))
+        
+        owner = self.m.string_table.indices["this is a test string for you"]
+        consts = "\n".join(self.gen.transform_constants(self.m, self.log))
+        self.assertFalse('c"string for you"' in consts, consts)
+        self.assertTrue("@SC%d, i32 0, i32 15)" % owner in consts, consts)
+        
+    def testLinkedStrings(self):
+        "Linked modules store each string once across the build and refer to the other modules' strings."
+        loc=err.location("unittest::testLinkedStrings", 1, 1)
+        other = typesys.module.new("other_module")
+        typesys.builtins.initialize_module(other)
+        other.addConstant(typesys.const.new("TAIL", typesys.type.newStruct(typesys.builtins.STRING_STRUCT, loc), "string for you"))
+        other.addConstant(typesys.const.new("OWN", typesys.type.newStruct(typesys.builtins.STRING_STRUCT, loc), "only here"))
+        pool = typesys.strings.link([self.m.string_table, other.string_table])
+        
+        owner = pool.indices["this is a test string for you"]
+        consts = "\n".join(self.gen.transform_constants(self.m, self.log))
+        self.assertTrue('@LSC%d = constant [29 x i8] c"this is a test string for you"' % owner in consts, consts)
+        
+        consts = "\n".join(self.gen.transform_constants(other, self.log))
+        self.assertTrue("@LSC%d = external constant [29 x i8]" % owner in consts, consts)
+        self.assertTrue("@LSC%d, i32 0, i32 15)" % owner in consts, consts)
+        self.assertTrue('@LSC%d = constant [9 x i8] c"only here"' % pool.indices["only here"] in consts, consts)
+        self.assertFalse('c"string for you"' in consts, consts)
+        
+    def testStringFields(self):
+        "The string ops and initializers address string_t through its field order and layout."
+        st = typesys.builtins.STRING_STRUCT
+        d = {"type" : "%type.metal_string_t *", "child" : "%s", "result" : "%len"}
+        code = self.gen.transform(dict(d), self.gen.get_transform("string_t", "sizeof"))
+        self.assertTrue("i32 0, i32 1\n" in code, code)
+        
+        st.field_order = ["length", "data", "flags"]
+        st.field_index = dict([(name, idx) for idx, name in enumerate(st.field_order)])
+        st.layout = None
+        code = self.gen.transform(dict(d), self.gen.get_transform("string_t", "sizeof"))
+        self.assertTrue("i32 0, i32 0\n" in code, code)
+        
+        code = self.gen.transform({"result" : "%s", "name" : "copy", "prefix" : "", "type" : "%type.metal_string_t *"},
+                                  self.gen.get_transform("string_t", "init"))
+        self.assertTrue("i32 %d, i32 0)" % st.getLayout().size in code, code)
+        
+        d = { "initialized_string_object" : self.gen.get_initialized_string_object(self.m, self.const1.initializer, False),
+              "name"                      : "var" }
+        code = self.gen.transform(d, self.gen.frames["global_string_variable"])
+        self.assertTrue(code.startswith("@var  = global %type.metal_string_t {i32 29,i8 * getelementptr("), code)
+        self.assertTrue(code.endswith(",i32 0}"), code)
+        
+    def testStructOrder(self):
+        "Structs are defined after the structs they hold, and each only once even in a cycle."
+        loc=err.location("unittest::testStructOrder", 1, 1)
+        self.st2.addMember("back", typesys.type.newStructRef(self.st1, loc))
+        self.m.bindMembers(self.log)
+        
+        structs = "\n".join(self.gen.transform_structs(self.m, set(), self.m.structs, self.log))
+        self.assertFalse("opaque" in structs, structs)
+        self.assertEqual(structs.count("%type.test_struct_type_1 = type"), 1, structs)
+        self.assertTrue(structs.index("%type.test_struct_type_2 = type {") < structs.index("%type.test_struct_type_1 = type {"), structs)
+        
+    def testEmitModule(self):
+        "Streaming the module gives the same code as formatting it all at once."
+        self.m.bindMembers(self.log)
+        output, doc = self.gen.transform_module(True, self.m, self.log)
+        
+        g = gen.new("llvm")
+        g.load_transforms(self.log)
+        f_decl, f_def = g.transform_functions(self.m, self.log)
+        d = { "struct_definitions" : "\n".join(g.transform_structs(self.m, set(), self.m.structs, self.log)),
+              "object_definitions" : "",
+              "constants"          : "\n".join(g.transform_constants(self.m, self.log)),
+              "globals"            : "\n".join(g.transform_globals(self.m, self.log)),
+              "func_declarations"  : "\n".join(f_decl),
+              "func_definitions"   : "\n".join(f_def) }
+        self.assertEqual(output, g.formatter.reformat(g.transform(d, g.frames["module"])))
+        
+        # The labels of a module don't depend on what the generator did before.
+        self.assertEqual(self.gen.transform_module(True, self.m, self.log)[0], output)
+        
+    def testReachableTypeInfo(self):
+        "With reachable type info the structs the module makes values of get theirs, the others don't."
+        loc=err.location("unittest::testReachableTypeInfo", 1, 1)
+        typesys.builtins.setTypeInfoMode(typesys.builtins.TYPE_INFO_REACHABLE)
+        m = typesys.module.new("test_module")
+        typesys.builtins.initialize_module(m)
+        
+        inner = typesys.struct.new("inner", loc)
+        inner.addMember("value", typesys.type.new("uint16_t", loc))
+        held = typesys.struct.new("held", loc)
+        held.addMember("child", typesys.type.new("inner", loc))
+        unused = typesys.struct.new("unused", loc)
+        built = typesys.struct.new("built", loc)
+        for st in [inner, held, unused, built]:
+            m.addStruct(st)
+        m.bindMembers(self.log)
+        m.addGlobal(typesys.globalvar.new("instance", typesys.type.newStruct(held, loc), {}))
+        
+        # A struct only constructed in a function block needs its type info too.
+        f = typesys.func.new("make", loc)
+        b = typesys.block.Block(loc, "make_block")
+        b.addBasicBlock(expr.StructConstructor(loc, built, expr.newInt(loc, 0)))
+        f.setMainlineBlock(b)
+        m.addFunc(f)
+        
+        output, doc = self.gen.transform_module(True, m, self.log)
+        for name in ["held_type", "inner_type", "uint16_t_type", "built_type"]:
+            self.assertTrue(name in m.global_vars, name)
+            self.assertTrue("@%s " % name in output, name)
+        self.assertFalse("unused_type" in m.global_vars)
+        self.assertFalse("@unused_type " in output, output)
+        
+    def testEmitter(self):
+        "Lines split across writes are indented like whole ones."
+        text = "  first\n$indent$\n   second\n  third\n$dedent$\nlast"
+        chunks = []
+        e = gen.Emitter(chunks.append, gen.Formatter())
+        for i in range(0, len(text), 3):
+            e.write(text[i:i+3])
+        e.close()
+        
+        self.assertEqual("".join(chunks), gen.Formatter().reformat(text))
+        self.assertEqual("".join(chunks), "  first\n\tsecond\n\tthird\nlast\n")
+        
+    def testGetTransform(self):
+        "Transforms come from the most specific tier that has the op."
+        self.assertEqual(self.gen.get_transform("uint8_t", "+"), self.gen.ops["number"]["+"])
+        self.assertEqual(self.gen.get_transform("sint32_t", ">>"), self.gen.ops["integer"][">>"])
+        self.assertEqual(self.gen.get_transform("string_t", "cast"), self.gen.ops["string"]["cast"])
+        self.assertEqual(self.gen.get_transform("uint8_t", "no such op"), None)
+        
+        # Types that aren't tiers have no transforms, and looking them up doesn't change the table.
+        count = len(self.gen.transform_table)
+        self.assertEqual(self.gen.get_transform("my_struct_t", "+", self.log), None)
+        self.assertEqual(len(self.gen.transform_table), count)
+        
+        for (opr_type, the_op), t in self.gen.transform_table.items():
+            self.assertEqual(t, self.gen.find_transform(opr_type[:-2], the_op))
+        
     def testGenCode(self):
         self.m.bindMembers(self.log)
         
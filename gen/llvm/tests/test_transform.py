@@ -0,0 +1,92 @@
+import sys
+import unittest
+
+import err
+import gen
+import typesys.builtins
+import typesys.type
+
+from gen import transform_parse
+
+class Holder:
+    "A condition value with attributes."
+    def __init__(self, flag):
+        self.flag = flag
+
+class TestTransform(unittest.TestCase):
+    def setUp(self):
+        self.log = err.new(sys.stderr)
+        self.log.setIgnoreLevel(err.TRACE)
+        
+        self.gen = gen.new("llvm")
+        self.gen.load_transforms(self.log)
+        
+        typesys.type.setMachineSizes(self.gen.word_type, self.gen.char_type)
+        typesys.builtins.initialize()
+        
+    def render(self, text, d):
+        return transform_parse.compile(text).render(dict(d, id=1))
+        
+    def testDirectives(self):
+        text = """$!if (outer)
+outer $(a|prefix %)
+$!if (inner.flag)inner $(b|postfix !)$!else not inner $(missing)$!endif
+$!else
+$!create_label TMP
+not outer $(TMP) $!prefix_label TMP % $(TMP)
+$!endif
+$(a|strip) $!endif"""
+        d = { "outer" : "", "inner" : Holder(1), "a" : " value ", "b" : 7 }
+        self.assertEqual(self.render(text, d), "\n\nnot outer %L1_0 %L1_0\n\nvalue $!endif")
+        
+        d["outer"] = "yes"
+        self.assertEqual(self.render(text, d), "\nouter % value \ninner 7!\n\nvalue $!endif")
+        
+        d["inner"] = Holder(0)
+        self.assertEqual(self.render(text, d), 
+                         "\nouter % value \n not inner !!! ERROR missing DOES NOT EXIST IN TRANSFORM DICT !!!\n\nvalue $!endif")
+                
+    def testUnclosed(self):
+        "Directives without an end are left as text."
+        self.assertEqual(self.render("before $!if (1) kept $(a) $!else too", { "a" : 1 }), "before $!if (1) kept 1 $!else too")
+        self.assertEqual(self.render("$(a", { "a" : 1 }), "$(a")
+        
+    def testNestedValues(self):
+        "Placeholders in values are filled in too."
+        self.assertEqual(self.render("x $(a) y", { "a" : "[$(b)]", "b" : "$(c|prefix %)", "c" : "d" }), "x [%d] y")
+        
+    def testFrames(self):
+        "Every backend template renders with its directives carried out."
+        d = { "name" : "n", "result" : "%r1", "left" : "%r2", "right" : "%r3", "type" : "i32", "leaf" : "x",
+              "word_type" : "i32", "char_type" : "i8", "is_tail_call" : 1 }
+        for text in self.gen.frames.values():
+            self.assertFalse("$!" in self.render(text, d), text)
+        for ops in self.gen.ops.values():
+            for text in ops.values():
+                self.assertFalse("$!" in self.render(text, d), text)
+                
+    def testLabels(self):
+        "Labels come from the transform id, so they are unique in the unit and the same on every run."
+        text = "$!create_label A $!create_label B $(A) $(B) $!prefix_label B % $(B)"
+        self.assertEqual(transform_parse.render(text, { "id" : 7 }), "  L7_0 %L7_1 %L7_1")
+        self.assertRaises(KeyError, transform_parse.render, text, {})
+        
+        outputs = []
+        for i in range(0, 2):
+            g = gen.new("llvm")
+            g.load_transforms(self.log)
+            outputs.append([g.transform({}, text) for j in range(0, 3)])
+            
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(len(set(outputs[0])), 3)
+        
+    def testCache(self):
+        "Backend templates are compiled once, other text isn't kept."
+        text = self.gen.frames["struct"]
+        t = transform_parse.templates[text]
+        self.gen.transform({ "name" : "a", "struct_type" : "{ i32 }" }, text)
+        self.assertTrue(transform_parse.templates[text] is t)
+        
+        count = len(transform_parse.templates)
+        self.assertEqual(transform_parse.render("uncached $(a)", { "a" : 1 }), "uncached 1")
+        self.assertEqual(len(transform_parse.templates), count)
@@ -0,0 +1,104 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import err
+import gen
+
+from gen import frame_parse
+from gen import transform_cache
+from gen import transform_parse
+
+class TestTransformCache(unittest.TestCase):
+    def setUp(self):
+        self.log = err.new(sys.stderr)
+        self.log.setIgnoreLevel(err.TRACE)
+        
+        # Work on a copy of the backend files, with a cache of its own.
+        self.path = tempfile.mkdtemp()
+        self.rte_path = os.path.join(self.path, "llvm")
+        shutil.copytree("lib/rte/llvm", self.rte_path)
+        
+        self.old_cache_path = transform_cache.cache_path
+        self.old_loaded = transform_cache.loaded
+        transform_cache.setCachePath(os.path.join(self.path, "cache"))
+        transform_cache.loaded = {}
+        
+        self.old_parse = frame_parse.FrameworkParser.parse
+        self.parsed = []
+        
+    def tearDown(self):
+        frame_parse.FrameworkParser.parse = self.old_parse
+        transform_cache.setCachePath(self.old_cache_path)
+        transform_cache.loaded = self.old_loaded
+        shutil.rmtree(self.path)
+        
+    def load(self):
+        "Returns a generator with the transforms loaded from the copy, and counts the frame files parsed."
+        parsed = self.parsed
+        old_parse = self.old_parse
+        def parse(parser, filename, log):
+            parsed.append(filename)
+            return old_parse(parser, filename, log)
+        frame_parse.FrameworkParser.parse = parse
+        
+        g = gen.new("llvm")
+        g.path = self.rte_path
+        g.load_transforms(self.log)
+        return g
+        
+    def testShared(self):
+        "Generators in one process share the loaded templates, each with dictionaries of its own."
+        g1 = self.load()
+        count = len(self.parsed)
+        self.assertNotEqual(count, 0)
+        
+        g2 = self.load()
+        self.assertEqual(len(self.parsed), count)
+        self.assertEqual(g2.frames, g1.frames)
+        self.assertEqual(g2.ops, g1.ops)
+        
+        g1.frames["struct"] = "changed"
+        g1.ops["string"]["cast"] = "changed"
+        self.assertNotEqual(g2.frames["struct"], "changed")
+        self.assertNotEqual(g2.ops["string"]["cast"], "changed")
+        self.assertNotEqual(self.load().ops["string"]["cast"], "changed")
+        
+    def testCacheFile(self):
+        "A later run loads the templates, and their compiled forms, from the cache directory."
+        frames = self.load().frames
+        count = len(self.parsed)
+        
+        transform_cache.loaded = {}
+        transform_parse.templates.clear()
+        g = self.load()
+        self.assertEqual(len(self.parsed), count)
+        self.assertEqual(g.frames, frames)
+        self.assertTrue(frames["struct"] in transform_parse.templates)
+        
+    def testMemoryOnly(self):
+        "Without a cache directory nothing is written."
+        transform_cache.setCachePath(None)
+        self.load()
+        self.assertFalse(os.path.exists(os.path.join(self.path, "cache")))
+        
+    def testChanged(self):
+        "Touching a file keeps the cache, changing it parses again."
+        self.load()
+        count = len(self.parsed)
+        
+        filename = os.path.join(self.rte_path, "struct.llvm")
+        later = time.time()+10
+        os.utime(filename, (later, later))
+        self.load()
+        self.assertEqual(len(self.parsed), count)
+        
+        f = open(filename, "a")
+        f.write("\nextra_frame\n${\nextra\n$}\n")
+        f.close()
+        g = self.load()
+        self.assertNotEqual(len(self.parsed), count)
+        self.assertEqual(g.frames["extra_frame"], "extra")
@@ -0,0 +1,150 @@
+"""Caches the parsed templates of the backends.  The ops and frame dictionaries of a backend, with
+their templates compiled, are kept for the rest of the process once they are loaded.  When a cache
+directory is set they are also written to it, so later runs can load them without parsing.  Both are only used while the
+configuration and template files are unchanged.  A file whose modification time or size changed
+is hashed again, so touching a file doesn't throw the cache away."""
+
+import cPickle
+import hashlib
+import os
+import tempfile
+
+import transform_parse
+
+#  The version of the cached representation.  Cached backends of other versions are parsed again,
+# so change this whenever the parsers or the compiled templates change.
+FORMAT = 1
+
+def default_path():
+    "Returns the suggested cache directory."
+    return os.path.join(os.path.expanduser("~"), ".metalc", "templates")
+
+# The directory the parsed templates are cached in, or None to only keep them in memory.
+cache_path = None
+
+def setCachePath(path):
+    global cache_path
+    cache_path = path
+
+# Dictionary of backend name to the Backend loaded in this process.
+loaded = {}
+
+def file_hash(filename):
+    "Returns the sha1 of the contents of filename."
+    f = open(filename, "rb")
+    digest = hashlib.sha1(f.read()).hexdigest()
+    f.close()
+    return digest
+
+def stamp_files(filenames):
+    """Returns a dictionary of the absolute name of each file to its (modification time, size, hash),
+    or None if one of them can't be read."""
+    files = {}
+    try:
+        for filename in filenames:
+            st = os.stat(filename)
+            files[os.path.abspath(filename)] = (st.st_mtime, st.st_size, file_hash(filename))
+    except (IOError, OSError):
+        return None
+
+    return files
+
+class Backend:
+    "The parsed templates of a backend, and the state of the files they were parsed from."
+    def __init__(self, files, ops, frames):
+        # Dictionary of file name to (modification time, size, hash), from stamp_files.
+        self.files = files
+
+        # The parsed ops and frames dictionaries
+        self.ops = ops
+        self.frames = frames
+
+        # Dictionary of template text to its compiled transform_parse.Template
+        self.templates = {}
+        for text in self.getTexts():
+            self.templates[text] = transform_parse.compile(text)
+
+    def getTexts(self):
+        "Returns the text of every frame and op template."
+        texts = self.frames.values()
+        for ops in self.ops.values():
+            texts.extend(ops.values())
+        return texts
+
+    def isFrom(self, filenames):
+        "Returns True if this was parsed from the files as they are now."
+        if sorted(self.files.keys())!=sorted([os.path.abspath(filename) for filename in filenames]):
+            return False
+
+        for filename, (mtime, size, digest) in self.files.items():
+            try:
+                st = os.stat(filename)
+                if (st.st_mtime, st.st_size)==(mtime, size):
+                    continue
+                if st.st_size!=size or file_hash(filename)!=digest:
+                    return False
+            except (IOError, OSError):
+                return False
+
+            self.files[filename] = (st.st_mtime, size, digest)
+
+        return True
+
+    def install(self):
+        "Adds the compiled templates to the ones transform_parse renders with."
+        transform_parse.templates.update(self.templates)
+
+def cache_filename(name):
+    return os.path.join(cache_path, "%s.templates" % name)
+
+def load(name, filenames):
+    """Returns the Backend called name if it was parsed from the files as they are now, from this
+    process or from the cache directory.  Returns None if it has to be parsed."""
+    backend = loaded.get(name, None)
+    if backend==None and cache_path!=None:
+        try:
+            f = open(cache_filename(name), "rb")
+            try:
+                version, backend = cPickle.load(f)
+            finally:
+                f.close()
+            if version!=FORMAT:
+                backend = None
+        except Exception:
+            # Missing, or written by an incompatible version.
+            backend = None
+
+    if backend==None or not backend.isFrom(filenames):
+        return None
+
+    loaded[name] = backend
+    backend.install()
+    return backend
+
+def store(name, files, ops, frames):
+    """Returns a Backend for the parsed ops and frames, which were parsed from files, the result of
+    stamp_files.  It's kept for the rest of the process and written to the cache directory."""
+    backend = Backend(files or {}, ops, frames)
+    backend.install()
+    if files==None:
+        return backend
+
+    loaded[name] = backend
+    if cache_path==None:
+        return backend
+
+    # Write to a temporary file and rename it so readers never see a partial cache.
+    try:
+        if not os.path.isdir(cache_path):
+            os.makedirs(cache_path)
+
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=cache_path)
+        f = os.fdopen(fd, "wb")
+        cPickle.dump((FORMAT, backend), f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp, cache_filename(name))
+    except (IOError, OSError):
+        # The cache is only an optimization.
+        pass
+
+    return backend
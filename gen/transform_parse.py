@@ -19,28 +19,17 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #$endlicense
 
-import random
 import re
 import types
 
-if_expr = re.compile(r"\$\!if\s*\((?P<cond>[a-zA-Z0-9._]+)\)", re.MULTILINE)
-else_expr = re.compile(r"\$\!else")
-endif_expr = re.compile(r"\$\!endif")
+# Matches every directive and placeholder, for compiling templates.
+directive_expr = re.compile(r"(?P<if>\$\!if\s*\((?P<cond>[a-zA-Z0-9._]+)\))|(?P<else>\$\!else)|(?P<endif>\$\!endif)|"
+                            r"(?P<create>\$\!create_label\s+(?P<create_name>[a-zA-Z0-9_]+))|"
+                            r"(?P<prefix>\$\!prefix_label\s+(?P<prefix_name>[a-zA-Z0-9_]+)\s(?P<val>.+?)\s)|"
+                            r"(?P<filter>\$\((?P<filter_text>[^)]*)\))")
 
-# Switch is not currently implemented.  Not sure if it's really needed yet.
-switch_expr = re.compile(r"\$\!switch\s*\((?P<cond>[a-zA-Z0-9._]+)\)")
-case_expr   = re.compile(r"\$\!case\s+(?P<value>[a-zA-Z0-9_.]+):")
-default_expr = re.compile(r"\$\!default:")
-endswitch_expr = re.compile(r"\$\!endswitch")
-end_expr = re.compile(r"\$\!end")
-
-create_label_expr = re.compile(r"\$\!create_label\s+(?P<name>[a-zA-Z0-9_]+)")
-prefix_label_expr = re.compile(r"\$\!prefix_label\s+(?P<name>[a-zA-Z0-9_]+)\s(?P<val>.+?)\s")
-
-filter_expr = re.compile(r"\$\(")
-filter_end_expr = re.compile(r"\)")
-
-g_salt=0
+# Matches the placeholders in a value.
+placeholder_expr = re.compile(r"\$\((?P<text>[^)]*)\)")
 
 class Filter:
     def __init__(self, value):
@@ -63,172 +52,269 @@ class Filter:
     def slice(self, start, end):
         self.value=self.value[start:end]
 
-def parse_if(text, d,start=0):
-    "Parses if/else/endif expressions.  Fully nestable."
+def eval_cond(cond, d):
+    "Returns the truth of an if condition, which is a number or a dotted name looked up in d."
+    try:
+        return long(cond.strip())!=0
+    except ValueError:
+        pass
+    
+    cond=cond.split('.')
+    if not d.has_key(cond[0].strip()):
+        return False
+    
+    cv=d[cond[0].strip()]
+    cond.pop(0)
+    
+    # Recursively resolve the condition parameter
+    for cond_item in cond:
+        if hasattr(cv, cond_item):
+            cv=getattr(cv, cond_item)
+    
+    # Get it's truth value.        
+    if type(cv) == types.StringType:
+        return len(cv)!=0
+    return bool(cv)
+
+def make_label(d, idx):
+    """Returns the label for the idx'th $!create_label of the transform with the dictionary d.  The
+    label is made from the transform's "id" entry, which d must have.  The id is unique in the
+    translation unit, so the same input always gets the same labels."""
+    return "L%s_%d" % (d["id"], idx)
+
+class Chunks:
+    """A transform dictionary value made of many strings, like every struct of a module.  Streamed
+    rendering writes the strings one at a time with sep between them instead of joining them."""
+    def __init__(self, items, sep="\n"):
+        self.items = items
+        self.sep = sep
+        
+    def __iter__(self):
+        first = True
+        for item in self.items:
+            if not first:
+                yield self.sep
+            first = False
+            yield item
             
-    m=if_expr.search(text, start)
-    if m!=None:        
-        start=m.end()
-        text=parse_if(text, d, start)
-                        
-        else_m = else_expr.search(text, start)
-        if else_m!=None:
-            if_body = text[start:else_m.start()]
-            start=else_m.end()
-            text=parse_if(text, d, start)
+    def __str__(self):
+        return self.sep.join(self.items)
+    
+class Placeholder:
+    "A $(key|filter args|...) placeholder."
+    def __init__(self, text):
+        filter_chain = text.split('|')
+        self.key = filter_chain.pop(0).strip()
+        
+        # The list of (filter name, arguments)
+        self.filters = []
+        for item in filter_chain:
+            parts = item.split(" ")
+            self.filters.append((parts[0], parts[1:]))
             
-        endif_m = endif_expr.search(text, start)
-        if endif_m==None:
-            return text # Forgot the endif, so don't bother continuing.
+    def render(self, d):
+        if not d.has_key(self.key):
+            return "!!! ERROR %s DOES NOT EXIST IN TRANSFORM DICT !!!" % self.key
         
-        if else_m==None:
-            if_body=text[start:endif_m.start()]
+        if len(self.filters)==0:
+            value = str(d[self.key])
         else:
-            else_body=text[start:endif_m.start()]
-            
-        # Evaluate the condition
-        cond=m.group("cond")
-        cond_pass=False
-        try:
-            value=long(cond.strip())
-            if value!=0:
-                cond_pass=True
-        except ValueError:
-            cond=cond.split('.')
-            if d.has_key(cond[0].strip()):
-                cv=d[cond[0].strip()]
-                cond.pop(0)
-                
-                # Recursively resolve the condition parameter
-                for cond_item in cond:
-                    if hasattr(cv, cond_item):
-                        cv=getattr(cv, cond_item)
+            f=Filter(d[self.key])
+            for name, args in self.filters:
+                if hasattr(f, name):
+                    getattr(f, name)(*args)
+            value = f.getValue()
                 
-                # Get it's truth value.        
-                if type(cv) == types.StringType:
-                    if len(cv): cond_pass=True
-                else:
-                    if cv: cond_pass=True
-                    
-        if cond_pass:
-            return text[:m.start()] + if_body + text[endif_m.end():]
-        else:
-            if else_m!=None:
-                return text[:m.start()] + else_body + text[endif_m.end():]
-            else:
-                return text[:m.start()] + text[endif_m.end():]
-            
-    else: # No if expressions
-        return text
-
-def parse_create_label(text, d):
-    "Dynamically creates labels in the dictionary."  
-    global g_salt
-      
-    while 1:
-        item = create_label_expr.search(text)
-        if item==None: break
-        
-        label_name = item.group("name")
-        d[label_name] = "L%s_%s" % (str(random.randint(0,1000)), str(g_salt))
-        text = text[:item.start()] + text[item.end():]
-        g_salt+=1
-        
-    return text
-
-def parse_prefix_label(text, d):
-    "Prefixes labels with the given value."
-    while 1:
-        item = prefix_label_expr.search(text)
-        if item==None: break
-        
-        prefix_info = item.group("val")
-        label_name  = item.group("name")
+        # Values that hold placeholders are expanded too.
+        if "$(" in value:
+            value = expand(value, d)
+        return value
+    
+    def iterRender(self, d):
+        "Yields the value in pieces when it is unfiltered Chunks, otherwise all at once."
+        value = d.get(self.key, None)
+        if not isinstance(value, Chunks) or len(self.filters):
+            yield self.render(d)
+            return
         
-        v=d[label_name]
-        if not v.startswith(prefix_info):
-            d[label_name]=prefix_info+v
+        for item in value:
+            yield expand(item, d) if "$(" in item else item
         
-        text = text[:item.start()] + text[item.end():]
+def expand(text, d):
+    "Fills in the placeholders of a value.  Values aren't compiled, they change with every transform."
+    return placeholder_expr.sub(lambda m: Placeholder(m.group("text")).render(d), text)
         
-    return text
-
-
-def filter(text,d,start=0):
-    "Replaces all the $(var) transforms in the file, potentially processing them with filters."    
-    while start<len(text):
-        m=filter_expr.search(text,start)
-        if m==None: break
+class Conditional:
+    "An $!if (cond) ... $!else ... $!endif block."
+    def __init__(self, text, cond):
+        # The text of the directive, kept in case the block is never closed.
+        self.text = text
+        self.cond = cond
+        self.true_nodes = []
+        self.false_nodes = None
         
-        end_m = filter_end_expr.search(text, m.end())
-        if end_m==None: break # error - no end to the filter
+    def select(self, d, nodes):
+        "Appends the nodes of the branch taken to nodes."
+        branch = self.true_nodes if eval_cond(self.cond, d) else (self.false_nodes or [])
+        select_nodes(branch, d, nodes)
         
-        filter_text = text[m.end():end_m.start()]
-        filter_chain = filter_text.split('|')
+class CreateLabel:
+    "A $!create_label name directive."
+    def __init__(self, name):
+        self.name = name
         
-        key = filter_chain[0].strip()
-        filter_chain.pop(0)
+class PrefixLabel:
+    "A $!prefix_label name value directive."
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
         
-        #print key, filter_chain
+def select_nodes(nodes, d, selected):
+    "Appends the nodes, with conditionals replaced by the nodes of the branch they take, to selected."
+    for node in nodes:
+        if isinstance(node, Conditional):
+            node.select(d, selected)
+        else:
+            selected.append(node)
+    
+class Template:
+    """A compiled template.  The text is parsed once into literal strings, placeholders, labels and
+    conditionals, so rendering is a pass over the parts and a single join."""
+    def __init__(self, nodes):
+        self.nodes = nodes
         
-        # If the key exists, process it
-        if d.has_key(key):
-            value=d[key]
-            # Now run the filter chain
-            f=Filter(value)
+        # True if the template has conditionals or labels, which need a pass before rendering.
+        self.has_directives = False
+        for node in nodes:
+            if isinstance(node, (Conditional, CreateLabel, PrefixLabel)):
+                self.has_directives = True
+                
+    def render(self, d):
+        "Returns the template text with the directives carried out and the placeholders filled in from d."
+        return "".join(self.iterRender(d))
+    
+    def iterRender(self, d):
+        "Yields the rendered template text in pieces."
+        nodes = self.nodes
+        if self.has_directives:
+            nodes = []
+            select_nodes(self.nodes, d, nodes)
             
-            for item in filter_chain:
-                parts=item.split(" ")
-                name=parts[0]; parts.pop(0)
-                if hasattr(f, name):
-                    fn=getattr(f,name)
-                    fn(*parts)
+            # Labels are made, then prefixed, before any placeholder is filled in.
+            count = 0
+            prefixes = []
+            for node in nodes:
+                if isinstance(node, CreateLabel):
+                    d[node.name] = make_label(d, count)
+                    count+=1
+                elif isinstance(node, PrefixLabel):
+                    prefixes.append(node)
                     
-            value=f.getValue()
-            text=text[:m.start()]+value+text[end_m.end():]    
-        else:
-            text=text[:m.start()]+("!!! ERROR %s DOES NOT EXIST IN TRANSFORM DICT !!!"%key)+text[end_m.end():]
-                   
-        
-        start=m.start()
-           
-         
-    return text
+            for node in prefixes:
+                if not d[node.name].startswith(node.value):
+                    d[node.name] = node.value+d[node.name]
+                    
+        for node in nodes:
+            if type(node) == types.StringType:
+                yield node
+            elif isinstance(node, Placeholder):
+                for part in node.iterRender(d):
+                    yield part
     
+def branch_nodes(stack, top):
+    "Returns the list the nodes being compiled are added to, the open branch of the innermost conditional."
+    if len(stack)==0:
+        return top
+    if stack[-1].false_nodes!=None:
+        return stack[-1].false_nodes
+    return stack[-1].true_nodes
 
-def preprocess(text, d):
-    text = parse_if(text,d)
-    text = parse_create_label(text,d)
-    text = parse_prefix_label(text,d)
-    
-    return text                                
-  
-if __name__=="__main__":
-    if_test = """
-    $!if (1)
-      outer 1
-      $!if (1)
-         inner 1/1
-      $!else
-         inner 1/0
-      $!endif
-    $!else      
-      outer 0
-      $!if (1)
-         inner 0/1
-      $!else
-         inner 0/0
-      $!endif
-    $!endif"""
-        
-    print parse_if(if_test, {})
+def compile(text):
+    "Parses the template text into a Template."
+    top = []
     
-    filter_test="""  
-    %type.metal_string_t = type
-    {
-     $(word_type|prefix %),      ;reference
-     $(word_type|postfix %),      ;length
-     $(char_type) *     ;str
-    };"""
+    # The stack of open conditionals
+    stack = []
     
-    print filter(filter_test, {"word_type" : "i32", "char_type" : "i8 *"})
\ No newline at end of file
+    pos = 0
+    for m in directive_expr.finditer(text):
+        nodes = branch_nodes(stack, top)
+        if m.start()>pos:
+            nodes.append(text[pos:m.start()])
+        pos = m.end()
+        
+        if m.group("if")!=None:
+            cond = Conditional(m.group("if"), m.group("cond"))
+            nodes.append(cond)
+            stack.append(cond)
+            
+        elif m.group("else")!=None and len(stack) and stack[-1].false_nodes==None:
+            stack[-1].false_nodes = []
+            
+        elif m.group("endif")!=None and len(stack):
+            stack.pop()
+            
+        elif m.group("create")!=None:
+            nodes.append(CreateLabel(m.group("create_name")))
+            
+        elif m.group("prefix")!=None:
+            nodes.append(PrefixLabel(m.group("prefix_name"), m.group("val")))
+            
+        elif m.group("filter")!=None:
+            nodes.append(Placeholder(m.group("filter_text")))
+            
+        else:
+            # An else or endif without an if is left as text.
+            nodes.append(m.group(0))
+            
+    if pos<len(text):
+        branch_nodes(stack, top).append(text[pos:])
+        
+    # Conditionals that are never closed are left as text, with their contents.
+    while len(stack):
+        cond = stack.pop()
+        parent = branch_nodes(stack, top)
+        unclosed = [cond.text]+cond.true_nodes
+        if cond.false_nodes!=None:
+            unclosed+=["$!else"]+cond.false_nodes
+        parent[-1:] = unclosed
+        
+    return Template(top)
+
+#  Dictionary of the text of each backend template to its compiled Template, filled in by
+# transform_cache as the backends are loaded.  Other text is compiled every time it's rendered,
+# so this only grows with the backends.
+templates = {}
+
+def get_template(text):
+    "Returns the compiled template for text, compiling it unless it is a backend template."
+    t = templates.get(text, None)
+    if t==None:
+        t = compile(text)
+    return t
+
+def render(text, d):
+    "Renders the template text with d."
+    return get_template(text).render(d)
+
+def iter_render(text, d):
+    "Yields the template text rendered with d in pieces."
+    return get_template(text).iterRender(d)
+
+def strip_chunks(chunks):
+    "Yields the chunks without the whitespace at the start and the end of their joined text."
+    started = False
+    held = ""
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            if len(chunk)==0:
+                continue
+            started = True
+            
+        stripped = chunk.rstrip()
+        if len(stripped):
+            yield held+stripped
+            held = chunk[len(stripped):]
+        else:
+            held+=chunk
@@ -0,0 +1,6 @@
+import sys
+
+import driver
+
+if __name__=="__main__":
+    sys.exit(driver.main(sys.argv[1:]))
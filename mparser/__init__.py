@@ -1,6 +1,9 @@
 import tests
+import lexer
 import literals
+import packrat
 import stream
+import tokenizer
 
-__all__ = ["literals", "stream"]
+__all__ = ["lexer", "literals", "packrat", "stream", "tokenizer"]
 
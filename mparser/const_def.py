@@ -0,0 +1,38 @@
+"""This module parses out constant definitions from an input stream"""
+
+from __future__ import with_statement
+
+import expr
+import typesys
+import typesys.const
+import typesys.type
+
+from mparser import common
+from mparser import exprs
+from mparser import literals
+from mparser import type_def
+
+const_kw  = lambda s, log: literals.l_keyword("const", s, log)
+assign_kw = lambda s, log: literals.l_keyword(":=", s, log)
+
+const_rules = [ (const_kw, literals.ONE),
+                (type_def.type_kw, literals.ONE),
+                (literals.l_ident, literals.ONE),
+                (assign_kw, literals.ONE),
+                (exprs.const_expr, literals.ONE),
+                (common.semicolon, literals.ONE) ]
+
+def const_def(s, log):
+    "Parse a constant definition like 'const uint32_t NAME := 5;', return a typesys constant for it."
+    d = literals.rule_chain(const_rules, s, log)
+    if d==None:
+        return None
+    
+    kw, type_name, name, assign, value, semicolon = d
+    type_info = typesys.type.new(type_name["value"], type_name["loc"])
+    
+    # String constants are initialized from the raw string, which the module puts in its string table.
+    if type_info.isString() and value.op=="lit":
+        value = value.value
+        
+    return typesys.const.new(name["ident"], type_info, value)
@@ -7,18 +7,21 @@ import typesys
 import types
 
 from mparser import common
+from mparser import lexer
 from mparser import literals
 
 
 ##################################################################
 # Matching expressions for constant binary expressions
 bin_operations =     ["+","-","/","*","%","^","&","|","."]
+bin_operations_kw = lexer.compile_keywords(bin_operations)
 bin_expr_operands = [literals.l_float_expr,
                      literals.l_int_expr,                
                      literals.l_string_expr,
-                     literals.l_bool_expr,]
+                     literals.l_bool_expr,
+                     literals.l_ident_expr,]
 
-bin_expr_operation_kw = lambda s, log: literals.any_keyword(bin_operations, s, log)    
+bin_expr_operation_kw = lambda s, log: literals.any_keyword(bin_operations_kw, s, log)    
 bin_expr_operand = lambda s, log: literals.any_rule(bin_expr_operands, s, log)
 bin_expr_recurse = lambda s, log: literals.rule_chain([(bin_expr_operation_kw, literals.ONE),
                                                        (bin_expr_operand, literals.ONE)], s, log)
@@ -0,0 +1,328 @@
+"""Incremental reparsing of a source file.  The file is split into top-level declarations using
+its token table.  After an edit, tokens are relexed from the last declaration before the edit
+until they fall back in step with the old tokens, and only the declarations in that range are
+reparsed.  The declarations after it keep their definitions, and their locations, which are
+relative to the declaration they were parsed in.
+
+An edit costs the size of the edit, plus the declarations and tokens between it and the last
+edit.  The declarations, tokens and newlines after an edit are moved by changing the shift they
+all refer to, rather than one by one."""
+
+import bisect
+import os
+
+import typesys.const
+import typesys.func
+import typesys.globalvar
+import typesys.module
+import typesys.object
+import typesys.struct
+
+from mparser import const_def
+from mparser import literals
+from mparser import stream
+from mparser import tokenizer
+
+#  The rules tried on each top-level declaration.  Structs, types and functions belong here
+# once their parsers exist.
+declaration_rules = [const_def.const_def]
+
+def parse_declaration(s, log):
+    "Parses a top-level declaration. Returns the typesys definition, or None if no rule matched."
+    return literals.any_rule(declaration_rules, s, log)
+
+class Shift:
+    "How far a run of declarations has moved since they were parsed, in characters and lines."
+    def __init__(self):
+        self.chars = 0
+        self.lines = 0
+        
+# The shift of the declarations that haven't moved.  It never changes.
+NO_SHIFT = Shift()
+
+class Declaration:
+    """A top-level declaration: its span in the text, the line it starts on and its definition.
+    It is the origin of the locations made parsing it.  Its positions are stored less the shift
+    they refer to, so moving it is a change to the shift."""
+    def __init__(self, file, start, end, line):
+        self.file = file
+        self.shift = NO_SHIFT
+        self.base_start = start
+        self.base_end = end
+        self.base_line = line
+        self.definition = None
+        
+    start = property(lambda self: self.base_start+self.shift.chars)
+    end   = property(lambda self: self.base_end+self.shift.chars)
+    line  = property(lambda self: self.base_line+self.shift.lines)
+    
+    def setShift(self, shift):
+        "Makes the declaration's positions relative to shift instead, without moving it."
+        chars = self.shift.chars-shift.chars
+        lines = self.shift.lines-shift.lines
+        self.base_start+=chars
+        self.base_end+=chars
+        self.base_line+=lines
+        self.shift = shift
+        
+class ParseResult:
+    """The result of parsing a file: the text, its token table and newline offsets, the
+    declarations in order and the module holding their definitions."""
+    def __init__(self, text, filename, tokens, newlines, module, parse_decl):
+        self.text = text
+        self.filename = filename
+        self.tokens = tokens
+        self.newlines = newlines
+        self.module = module
+        self.parse_decl = parse_decl
+        self.decls = []
+        
+        #  The declarations from number gap on refer to the tail shift, and every other one to
+        # NO_SHIFT.  An edit moves the declarations after it by moving the gap to them and
+        # changing the tail shift.
+        self.gap = 0
+        self.tail = Shift()
+        
+        #  The number of declarations the edit that made this result reparsed, and the number of
+        # the others it visited moving the gap.
+        self.reparsed = 0
+        self.visited = 0
+        
+    def newStream(self):
+        """Returns a token stream over the text that reuses our token table and newline offsets.
+        Rule results are memoized, so backtracking into a rule at the same place doesn't reparse
+        it."""
+        s = stream.TokenStream()
+        s.load(self.text, self.filename, self.tokens, self.newlines)
+        s.enableMemo()
+        return s
+    
+    def find(self, offset):
+        "Returns the number of the first declaration that ends at or after offset."
+        decls = self.decls
+        lo = 0
+        hi = len(decls)
+        while lo<hi:
+            mid = (lo+hi)//2
+            if decls[mid].end<offset:
+                lo = mid+1
+            else:
+                hi = mid
+                
+        return lo
+    
+    def moveGap(self, idx):
+        "Makes the declarations from number idx on the ones that refer to the tail shift.  Returns how many it visited."
+        for decl in self.decls[idx:self.gap]:
+            decl.setShift(self.tail)
+        for decl in self.decls[self.gap:idx]:
+            decl.setShift(NO_SHIFT)
+            
+        visited = abs(idx-self.gap)
+        self.gap = idx
+        return visited
+    
+    def parseSpan(self, s, start, end, log):
+        "Parses the declaration between start and end, returns a Declaration for it."
+        decl = Declaration(self.filename, start, end, s.getRowCol(start)[0])
+        s.setMarker(start)
+        s.origin = decl
+        decl.definition = self.parse_decl(s, log)
+        s.origin = None
+        
+        # Nothing parses at these positions again, and the definition may be changed from now on.
+        if s.memo!=None:
+            s.memo.invalidate()
+        return decl
+
+def find_newlines(text):
+    "Returns the offsets of the newlines in text."
+    newlines = []
+    nl = text.find("\n")
+    while nl!=-1:
+        newlines.append(nl)
+        nl = text.find("\n", nl+1)
+        
+    return newlines
+
+def scan_declarations(text, tokens, idx):
+    """Yields the (start, end) span of each top-level declaration, starting at token number idx.
+    A declaration ends with a ';' outside of braces, or with the '}' closing its outermost brace
+    and an optional ';' after it.  Import statements have no terminator, so they end after the
+    last imported name."""
+    kinds = tokens.kinds
+    starts = tokens.starts
+    lengths = tokens.lengths
+    count = len(starts)
+    
+    depth = 0
+    start = None
+    while idx<count:
+        pos = starts[idx]
+        end = pos+lengths[idx]
+        if start==None:
+            start = pos
+            if kinds[idx]==tokenizer.IDENT and text[pos:end] in ("import", "from"):
+                idx = skip_import(text, tokens, idx)
+                yield (start, starts[idx-1]+lengths[idx-1])
+                start = None
+                continue
+            
+        idx+=1
+        if kinds[idx-1]!=tokenizer.OP:
+            continue
+        
+        c = text[pos]
+        if c=="{":
+            depth+=1
+        elif c=="}" and depth>0:
+            depth-=1
+            if depth==0:
+                if idx<count and kinds[idx]==tokenizer.OP and text[starts[idx]]==";":
+                    end = starts[idx]+1
+                    idx+=1
+                    
+                yield (start, end)
+                start = None
+        elif c==";" and depth==0:
+            yield (start, end)
+            start = None
+            
+    # An unterminated declaration runs to the end of the tokens.
+    if start!=None:
+        yield (start, starts[count-1]+lengths[count-1])
+        
+def skip_import(text, tokens, idx):
+    """Skips an import statement, 'import A, B' or 'from package import A, B', that starts at token
+    number idx.  Returns the number of the token after it."""
+    kinds = tokens.kinds
+    starts = tokens.starts
+    count = len(starts)
+    
+    idx+=1
+    while idx<count and kinds[idx]==tokenizer.IDENT:
+        idx+=1
+        if idx<count and kinds[idx]==tokenizer.OP and text[starts[idx]]==",":
+            idx+=1
+        elif idx<count and kinds[idx]==tokenizer.IDENT and text[starts[idx]:starts[idx]+tokens.lengths[idx]]=="import":
+            idx+=1
+        else:
+            break
+        
+    return idx
+        
+def add_definition(m, the_def):
+    "Adds a parsed definition to the module, whatever kind it is."
+    if isinstance(the_def, typesys.struct.Struct):
+        m.addStruct(the_def)
+    elif isinstance(the_def, typesys.func.Func):
+        m.addFunc(the_def)
+    elif isinstance(the_def, typesys.const.Constant):
+        m.addConstant(the_def)
+    elif isinstance(the_def, typesys.globalvar.GlobalVar):
+        m.addGlobal(the_def)
+    elif isinstance(the_def, typesys.object.Object):
+        m.addObject(the_def)
+        
+def remove_definition(m, the_def):
+    "Removes a definition added by add_definition from the module."
+    if isinstance(the_def, typesys.struct.Struct):
+        m.removeStruct(the_def.name)
+    elif isinstance(the_def, typesys.func.Func):
+        m.removeFunc(the_def.name)
+    elif isinstance(the_def, typesys.const.Constant):
+        m.removeConstant(the_def.name)
+    elif isinstance(the_def, typesys.globalvar.GlobalVar):
+        m.removeGlobal(the_def.name)
+    elif isinstance(the_def, typesys.object.Object):
+        m.removeObject(the_def.name)
+    
+def parse(text, filename, log, name=None, parse_decl=parse_declaration):
+    """Parses the whole text.  Returns a ParseResult whose module is named name, or after the
+    file if no name is given."""
+    if name==None:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        
+    tokens = tokenizer.tokenize(text)
+    newlines = tokenizer.Offsets(find_newlines(text))
+    result = ParseResult(text, filename, tokens, newlines, typesys.module.new(name), parse_decl)
+    
+    s = result.newStream()
+    for start, end in scan_declarations(text, tokens, 0):
+        result.decls.append(result.parseSpan(s, start, end, log))
+        
+    for decl in result.decls:
+        add_definition(result.module, decl.definition)
+        
+    result.gap = len(result.decls)
+    result.reparsed = len(result.decls)
+    return result
+
+def reparse(prev, start, end, replacement, log):
+    """Applies an edit that replaces the text between start and end with replacement, and returns
+    a new ParseResult.  Declarations and tokens that the edit cannot have changed are reused from
+    prev, and prev's module, token table and declarations are updated in place, so prev must not
+    be used afterwards."""
+    old = prev.text
+    text = old[:start]+replacement+old[end:]
+    delta = len(replacement)-(end-start)
+    lines = replacement.count("\n")-old.count("\n", start, end)
+    new_end = start+len(replacement)
+    
+    decls = prev.decls
+    lo = prev.find(start)
+    
+    # The last declaration may be unterminated, so an edit after it can still change it.
+    if lo>0 and lo==len(decls):
+        lo-=1
+        
+    relex_from = decls[lo-1].end if lo>0 else 0
+    
+    # Relex from the end of the last declaration before the edit, until a token starts where an
+    # old token (after the edit) starts.  From there on the old tokens are still right.
+    tokens = prev.tokens
+    first, resync = tokenizer.relex(tokens, text, relex_from, end, delta)
+    resync_pos = tokens.starts[resync] if resync<len(tokens) else len(text)
+    
+    # Splice the newline offsets the same way.
+    newlines = prev.newlines
+    newlines.splice(bisect.bisect_left(newlines, start), bisect.bisect_left(newlines, end), 
+                    [start+nl for nl in find_newlines(replacement)], delta)
+    
+    result = ParseResult(text, prev.filename, tokens, newlines, prev.module, prev.parse_decl)
+    result.decls = decls
+    result.gap = prev.gap
+    result.tail = prev.tail
+    
+    #  Rescan the declarations from the same place.  Once a declaration past the relexed tokens
+    # lines up with an old one, and starts in the same column, the rest are reused.
+    s = result.newStream()
+    added = []
+    k = lo
+    reuse = len(decls)
+    for span_start, span_end in scan_declarations(text, tokens, first):
+        if span_start>=resync_pos:
+            while k<len(decls) and decls[k].start+delta<span_start:
+                k+=1
+            if k<len(decls) and decls[k].start+delta==span_start and decls[k].end+delta==span_end:
+                if span_start-text.rfind("\n", 0, span_start)==span_start-delta-old.rfind("\n", 0, span_start-delta):
+                    reuse = k
+                    break
+                
+        added.append(result.parseSpan(s, span_start, span_end, log))
+        
+    for decl in decls[lo:reuse]:
+        remove_definition(result.module, decl.definition)
+        
+    for decl in added:
+        add_definition(result.module, decl.definition)
+        
+    # The declarations after the reparsed ones, and their locations, move with the tail shift.
+    result.visited = result.moveGap(reuse)
+    result.tail.chars+=delta
+    result.tail.lines+=lines
+    
+    decls[lo:reuse] = added
+    result.gap = lo+len(added)
+    result.reparsed = len(added)
+    return result
@@ -0,0 +1,113 @@
+"""Compiles the character class patterns used by mparser.literals into regular expressions, and
+matches them directly against the buffer of a BufferStream.  This replaces the peek/read loop of
+the character at a time matchers with a single regex match per literal."""
+
+import re
+
+# Matches a run of whitespace.
+whitespace_expr = re.compile(r"\s*")
+
+#  The patterns of number literals.  The tokenizer is built from the same ones, so a number is
+# split into tokens the same way the literal matchers split it.
+int_pattern = r"0[xX][0-9a-fA-F]+|[0-9]+"
+float_pattern = r"[0-9]+\.[0-9]*"
+
+# Matches a decimal or hexadecimal integer.
+int_expr = re.compile(int_pattern)
+
+# Matches a decimal floating point value.  The fractional digits are optional.
+float_expr = re.compile(float_pattern)
+
+# Compiled chains, keyed on the tuple of character classes.
+compiled_chains = {}
+
+def char_class(acceptable):
+    "Returns the body of a regex character class that matches any of the characters in acceptable."
+    return "".join([re.escape(c) for c in acceptable])
+
+def compile_chain(chain):
+    """Compiles a chain of character classes, like ["a-z_", "a-z0-9_"], into a regular expression.
+    The first class must match at least once, the rest match zero or more times."""
+    key = tuple(chain)
+    rx = compiled_chains.get(key, None)
+    if rx==None:
+        parts = []
+        for idx in range(0, len(chain)):
+            parts.append("[%s]%s" % (char_class(chain[idx]), "+" if idx==0 else "*"))
+            
+        rx = compiled_chains[key] = re.compile("".join(parts))
+        
+    return rx
+
+def match(rx, s, kind=None):
+    """Skips leading whitespace and matches rx at the stream position.  On a match the stream is
+    advanced past it and the matched text is returned.  Otherwise the stream is left alone and None
+    is returned.  If the stream has a token table and a token of the given kind starts there, the
+    token is taken as the match without running rx."""
+    buf = s.buffer
+    start = s.skipOffset(s.pos)
+    
+    tokens = s.tokens
+    if kind!=None and tokens!=None:
+        idx = tokens.find(start)
+        if idx!=-1 and tokens.kinds[idx]==kind:
+            s.pos = start+tokens.lengths[idx]
+            return buf[start:s.pos]
+    
+    m = rx.match(buf, start)
+    if m==None:
+        return None
+    
+    s.pos = m.end()
+    return m.group()
+
+class KeywordTrie:
+    "A trie of keywords, used to find the longest keyword at a position in a single pass."
+    def __init__(self, keywords):
+        # The keywords in the trie.
+        self.keywords = list(keywords)
+        
+        #  The root node.  Each node is a dictionary of character to child node.  The key None
+        # marks the end of a keyword and maps to the keyword itself.
+        self.root = {}
+        
+        for kw in self.keywords:
+            node = self.root
+            for c in kw:
+                node = node.setdefault(c, {})
+            node[None] = kw
+            
+    def __repr__(self):
+        return "KeywordTrie(%s)" % " ".join(self.keywords)
+            
+    def match(self, buf, pos):
+        "Returns (keyword, end offset) for the longest keyword found in buf at pos, or None."
+        node = self.root
+        found = None
+        end = len(buf)
+        while True:
+            if None in node:
+                found = (node[None], pos)
+                
+            if pos>=end:
+                break
+            
+            node = node.get(buf[pos], None)
+            if node==None:
+                break
+            
+            pos+=1
+            
+        return found
+    
+# Compiled tries, keyed on the tuple of keywords.
+compiled_keywords = {}
+
+def compile_keywords(kw_list):
+    "Returns a KeywordTrie for the keywords in the list.  Tries are compiled once and shared."
+    key = tuple(kw_list)
+    trie = compiled_keywords.get(key, None)
+    if trie==None:
+        trie = compiled_keywords[key] = KeywordTrie(kw_list)
+        
+    return trie
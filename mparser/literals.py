@@ -4,16 +4,41 @@ import expr
 import string
 import typesys
 
+import lexer
+import tokenizer
+
 ONE=0
 ONE_OR_MORE=1
 ZERO_OR_MORE=2
 ZERO_OR_ONE=3
 
+def apply_rule(rule, s, log, *args):
+    """Runs rule(*args, s, log).  If the stream has a packrat cache, the result for this rule and
+    these arguments at this position is looked up first, and remembered afterwards."""
+    memo=s.memo
+    if memo==None:
+        return rule(*(args+(s, log)))
+    
+    key=(rule,)+args if args else rule
+    pos=s.getMarker()
+    entry=memo.get(key, pos)
+    if entry!=None:
+        s.setMarker(entry[1])
+        return entry[0]
+    
+    d=rule(*(args+(s, log)))
+    memo.put(key, pos, d, s.getMarker())
+    return d
+
 def any_literal(acceptable, s, log):
     "Matches patterns like [a-zA-Z] or [0-9]"
+    loc=s.getLoc()
+    if s.buffer!=None:
+        lit=lexer.match(lexer.compile_chain([acceptable]), s)
+        return { "value" : lit, "loc" : loc } if lit!=None else None
+    
     lit=""
     cont=True
-    loc=s.getLoc()
     
     with s:
        while cont:                
@@ -31,6 +56,11 @@ def any_literal(acceptable, s, log):
    
 def any_literal_chain(chain, s, log):
     "Matches chains of any literal strings. Like [A-Za-z_]+[A-Za-z0-9]*"
+    if s.buffer!=None:
+        loc=s.getLoc()
+        value=lexer.match(lexer.compile_chain(chain), s)
+        return { "value" : value, "loc" : loc } if value!=None else None
+    
     r=[]; idx=-1
     for pattern in chain:
         idx+=1
@@ -76,16 +106,44 @@ def l_keyword(kw, s, log):
            
     
 
-def any_keyword(kw_list, s, log):
-    "Matches any keyword in the list."    
-    for kw in kw_list:
-        result =  l_keyword(kw, s, log)
-        if result != None:
-            return result
+def l_keyword_trie(trie, s, log):
+    "Matches the longest keyword in a lexer.KeywordTrie, returns the keyword and location dictionary."
+    loc=s.getLoc()
+    if s.buffer!=None:
+        buf=s.buffer
+        found=trie.match(buf, s.skipOffset(s.pos))
+        if found==None:
+            return None
         
-        continue
+        s.pos=found[1]
+        return { "value" : found[0], "loc" : loc }
     
-    return None
+    with s:
+        node=trie.root
+        found=None
+        while node!=None:
+            if None in node:
+                found=(node[None], s.getMarker())
+                
+            c=s.peek()
+            node=node.get(c, None) if c!=None else None
+            if node!=None:
+                s.read()
+                
+        if found==None:
+            s.rollback()
+            return None
+        
+        # Back up to the end of the longest keyword we saw.
+        s.setMarker(found[1])
+        
+    return { "value" : found[0], "loc" : loc }
+
+def any_keyword(kw_list, s, log):
+    """Matches the longest keyword in the list.  kw_list may be a list of keywords or a trie built
+    with lexer.compile_keywords."""
+    trie = kw_list if isinstance(kw_list, lexer.KeywordTrie) else lexer.compile_keywords(kw_list)
+    return apply_rule(l_keyword_trie, s, log, trie)
 
 def rule_chain(chain, s, log):
     "Matches chains of rules, but allows more sophisticated matching semantics.  Each rule is a function with a specific signature and return value."
@@ -94,7 +152,7 @@ def rule_chain(chain, s, log):
         idx=0
         while idx<len(chain):
             matcher, pred = chain[idx]         
-            d=matcher(s, log)
+            d=apply_rule(matcher, s, log)
             if d==None:
                 # Check rules on None return.
                 if pred in [ZERO_OR_MORE, ZERO_OR_ONE]:
@@ -114,24 +172,50 @@ def rule_chain(chain, s, log):
 def any_rule(rules, s, log):
     "Matches any of the rules in the list once."
     for rule in rules:        
-        d=rule(s,log)
+        d=apply_rule(rule, s, log)
         if d==None:
             continue
         else:
             return d
 
+DIGITS      = "0123456789"
+IDENT_START = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_"
+IDENT_CHARS = IDENT_START + DIGITS
+
 def l_int(s, log):
-    "Matches any decimal integer, returns a dictionary with the matcher signature."
-    return any_literal("0123456789", s, log)    
+    """Matches any decimal integer, or a hexadecimal one like 0xc0de on buffered streams.  Returns
+    a dictionary with the matcher signature."""
+    if s.buffer!=None:
+        loc=s.getLoc()
+        value=lexer.match(lexer.int_expr, s, tokenizer.INT)
+        return { "value" : value, "loc" : loc } if value!=None else None
+    
+    return any_literal(DIGITS, s, log)    
     
+def int_value(text):
+    "Returns the value of an integer literal."
+    if text[:2] in ("0x", "0X"):
+        return int(text, 16)
+    
+    return int(text)
     
 def l_int_expr(s, log):
-    "Matches any decimal integer, returns an integer leaf expression."
+    "Matches any integer, returns an integer leaf expression."
     d=l_int(s,log)
-    return expr.newInt(d["loc"], int(d["value"])) if d!=None else None
+    return expr.newInt(d["loc"], int_value(d["value"])) if d!=None else None
 
 def l_float(s, log):
     "Matches any decimal floating point value, returns a dict with the matcher sig."
+    if s.buffer!=None:
+        with s:
+            loc=s.getLoc()
+            sval=lexer.match(lexer.float_expr, s, tokenizer.FLOAT)
+            if sval==None:
+                s.rollback()
+                return None
+            
+        return { "value":sval, "loc":loc }
+    
     ep = lambda s, log: any_literal(".", s, log)
     
     # Match a rule chain for the float expression
@@ -151,21 +235,30 @@ def l_float_expr(s, log):
     "Matches any floating point expresion, returns a float leaf expression."
     d = l_float(s, log)
     return expr.newFloat(d["loc"], float(d["value"])) if d!= None else None
+bool_keywords = lexer.compile_keywords(["true", "false"])
+
 def l_bool_expr(s, log):
     "Matches true or false as a boolean value, returns a boolean expression."
-    d = any_keyword(["true", "false"], s, log)
+    d = any_keyword(bool_keywords, s, log)
     return expr.newBool(d["loc"], d["value"]) if d!= None else None
    
 def l_ident(s, log):
     "Matches any valid identifier, returns the identifier name and location dictionary."
-    a1 = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_"
-    a2 = a1 + "0123456789"
+    if s.buffer!=None:
+        loc=s.getLoc()
+        value=lexer.match(lexer.compile_chain([IDENT_START, IDENT_CHARS]), s, tokenizer.IDENT)
+        return { "ident" : value, "loc" : loc } if value!=None else None
     
-    d = any_literal_chain([a1, a2], s, log)
+    d = any_literal_chain([IDENT_START, IDENT_CHARS], s, log)
     if d==None:
         return None
     
     return { "ident" : d["value"], "loc" : d["loc"] }
+
+def l_ident_expr(s, log):
+    "Matches any valid identifier, returns an identifier leaf expression."
+    d = l_ident(s, log)
+    return expr.newIdent(d["loc"], d["ident"]) if d!=None else None
    
 
 
@@ -0,0 +1,122 @@
+"""A packrat cache for the parser combinators.  Results are keyed on the rule and the stream
+position the rule was tried at, so backtracking into the same rule at the same place is a
+single lookup instead of a reparse.  Parsers build on the results they get back, so a stored
+result is copied every time it is replayed and no two parents share a node."""
+
+import collections
+import copy
+
+import expr
+
+# The default number of entries a cache holds before it starts evicting.
+DEFAULT_SIZE = 65536
+
+def rule_name(rule):
+    "Returns a readable name for a rule key, used when reporting statistics."
+    if type(rule) == tuple:
+        return "%s(%s)" % (rule_name(rule[0]), ", ".join([repr(r) for r in rule[1:]]))
+        
+    name = getattr(rule, "__name__", None)
+    if name==None:
+        return repr(rule)
+    
+    if name=="<lambda>":
+        code = getattr(rule, "func_code", None)
+        if code!=None:
+            name = "<lambda>:%d" % code.co_firstlineno
+            
+    return "%s.%s" % (getattr(rule, "__module__", "?"), name)
+
+# Expression attributes that hold other expressions, or lists of them.  The rest are shared.
+expr_inputs = ["children", "cond", "true_value", "false_value", "src", "idx", "child", "value"]
+
+def copy_result(value):
+    """Returns a copy of a rule result.  Lists, dictionaries and expression trees are copied, the
+    locations and types they refer to are shared."""
+    if isinstance(value, list):
+        return [copy_result(v) for v in value]
+    elif isinstance(value, tuple):
+        return tuple([copy_result(v) for v in value])
+    elif isinstance(value, dict):
+        return dict([(k, copy_result(v)) for k, v in value.items()])
+    elif isinstance(value, expr.Expr):
+        node = copy.copy(value)
+        for name in expr_inputs:
+            if hasattr(node, name):
+                setattr(node, name, copy_result(getattr(node, name)))
+        return node
+    
+    return value
+    
+class Cache:
+    "Holds the memoized results of rules, and counts how often each rule hits or misses."
+    def __init__(self, max_size=DEFAULT_SIZE):
+        # The most entries we keep before evicting the oldest.
+        self.max_size = max_size
+        
+        # Dictionary of (rule, position) to (result, end position).  A failed match is
+        # stored with a result of None.
+        self.entries = {}
+        
+        # The keys in the order they were added, used for eviction.
+        self.order = collections.deque()
+        
+        # Dictionary of rule to [hits, misses]
+        self.counters = {}
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+    def get(self, rule, pos):
+        """Returns the (result, end position) stored for the rule at pos, or None.  The result is a
+        copy of the stored one."""
+        entry = self.entries.get((rule, pos), None)
+        
+        counter = self.counters.get(rule, None)
+        if counter==None:
+            counter = self.counters[rule] = [0, 0]
+            
+        if entry!=None:
+            self.hits+=1
+            counter[0]+=1
+            return (copy_result(entry[0]), entry[1])
+        else:
+            self.misses+=1
+            counter[1]+=1
+            
+        return entry
+    
+    def put(self, rule, pos, result, end):
+        "Stores the result of running rule at pos, evicting the oldest entries if we are full."
+        key = (rule, pos)
+        if key not in self.entries:
+            self.order.append(key)
+            
+        self.entries[key] = (result, end)
+        
+        while len(self.order) > self.max_size:
+            del self.entries[self.order.popleft()]
+            self.evictions+=1
+            
+    def invalidate(self):
+        "Throws away every stored result.  The statistics are kept."
+        self.entries = {}
+        self.order = collections.deque()
+        
+    def getStats(self):
+        "Returns a list of (rule name, hits, misses) tuples, with the most hits first."
+        stats = [(rule_name(rule), c[0], c[1]) for rule, c in self.counters.items()]
+        stats.sort(key=lambda item: (-item[1], item[0]))
+        return stats
+    
+    def getHitRate(self):
+        "Returns the fraction of lookups that were answered from the cache."
+        total = self.hits + self.misses
+        if total==0:
+            return 0.0
+        
+        return float(self.hits) / total
+    
+def new(max_size=DEFAULT_SIZE):
+    return Cache(max_size)
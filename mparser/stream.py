@@ -1,6 +1,11 @@
 import err
+import bisect
 import copy
 import string
+
+import lexer
+import packrat
+import tokenizer
         
 
 class Stream:
@@ -32,6 +37,15 @@ class Stream:
         self.in_context_mgr=False
         self.ctx_manager_rollback=False
         
+        # The packrat cache.  Only streams with hashable markers support one.
+        self.memo=None
+        
+        # The contiguous buffer.  Only a BufferStream has one.
+        self.buffer=None
+        
+        # The token table.  Only a TokenStream has one.
+        self.tokens=None
+        
     def __enter__(self):
         "Enter the context manager."
         self.begin_transaction()
@@ -187,5 +201,210 @@ class Stream:
             
         return self.data[self.at]
     
-def new():
-    return Stream()
+class BufferStream(Stream):
+    """A parse stream backed by one contiguous buffer.  Merged data is spliced into the buffer
+    and a segment table maps buffer offsets back to filenames.  Markers are plain integer offsets,
+    and the row and column are computed on demand from an index of newline offsets."""
+    
+    def __init__(self):
+        # The buffer holding all of the merged data.
+        self.buffer=""
+        
+        # Offset of the next character to be read.
+        self.pos=0
+        
+        # The segment table.  Sorted buffer offsets where each merged chunk starts, and the
+        # filename of each chunk.
+        self.seg_starts=[]
+        self.seg_files=[]
+        
+        # Sorted buffer offsets of every newline character.
+        self.newlines=[]
+        
+        # The token table.  Only a TokenStream has one.
+        self.tokens=None
+        
+        #  If set, the locations handed out by getLoc are relative to it, anything with a file and
+        # a line.  The incremental parser makes each declaration the origin of its locations, so
+        # they move with it.
+        self.origin=None
+        
+        # The stack of contexts.
+        self.contexts=[]
+        
+        # Set to true if we are in a context manager context
+        self.in_context_mgr=False
+        self.ctx_manager_rollback=False
+        
+        # The packrat cache, if memoization is enabled.
+        self.memo=None
+        
+    def enableMemo(self, max_size=packrat.DEFAULT_SIZE):
+        "Turns on packrat memoization of rule results for this stream.  Returns the cache."
+        self.memo=packrat.new(max_size)
+        return self.memo
+        
+    def merge(self, data, filename=None):
+        "Merges the given data into the buffer at our current point in the stream."
+        
+        if data==None:
+            return
+        
+        # Every offset past this point moves, so the memoized results are stale.
+        if self.memo!=None:
+            self.memo.invalidate()
+        
+        at=self.pos
+        size=len(data)
+        
+        # Split the segment we are in, and insert the new segment before the split point.
+        idx=bisect.bisect_left(self.seg_starts, at)
+        starts=self.seg_starts[:idx]
+        files=self.seg_files[:idx]
+        
+        starts.append(at)
+        files.append(filename if filename!=None else self.getFilename())
+        
+        end=self.seg_starts[idx] if idx<len(self.seg_starts) else len(self.buffer)
+        if idx>0 and at<end:
+            starts.append(at+size)
+            files.append(self.seg_files[idx-1])
+            
+        for start in self.seg_starts[idx:]:
+            starts.append(start+size)
+        files.extend(self.seg_files[idx:])
+        
+        # Shift the newline index around the inserted data.
+        idx=bisect.bisect_left(self.newlines, at)
+        newlines=self.newlines[:idx]
+        nl=data.find("\n")
+        while nl!=-1:
+            newlines.append(at+nl)
+            nl=data.find("\n", nl+1)
+            
+        for offset in self.newlines[idx:]:
+            newlines.append(offset+size)
+        
+        self.buffer=self.buffer[:at]+data+self.buffer[at:]
+        self.seg_starts=starts
+        self.seg_files=files
+        self.newlines=newlines
+        
+    def begin_transaction(self):
+        "Save a context onto the stack"
+        self.contexts.append(self.pos)
+        
+    def _rollback(self):
+        "Performs the work of rolling back the stream state."
+        self.pos=self.contexts.pop()
+        
+    def getMarker(self):
+        "Returns a marker to the current stream pointer."
+        return self.pos
+    
+    def setMarker(self, m):
+        "Sets the stream position from the marker."
+        self.pos=m
+        
+    def getFilename(self):
+        "Returns the filename of the segment holding the last character read."
+        if len(self.seg_starts)==0:
+            return None
+        
+        idx=bisect.bisect_right(self.seg_starts, max(self.pos-1, 0))-1
+        return self.seg_files[max(idx, 0)]
+        
+    def getRowCol(self, pos=None):
+        "Returns the (row, col) of the given buffer offset, or of the current position."
+        if pos==None:
+            pos=self.pos
+            
+        idx=bisect.bisect_left(self.newlines, pos)
+        if idx==0:
+            return (1, pos+1)
+        
+        return (idx+1, pos-self.newlines[idx-1])
+        
+    def getLoc(self):
+        "Returns a location item."
+        row, col = self.getRowCol()
+        if self.origin!=None:
+            return err.relative_location(self.origin, row, col)
+        
+        return err.location(self.getFilename(), row, col)
+    
+    def skipOffset(self, pos):
+        "Returns the offset of the first character at or after pos that the parser should not skip."
+        return lexer.whitespace_expr.match(self.buffer, pos).end()
+    
+    def skip_leading_whitespace(self):
+        self.pos=self.skipOffset(self.pos)
+        
+    def peek(self):
+        "Reads a single character from the stream w/o consuming it. Returns None if there is nothing left to read."
+        if self.pos<len(self.buffer):
+            return self.buffer[self.pos]
+        
+        return None
+        
+    def read(self):
+        "Reads a single character from the stream. Returns None if there is nothing left to read."
+        if self.pos<len(self.buffer):
+            self.pos+=1
+            return self.buffer[self.pos-1]
+        
+        return None
+    
+class TokenStream(BufferStream):
+    """A buffered stream that also keeps a token table for its buffer.  Positions are still
+    character offsets, so the character matchers run on it unchanged, but skipping whitespace
+    and comments is a lookup in the table, and whole tokens can be consumed in one step."""
+    
+    def __init__(self):
+        BufferStream.__init__(self)
+        self.tokens=tokenizer.tokenize(self.buffer)
+        
+    def merge(self, data, filename=None):
+        """Merges the given data into the buffer at our current point in the stream.  Only the
+        tokens around the merged data are relexed."""
+        if data==None:
+            return
+        
+        at=self.pos
+        
+        #  The data can join the token before it, so relex from its start.  The tokens before that
+        # one end before it starts and can't change.
+        idx=bisect.bisect_left(self.tokens.starts, at)-1
+        relex_from=self.tokens.starts[idx] if idx>=0 else 0
+        
+        BufferStream.merge(self, data, filename)
+        tokenizer.relex(self.tokens, self.buffer, relex_from, at, len(data))
+        
+    def load(self, data, filename, tokens, newlines=None):
+        """Loads data into an empty stream along with a token table, and optionally a newline index,
+        that were already built for it."""
+        if newlines==None:
+            BufferStream.merge(self, data, filename)
+        else:
+            self.buffer=data
+            self.seg_starts=[0]
+            self.seg_files=[filename]
+            self.newlines=newlines
+            
+        self.tokens=tokens
+        
+    def skipOffset(self, pos):
+        "Returns the offset of the first character at or after pos that the parser should not skip."
+        return self.tokens.skip(pos)
+    
+def new(buffered=True, tokenized=True):
+    """Returns a new parse stream.  By default it is a buffered stream that skips whitespace and
+    comments using a token table.  Set tokenized to False to get a buffered stream without one, or
+    buffered to False to get the chunked, dict based stream."""
+    if not buffered:
+        return Stream()
+    
+    if tokenized:
+        return TokenStream()
+    
+    return BufferStream()
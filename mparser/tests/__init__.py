@@ -1,4 +1,8 @@
 from test_lit import *
+from test_stream import *
+from test_packrat import *
+from test_tokenizer import *
+from test_incremental import *
 from test_const_expr import *
 from test_struct_def import *
 from test_type_def import *
\ No newline at end of file
@@ -128,6 +128,18 @@ class TestConstExpressions(unittest.TestCase):
         self.assertTrue(False)
         self.log.error(loc, "Constant variable unit test is incomplete.")
         
+    def testParseIdentOperand(self):
+        "Identifiers are operands of constant expressions, resolved later by the solver."
+        data="SIZE*2"
+        self.s.merge(data, "const_ident_operand_data")
+        rv = exprs.const_expr(self.s, self.log)
+        
+        self.assertNotEqual(rv, None)
+        self.assertEqual(rv.op, "*")
+        self.assertEqual(rv.children[0].op, "ident")
+        self.assertEqual(rv.children[0].value, "SIZE")
+        self.assertFalse(rv.isConst())
+        
     def testParseConstIfExpr(self):
         "Try to parse a constant expression that contains an value if condition else other_value."
         loc=err.location("unittest::testParseConstIfExpr", 1, 1)                
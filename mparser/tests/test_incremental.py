@@ -0,0 +1,161 @@
+import random
+import sys
+import time
+import unittest
+
+import err
+import typesys.builtins
+import typesys.type
+
+from mparser import incremental
+
+source = """const uint32_t FIRST := 1;
+const uint32_t SECOND := 2+3;
+
+/* the third one */
+const uint8_t THIRD := 4;
+struct point_t
+{
+    uint32_t x;
+    uint32_t y;
+};
+const string_t NAME := "metal";
+"""
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.log = err.new(sys.stderr)
+        self.log.setIgnoreLevel(err.ERROR)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+    def edit(self, result, old, new):
+        start = result.text.index(old)
+        return incremental.reparse(result, start, start+len(old), new, self.log)
+        
+    def assertSameAsFullParse(self, result):
+        full = incremental.parse(result.text, "incremental_data.metal", self.log)
+        self.assertEqual(list(result.tokens.kinds), list(full.tokens.kinds))
+        self.assertEqual(list(result.tokens.starts), list(full.tokens.starts))
+        self.assertEqual(list(result.tokens.lengths), list(full.tokens.lengths))
+        self.assertEqual([(d.start, d.end) for d in result.decls], [(d.start, d.end) for d in full.decls])
+        self.assertEqual(sorted(result.module.constants.keys()), sorted(full.module.constants.keys()))
+        self.assertEqual(list(result.newlines), list(full.newlines))
+        self.assertEqual([d.line for d in result.decls], [d.line for d in full.decls])
+        
+    def testParse(self):
+        "Parse the whole file into declarations."
+        result = incremental.parse(source, "incremental_data.metal", self.log)
+        self.assertEqual(len(result.decls), 5)
+        self.assertEqual(result.module.name, "incremental_data")
+        for name in ["FIRST", "SECOND", "THIRD", "NAME"]:
+            self.assertTrue(result.module.hasConstant(name), name)
+            
+    def testReuseUnchanged(self):
+        "Only the edited declaration is reparsed, the others keep their definitions."
+        result = incremental.parse(source, "incremental_data.metal", self.log)
+        before = [d.definition for d in result.decls]
+        
+        result = self.edit(result, "2+3", "2+30")
+        after = [d.definition for d in result.decls]
+        
+        self.assertTrue(after[0] is before[0])
+        self.assertFalse(after[1] is before[1])
+        self.assertTrue(after[2] is before[2])
+        self.assertTrue(after[4] is before[4])
+        self.assertTrue(result.module.constants["SECOND"] is after[1])
+        self.assertSameAsFullParse(result)
+        
+    def testShiftLocations(self):
+        "Adding lines moves the locations of the declarations after the edit."
+        result = incremental.parse(source, "incremental_data.metal", self.log)
+        third = result.decls[2].definition
+        line = third.type_info.loc.line
+        self.assertEqual(third.initializer.loc.line, line)
+        
+        result = self.edit(result, "2+3;", "2+3;\n\n")
+        self.assertTrue(result.decls[2].definition is third)
+        self.assertEqual(third.type_info.loc.line, line+2)
+        self.assertEqual(third.initializer.loc.line, line+2)
+        self.assertSameAsFullParse(result)
+        
+    def testRename(self):
+        "Renaming a constant takes the old name out of the module."
+        result = incremental.parse(source, "incremental_data.metal", self.log)
+        result = self.edit(result, "FIRST", "ZEROTH")
+        self.assertTrue(result.module.hasConstant("ZEROTH"))
+        self.assertFalse(result.module.hasConstant("FIRST"))
+        self.assertSameAsFullParse(result)
+        
+    def testOpenComment(self):
+        "An unterminated comment swallows everything after it."
+        result = incremental.parse(source, "incremental_data.metal", self.log)
+        result = self.edit(result, "const uint8_t", "/* const uint8_t")
+        self.assertFalse(result.module.hasConstant("NAME"))
+        self.assertSameAsFullParse(result)
+        
+        result = self.edit(result, "/* const uint8_t", "const uint8_t")
+        self.assertTrue(result.module.hasConstant("NAME"))
+        self.assertSameAsFullParse(result)
+        
+    def testRandomEdits(self):
+        "A series of random edits must always give what a full parse gives."
+        rand = random.Random(1234)
+        pieces = ["", ";", "{", "}", " ", "\n", "/*", "*/", "//", "x", "12", "const uint8_t Q := 1;", '"']
+        result = incremental.parse(source, "incremental_data.metal", self.log)
+        for i in range(0, 200):
+            start = rand.randint(0, len(result.text))
+            end = min(len(result.text), start+rand.randint(0, 4))
+            result = incremental.reparse(result, start, end, rand.choice(pieces), self.log)
+            self.assertSameAsFullParse(result)
+            
+    def testImports(self):
+        "Import statements are declarations of their own, even without a ';'."
+        text = "import a, b\nfrom lib import c\n" + source
+        result = incremental.parse(text, "incremental_data.metal", self.log)
+        self.assertEqual(len(result.decls), 7)
+        self.assertEqual(text[result.decls[0].start:result.decls[0].end], "import a, b")
+        self.assertEqual(text[result.decls[1].start:result.decls[1].end], "from lib import c")
+        self.assertTrue(result.module.hasConstant("FIRST"))
+        
+        result = self.edit(result, "import c", "import c, d")
+        self.assertSameAsFullParse(result)
+        result = self.edit(result, "import a, b\n", "")
+        self.assertSameAsFullParse(result)
+        
+    def testLargeModule(self):
+        "Inserting a line in a 5000 line module reparses one declaration, and moves the rest without reparsing them."
+        parsed = [0]
+        def parse_decl(s, log):
+            parsed[0]+=1
+            return incremental.parse_declaration(s, log)
+        
+        text = "".join(["const uint32_t C%d := %d+1;\n" % (i, i) for i in range(0, 5000)])
+        result = incremental.parse(text, "incremental_large.metal", self.log, parse_decl=parse_decl)
+        self.assertEqual(parsed[0], 5000)
+        
+        last = result.decls[-1].definition
+        self.assertEqual(last.initializer.loc.line, 5000)
+        
+        start = result.text.index("const uint32_t C2501 ")
+        result = incremental.reparse(result, start, start, "const uint32_t D := 7;\n", self.log)
+        self.assertEqual(parsed[0], 5001)
+        self.assertEqual(result.reparsed, 1)
+        
+        # A full parse leaves the gap at the end, the first edit moves it to itself.
+        self.assertEqual(result.visited, 5000-2501)
+        self.assertTrue(result.module.hasConstant("D"))
+        
+        # The declarations after the edit moved down a line without being visited.
+        self.assertTrue(result.decls[-1].definition is last)
+        self.assertEqual(last.type_info.loc.line, 5001)
+        self.assertEqual(last.initializer.loc.line, 5001)
+        self.assertEqual(result.decls[-1].end, len(result.text)-1)
+        
+        # Editing nearby only visits the declarations between the two edits, not the ones after.
+        result = self.edit(result, "C2510 := 2510", "C2510 := 12510")
+        self.assertEqual(parsed[0], 5002)
+        self.assertEqual((result.reparsed, result.visited), (1, 10))
+        self.assertEqual(result.decls[2511].definition.initializer.loc.line, 2512)
+        self.assertSameAsFullParse(result)
@@ -100,4 +100,51 @@ class TestLiterals(unittest.TestCase):
         
         self.assertNotEqual(None, rv)
         self.assertEqual(output, rv["value"])
-        
\ No newline at end of file
+                
+    def testFastPathMatchesCharPath(self):
+        "The regex matchers on a buffered stream must return what the character matchers return."
+        cases = [(literals.l_int, "  42 rest"),
+                 (literals.l_float, "\n 3.25+1"),
+                 (literals.l_float, "7."),
+                 (literals.l_ident, " _abc_9 + x"),
+                 (literals.l_ident, "9abc"),]
+        
+        for matcher, data in cases:
+            fast = mparser.stream.new()
+            slow = mparser.stream.new(buffered=False)
+            fast.merge(data, "literal_fast_path_data")
+            slow.merge(data, "literal_fast_path_data")
+            
+            d1 = matcher(fast, self.log)
+            d2 = matcher(slow, self.log)
+            if d2==None:
+                self.assertEqual(d1, None)
+                self.assertEqual(fast.getMarker(), 0)
+                continue
+            
+            self.assertEqual(d1.get("value", d1.get("ident")), d2.get("value", d2.get("ident")))
+            self.assertEqual((d1["loc"].line, d1["loc"].col), (d2["loc"].line, d2["loc"].col))
+            self.assertEqual(fast.peek(), slow.peek())
+        
+    def testMatchKeywordLongest(self):
+        "Keyword matching must pick the longest keyword, whatever the list order."
+        kw_list = ["uint", "uint8_t", "uint16_t", "sint8_t"]
+        for buffered in [True, False]:
+            s = mparser.stream.new(buffered)
+            s.merge(" uint16_t x", "literal_keyword_data")
+            rv = literals.any_keyword(kw_list, s, self.log)
+            
+            self.assertNotEqual(None, rv)
+            self.assertEqual(rv["value"], "uint16_t")
+            self.assertEqual(s.peek(), " ")
+            
+            s = mparser.stream.new(buffered)
+            s.merge("uint8x uin", "literal_keyword_data")
+            rv = literals.any_keyword(kw_list, s, self.log)
+            self.assertEqual(rv["value"], "uint")
+            self.assertEqual(s.peek(), "8")
+            
+            s.read(); s.read()
+            rv = literals.any_keyword(kw_list, s, self.log)
+            self.assertEqual(None, rv)
+            self.assertEqual(s.read(), " ")
@@ -0,0 +1,136 @@
+import sys
+import unittest
+
+import err
+import typesys.builtins
+import typesys.type
+
+import mparser.stream
+from mparser import exprs
+from mparser import incremental
+from mparser import literals
+from mparser import packrat
+from expr import solver
+
+class TestPackrat(unittest.TestCase):
+    def setUp(self):
+        self.log = err.new(sys.stderr)
+        self.log.setIgnoreLevel(err.TRACE)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+        self.s = mparser.stream.new()
+        self.memo = self.s.enableMemo()
+        
+    def testMemoizedConstExpr(self):
+        "Parse a constant expression with memoization on, and make sure the answer is unchanged."
+        self.s.merge("8+3-2*10", "packrat_const_expr_data")
+        rv = exprs.const_expr(self.s, self.log)
+        
+        self.assertNotEqual(rv, None)
+        self.assertEqual(solver.SolveConstantExpr(rv)().value, 90)
+        self.assertNotEqual(self.memo.misses, 0)
+        
+    def testRetryHitsCache(self):
+        "Backtrack over a rule and try it again at the same place."
+        self.s.merge("2 if true", "packrat_retry_data")
+        self.assertEqual(literals.rule_chain(exprs.if_expr_rules, self.s, self.log), None)
+        self.assertEqual(self.s.getMarker(), 0)
+        
+        hits = self.memo.hits
+        rv = literals.apply_rule(exprs.const_expr, self.s, self.log)
+        self.assertEqual(rv.value, 2)
+        self.assertEqual(self.memo.hits, hits+1)
+        self.assertEqual(self.s.getMarker(), 1)
+        
+        names = [stat[0] for stat in self.memo.getStats() if stat[1]>0]
+        self.assertTrue("mparser.exprs.const_expr" in names, names)
+        
+    def testMergeInvalidates(self):
+        "Merging new data has to throw away the remembered results."
+        self.s.merge("7", "packrat_merge_data")
+        literals.any_rule([literals.l_int_expr], self.s, self.log)
+        self.assertNotEqual(len(self.memo.entries), 0)
+        
+        self.s.merge("5", "packrat_merge_data")
+        self.assertEqual(len(self.memo.entries), 0)
+        
+    def testEviction(self):
+        "The cache must not grow past its size cap."
+        memo = packrat.new(2)
+        for pos in range(0, 5):
+            memo.put(literals.l_int, pos, None, pos)
+            
+        self.assertEqual(len(memo.entries), 2)
+        self.assertEqual(memo.evictions, 3)
+        self.assertNotEqual(memo.get(literals.l_int, 4), None)
+        self.assertEqual(memo.get(literals.l_int, 0), None)
+        
+    def testNoReparse(self):
+        "Backtracking into a rule at the same place runs it once, and each parent gets its own copy."
+        calls = [0]
+        def operand(s, log):
+            calls[0]+=1
+            return exprs.const_expr(s, log)
+        
+        with_if = lambda s, log: literals.rule_chain([(operand, literals.ONE), (exprs.l_if, literals.ONE)], s, log)
+        alone = lambda s, log: literals.rule_chain([(operand, literals.ONE)], s, log)
+        
+        self.s.merge("1+2*3", "packrat_reparse_data")
+        first = literals.any_rule([with_if, alone], self.s, self.log)
+        self.assertEqual(calls[0], 1)
+        
+        self.s.setMarker(0)
+        second = literals.any_rule([with_if, alone], self.s, self.log)
+        self.assertEqual(calls[0], 1)
+        self.assertEqual(solver.SolveConstantExpr(second[0])().value, 9)
+        
+        self.assertFalse(first[0] is second[0])
+        self.assertFalse(first[0].children[0] is second[0].children[0])
+        self.assertEqual(first[0].children[0].children[1].value, second[0].children[0].children[1].value)
+        
+    def parseNested(self, depth, text):
+        """Parses text with rules nested depth deep, where each level tries its inner rule followed
+        by 'if', then backtracks and tries it alone.  Returns the number of times the innermost
+        rule ran and the cache.  Without the cache that is 2**depth."""
+        calls = [0]
+        def operand(s, log):
+            calls[0]+=1
+            return exprs.const_expr(s, log)
+        
+        def nest(inner):
+            with_if = lambda s, log: literals.rule_chain([(inner, literals.ONE), (exprs.l_if, literals.ONE)], s, log)
+            alone = lambda s, log: literals.rule_chain([(inner, literals.ONE)], s, log)
+            return lambda s, log: literals.any_rule([with_if, alone], s, log)
+        
+        rule = operand
+        for i in range(0, depth):
+            rule = nest(rule)
+            
+        s = mparser.stream.new()
+        memo = s.enableMemo()
+        s.merge(text, "packrat_nested_data")
+        self.assertNotEqual(literals.apply_rule(rule, s, self.log), None)
+        self.assertEqual(s.getMarker(), len(text))
+        return calls[0], memo
+        
+    def testNestedBacktracking(self):
+        "Deeply nested backtracking parses each rule once per position, so the work grows linearly."
+        text = "+".join([str(i) for i in range(0, 100)])
+        misses = []
+        for depth in [10, 20, 40]:
+            calls, memo = self.parseNested(depth, text)
+            self.assertEqual(calls, 1)
+            self.assertEqual(memo.hits, 2*depth-1)
+            misses.append(memo.misses)
+            
+        # Each level adds the same number of rule runs.
+        self.assertEqual((misses[2]-misses[1])/20, (misses[1]-misses[0])/10)
+        self.assertEqual((misses[2]-misses[1])%20, 0)
+        
+    def testParserUsesMemo(self):
+        "The declaration parser memoizes rule results."
+        result = incremental.parse("const uint32_t A := 1+2;", "packrat_parse_data.metal", self.log)
+        self.assertNotEqual(result.newStream().memo, None)
+        self.assertTrue(result.module.hasConstant("A"))
@@ -0,0 +1,83 @@
+from __future__ import with_statement
+
+import err
+import sys
+import unittest
+
+import mparser.stream
+
+class TestBufferStream(unittest.TestCase):
+    def setUp(self):
+        self.s = mparser.stream.new()
+        self.log = err.new(sys.stderr)
+        
+    def testReadAcrossMerges(self):
+        "Read characters across two merged chunks."
+        self.s.merge("ab", "stream_data_1")
+        self.assertEqual(self.s.read(), "a")
+        self.assertEqual(self.s.read(), "b")
+        self.assertEqual(self.s.peek(), None)
+        
+        self.s.merge("cd", "stream_data_2")
+        self.assertEqual(self.s.peek(), "c")
+        self.assertEqual(self.s.read(), "c")
+        self.assertEqual(self.s.getLoc().file, "stream_data_2")
+        self.assertEqual(self.s.read(), "d")
+        self.assertEqual(self.s.read(), None)
+        
+    def testMergeSplitsSegment(self):
+        "Merge data into the middle of a chunk and make sure the filenames follow the data."
+        self.s.merge("abef", "outer")
+        self.s.read(); self.s.read()
+        self.s.merge("cd", "inner")
+        
+        text=""
+        files=[]
+        c=self.s.read()
+        while c!=None:
+            text+=c
+            files.append(self.s.getLoc().file)
+            c=self.s.read()
+            
+        self.assertEqual(text, "cdef")
+        self.assertEqual(files, ["inner", "inner", "outer", "outer"])
+        
+    def testRowCol(self):
+        "Make sure that the row and column track newlines."
+        self.s.merge("ab\ncd\n\ne", "stream_row_col_data")
+        loc=self.s.getLoc()
+        self.assertEqual((loc.line, loc.col), (1, 1))
+        
+        expected=[(1,2), (1,3), (2,1), (2,2), (2,3), (3,1), (4,1), (4,2)]
+        for row, col in expected:
+            self.s.read()
+            loc=self.s.getLoc()
+            self.assertEqual((loc.line, loc.col), (row, col))
+            
+    def testRowColMatchesStream(self):
+        "The buffered stream must report the same locations as the chunked stream."
+        old = mparser.stream.new(buffered=False)
+        data = ["const\n  uint8_t", " x := 5;\n", "\n// done\n"]
+        for chunk in data:
+            self.s.merge(chunk, "stream_compare_data")
+            old.merge(chunk, "stream_compare_data")
+            
+            for i in range(0, len(chunk)):
+                self.assertEqual(self.s.read(), old.read())
+                l1=self.s.getLoc(); l2=old.getLoc()
+                self.assertEqual((l1.file, l1.line, l1.col), (l2.file, l2.line, l2.col))
+        
+    def testRollback(self):
+        "Roll back a transaction and make sure the position is restored."
+        self.s.merge("  abc", "stream_rollback_data")
+        with self.s:
+            self.assertEqual(self.s.read(), "a")
+            self.s.rollback()
+            
+        self.assertEqual(self.s.getMarker(), 0)
+        
+        with self.s:
+            self.assertEqual(self.s.read(), "a")
+        
+        self.assertEqual(self.s.getMarker(), 3)
+        self.assertEqual(self.s.read(), "b")
@@ -0,0 +1,110 @@
+import sys
+import unittest
+
+import err
+import typesys.builtins
+import typesys.type
+
+import mparser.stream
+from mparser import exprs
+from mparser import literals
+from mparser import tokenizer
+from expr import solver
+
+class TestTokenizer(unittest.TestCase):
+    def setUp(self):
+        self.log = err.new(sys.stderr)
+        self.log.setIgnoreLevel(err.TRACE)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+    def testTokenTable(self):
+        "Tokenize a small declaration and check the kinds, offsets and lengths."
+        data = "const uint32_t X := 0xc0de; // magic\n/* a\n block */ 2.5 'str'"
+        tokens = tokenizer.tokenize(data)
+        
+        texts = [data[tokens.starts[i]:tokens.starts[i]+tokens.lengths[i]] for i in range(0, len(tokens))]
+        self.assertEqual(texts, ["const", "uint32_t", "X", ":", "=", "0xc0de", ";", "2.5", "'str'"])
+        self.assertEqual(list(tokens.kinds), [tokenizer.IDENT, tokenizer.IDENT, tokenizer.IDENT,
+                                              tokenizer.OP, tokenizer.OP, tokenizer.INT,
+                                              tokenizer.OP, tokenizer.FLOAT, tokenizer.STRING])
+        
+    def testSkip(self):
+        "Skipping from the gap between tokens lands on the next token, or the end of the buffer."
+        data = "a  // x\n  b  "
+        tokens = tokenizer.tokenize(data)
+        self.assertEqual(tokens.skip(0), 0)
+        self.assertEqual(tokens.skip(1), data.index("b"))
+        self.assertEqual(tokens.skip(data.index("b")+1), len(data))
+        
+    def testConstExprWithComments(self):
+        "Parse a constant expression with comments in it through a token stream."
+        s = mparser.stream.new(tokenized=True)
+        s.merge("8 /* eight */ + 3 // three\n - 2", "tokenizer_const_expr_data")
+        rv = exprs.const_expr(s, self.log)
+        
+        self.assertNotEqual(rv, None)
+        self.assertEqual(solver.SolveConstantExpr(rv)().value, 9)
+        self.assertEqual(s.peek(), None)
+        
+    def testIdentToken(self):
+        "Identifiers and numbers come straight from the token table."
+        s = mparser.stream.new(tokenized=True)
+        s.merge("  the_dog_1 10this", "tokenizer_ident_data")
+        self.assertEqual(literals.l_ident(s, self.log)["ident"], "the_dog_1")
+        self.assertEqual(literals.l_ident(s, self.log), None)
+        self.assertEqual(literals.l_int(s, self.log)["value"], "10")
+        self.assertEqual(literals.l_ident(s, self.log)["ident"], "this")
+        
+    def testNumbers(self):
+        "Hex and float literals are single tokens, and parse to the same values as without tokens."
+        data = "0xc0de + 0XFF + 12 + 2.5 + 3."
+        tokens = tokenizer.tokenize(data)
+        texts = [data[tokens.starts[i]:tokens.starts[i]+tokens.lengths[i]] for i in range(0, len(tokens))]
+        self.assertEqual(texts, ["0xc0de", "+", "0XFF", "+", "12", "+", "2.5", "+", "3."])
+        self.assertEqual([tokens.kinds[i] for i in range(0, len(tokens), 2)],
+                         [tokenizer.INT, tokenizer.INT, tokenizer.INT, tokenizer.FLOAT, tokenizer.FLOAT])
+        
+        for tokenized in (True, False):
+            s = mparser.stream.new(tokenized=tokenized)
+            s.merge("0xc0de 0XFF 2.5 3.", "tokenizer_number_data")
+            self.assertEqual(literals.l_int_expr(s, self.log).value, 0xc0de)
+            self.assertEqual(literals.l_int_expr(s, self.log).value, 0xff)
+            self.assertEqual(literals.l_float_expr(s, self.log).value, 2.5)
+            self.assertEqual(literals.l_float_expr(s, self.log).value, 3.0)
+            
+    def testMerge(self):
+        "Merging relexes the tokens around the merged data, and ends up like tokenizing it all."
+        s = mparser.stream.new()
+        s.merge("const uint32_t AB := 12; /* note */ x", "tokenizer_merge_data")
+        for data, at in [("C", 17), ("3", 23), (" y", 0), ("x +", 30), ("*/", 26), ("0x", 22)]:
+            s.setMarker(at)
+            s.merge(data)
+            full = tokenizer.tokenize(s.buffer)
+            self.assertEqual(list(s.tokens.kinds), list(full.kinds), s.buffer)
+            self.assertEqual(list(s.tokens.starts), list(full.starts), s.buffer)
+            self.assertEqual(list(s.tokens.lengths), list(full.lengths), s.buffer)
+            
+    def testDefaultStream(self):
+        "New streams have a token table unless asked not to."
+        self.assertTrue(isinstance(mparser.stream.new(), mparser.stream.TokenStream))
+        self.assertEqual(mparser.stream.new(tokenized=False).tokens, None)
+        self.assertEqual(mparser.stream.new(buffered=False).buffer, None)
+            
+    def testOffsets(self):
+        "Splicing moves the offsets after the splice without visiting them."
+        offsets = tokenizer.Offsets([0, 10, 20, 30, 40])
+        offsets.splice(1, 2, [10, 12, 14], 5)
+        self.assertEqual(list(offsets), [0, 10, 12, 14, 25, 35, 45])
+        self.assertEqual(list(offsets.values[offsets.gap:]), [20, 30, 40])
+        
+        # Splicing further back moves the gap back over the offsets in between.
+        offsets.splice(0, 0, [-3], 1)
+        self.assertEqual(list(offsets), [-3, 1, 11, 13, 15, 26, 36, 46])
+        self.assertEqual(offsets[-1], 46)
+        self.assertEqual(offsets.gap, 1)
+        
+        offsets.append(50)
+        self.assertEqual(offsets[8], 50)
+        self.assertRaises(IndexError, lambda: offsets[9])
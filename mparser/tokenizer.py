@@ -0,0 +1,196 @@
+"""Splits a source buffer into a compact token table.  The table keeps the kind, start offset
+and length of every token in parallel arrays.  Whitespace and comments are dropped, so the gap
+between two tokens is always something the parser can skip."""
+
+import array
+import bisect
+import re
+
+import lexer
+
+# The kinds of tokens
+IDENT  = 1
+INT    = 2
+FLOAT  = 3
+STRING = 4
+OP     = 5
+
+# Matches one token, or a run of whitespace or a comment.  The alternatives are tried in order,
+# so floats win over ints, and every other character becomes a single character OP token.
+token_expr = re.compile(r"""
+     (?P<space>\s+)
+    |(?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    |(?P<string>\"\"\".*?(?:\"\"\"|\Z)|'''.*?(?:'''|\Z)|"(?:\\.|[^"\\])*(?:"|\Z)|'(?:\\.|[^'\\])*(?:'|\Z))
+    |(?P<float>%s)
+    |(?P<int>%s)
+    |(?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<op>.)
+""" % (lexer.float_pattern, lexer.int_pattern), re.VERBOSE | re.DOTALL)
+
+group_to_kind = { "string" : STRING,
+                  "float"  : FLOAT,
+                  "int"    : INT,
+                  "ident"  : IDENT,
+                  "op"     : OP }
+
+class Offsets:
+    """A sorted column of buffer offsets that an edit can move in bulk.  The offsets from number gap
+    on are stored less shift, so moving every offset after an edit is one change to shift.  The gap
+    is moved to each edit first, which only visits the offsets between it and the last edit."""
+    def __init__(self, values=()):
+        self.values = array.array("l", values)
+        self.gap = len(self.values)
+        self.shift = 0
+        
+    def __len__(self):
+        return len(self.values)
+    
+    def __getitem__(self, idx):
+        if idx<0:
+            idx+=len(self.values)
+            if idx<0:
+                raise IndexError(idx)
+            
+        if idx>=self.gap:
+            return self.values[idx]+self.shift
+        return self.values[idx]
+    
+    def __iter__(self):
+        for idx in xrange(0, len(self.values)):
+            yield self[idx]
+            
+    def append(self, value):
+        "Adds an offset at the end."
+        self.values.append(value-self.shift)
+        
+    def moveGap(self, idx):
+        "Moves the gap to offset number idx, without changing any offset."
+        values = self.values
+        shift = self.shift
+        if shift!=0 and idx<self.gap:
+            values[idx:self.gap] = array.array("l", [v-shift for v in values[idx:self.gap]])
+        elif shift!=0 and idx>self.gap:
+            values[self.gap:idx] = array.array("l", [v+shift for v in values[self.gap:idx]])
+            
+        self.gap = idx
+        
+    def splice(self, lo, hi, values, delta):
+        "Replaces offsets lo to hi with values, and moves the offsets after them by delta."
+        self.moveGap(hi)
+        self.values[lo:hi] = array.array("l", values)
+        self.gap = lo+len(values)
+        self.shift+=delta
+        
+class Tokens:
+    "The token table for a buffer.  Each column is indexed by token number."
+    def __init__(self, size=0):
+        # The kind of each token
+        self.kinds = array.array("B")
+        
+        # The buffer offset each token starts at
+        self.starts = Offsets()
+        
+        # The length of each token
+        self.lengths = array.array("l")
+        
+        # The length of the buffer that was tokenized
+        self.size = size
+        
+        #  The number of the token last looked up.  The parser mostly moves forward, so lookups
+        # try it and the one after it before searching.
+        self.last = 0
+        
+    def __len__(self):
+        return len(self.starts)
+    
+    def append(self, kind, start, length):
+        "Adds a token to the end of the table."
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.lengths.append(length)
+        
+    def locate(self, offset):
+        "Returns the number of the last token that starts at or before offset, or -1 if there is none."
+        starts = self.starts
+        count = len(starts)
+        idx = self.last
+        if idx<count and starts[idx]<=offset:
+            if idx+1==count or starts[idx+1]>offset:
+                return idx
+            if idx+2==count or starts[idx+2]>offset:
+                self.last = idx+1
+                return idx+1
+            
+        idx = bisect.bisect_right(starts, offset)-1
+        if idx>=0:
+            self.last = idx
+        return idx
+    
+    def find(self, offset):
+        "Returns the number of the token that starts at offset, or -1 if no token starts there."
+        idx = self.locate(offset)
+        if idx>=0 and self.starts[idx]==offset:
+            return idx
+        
+        return -1
+    
+    def skip(self, offset):
+        """Returns offset if it is inside a token.  Otherwise returns the start of the next token,
+        or the end of the buffer if there are no tokens left."""
+        idx = self.locate(offset)
+        if idx>=0 and offset<self.starts[idx]+self.lengths[idx]:
+            return offset
+        
+        idx+=1
+        if idx<len(self.starts):
+            return self.starts[idx]
+        
+        return max(offset, self.size)
+    
+def relex(tokens, text, relex_from, end, delta):
+    """Updates the token table of a text for an edit of it.  text is the edited text: the characters
+    before end were changed, and everything from end on moved by delta.  relex_from must be the
+    start of a token, or a gap, that the change cannot reach back past.  Tokens are relexed from
+    there until a token starts where an old one does after the change.  From then on the old tokens
+    are kept, and moved without being visited.  Returns the number of the first relexed token and
+    the number of the first kept one."""
+    starts = tokens.starts
+    first = bisect.bisect_left(starts, relex_from)
+    kinds = array.array("B")
+    new_starts = []
+    lengths = array.array("l")
+    
+    new_end = end+delta
+    count = len(tokens)
+    resync = count
+    j = bisect.bisect_left(starts, end)
+    for m in token_expr.finditer(text, relex_from):
+        pos = m.start()
+        if pos>=new_end:
+            while j<count and starts[j]+delta<pos:
+                j+=1
+            if j<count and starts[j]+delta==pos:
+                resync = j
+                break
+            
+        kind = group_to_kind.get(m.lastgroup, None)
+        if kind!=None:
+            kinds.append(kind)
+            new_starts.append(pos)
+            lengths.append(m.end()-pos)
+            
+    tokens.kinds[first:resync] = kinds
+    tokens.lengths[first:resync] = lengths
+    starts.splice(first, resync, new_starts, delta)
+    tokens.size = len(text)
+    return (first, first+len(new_starts))
+    
+def tokenize(text):
+    "Returns the token table for the text."
+    tokens = Tokens(len(text))
+    for m in token_expr.finditer(text):
+        kind = group_to_kind.get(m.lastgroup, None)
+        if kind!=None:
+            tokens.append(kind, m.start(), m.end()-m.start())
+            
+    return tokens
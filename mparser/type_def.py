@@ -6,9 +6,11 @@ import expr
 import typesys
 
 from mparser import common
+from mparser import lexer
 from mparser import literals
 
-type_kw = lambda s, log: literals.any_keyword(typesys.type.type_map.keys(), s, log)
+type_keywords = lexer.compile_keywords(typesys.type.type_map.keys())
+type_kw = lambda s, log: literals.any_keyword(type_keywords, s, log)
 type_rules = [ (type_kw, literals.ONE),
                (literals.l_ident, literals.ONE),
                (common.doc_info,  literals.ZERO_OR_ONE),
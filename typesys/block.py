@@ -1,4 +1,6 @@
 from typesys import struct
+
+import expr
 from expr import solver
 
 class Block:
@@ -26,6 +28,10 @@ class Block:
     def onAdded(self, m):
         "Called when this block is added to a module."        
         self.vars.onAdded(m)
+        
+    def onRemoved(self, m):
+        "Called when the function owning this block is removed from a module."
+        self.vars.onRemoved(m)
                 
     def setScope(self, parent_scope):
         "Sets the resolver scope for this block."
@@ -37,13 +43,16 @@ class Block:
         self.init[name] = expr
         
     def simplify(self):
-        "Walks the initializer lists and simplifies the branches as much as possible."
+        """Walks the initializers and the expressions of the basic blocks and simplifies them as much as
+        possible.  Constants from the enclosing scopes are substituted, unless this block's variables or
+        an enclosing scope's names shadow them, and constant branches are folded."""
+        propagate = solver.PropagateConstants(self)
         for var in self.init:
-            e = self.init[var]
-            # Solve expression as far as possible
-            if e.isConst():
-                cs = solver.SolveConstantExpr(e)
-                self.init[var]=cs()                
+            self.init[var] = propagate(self.init[var])
+            
+        for idx in range(0, len(self.code)):
+            if isinstance(self.code[idx], expr.Expr):
+                self.code[idx] = propagate(self.code[idx])
         
     def addBasicBlock(self,c):
         """A basic block is the most basic level of execution.  A basic block consists of an operation, source location information, and occasionally
@@ -69,4 +78,4 @@ def new(self, loc, name=None, doc_string=""):
         
     
     
-        
\ No newline at end of file
+        
\ No newline at end of file
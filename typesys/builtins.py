@@ -17,6 +17,26 @@ TYPE_NODE_STRUCT = None
 
 STR_FLAG_CONST = 1
 
+#  Type info modes.  With TYPE_INFO_ALL every struct and primitive type gets its type_t global
+# and every struct its attribute table when it is added to a module.  With TYPE_INFO_REACHABLE
+# they are only added when Module.requireTypeInfo asks for them, by code that reflects on a type
+# or dispatches on it.
+TYPE_INFO_ALL       = "all"
+TYPE_INFO_REACHABLE = "reachable"
+
+type_info_mode = TYPE_INFO_ALL
+
+# The ids of the primitive types that have a type_t global.
+BUILTIN_TYPE_INFO_IDS = type.INTEGERS+type.FLOATS+[type.NULL]
+
+def setTypeInfoMode(mode):
+    global type_info_mode
+    type_info_mode = mode
+    
+def isTypeInfoEager():
+    "Returns True if type info is added for every type."
+    return type_info_mode==TYPE_INFO_ALL
+
 def create_builtin_type_info(m, id):
 	name = type.id_to_name_map[id]	
 	the_def = globalvar.new("%s_type" % name, 
@@ -34,7 +54,7 @@ def initialize():
     global WORD_TYPE, CHARACTER_TYPE, NULL_TYPE
     
     char_array = type.new("%s" % type.CHARACTER_TYPENAME, loc)
-    char_array.makeUnboundedArray()
+    char_array = char_array.makeUnboundedArray()
     
     STRING_STRUCT = struct.new("string_t", loc)
     TYPE_STRUCT = struct.new("type_t", loc)
@@ -61,13 +81,11 @@ def initialize_module(m):
     m.addStruct(TYPE_STRUCT)
     m.addStruct(TYPE_NODE_STRUCT)
     
-    for id in type.INTEGERS:
+    if not isTypeInfoEager():
+        return
+    
+    for id in BUILTIN_TYPE_INFO_IDS:
     	m.addGlobal(create_builtin_type_info(m,id))
-    	
-    for id in type.FLOATS:
-        m.addGlobal(create_builtin_type_info(m,id))
-        
-    m.addGlobal(create_builtin_type_info(m, type.NULL))
     
 def newConstString(name, text, loc):
     global STRING_STRUCT
@@ -21,7 +21,7 @@ class Constant:
 		self.parent_scope=None
 		
 		# Force the type info into constant
-		self.type_info.makeConst()
+		self.type_info = self.type_info.makeConst()
 		
 	
 def new(name, type_info, initializer, docstring=""):
@@ -54,6 +54,12 @@ class Func:
         if self.mainline_block: self.mainline_block.onAdded(m)
         if self.require_block: self.require_block.onAdded(m)
         if self.ensure_block: self.ensure_block.onAdded(m)
+        
+    def onRemoved(self, m):
+        "Called when this function is removed from a module."
+        if self.mainline_block: self.mainline_block.onRemoved(m)
+        if self.require_block: self.require_block.onRemoved(m)
+        if self.ensure_block: self.ensure_block.onRemoved(m)
                 
     def setMainlineBlock(self, b):
         "Sets the mainline code block."
@@ -123,4 +129,4 @@ def new(name, loc, **kw):
     
         
     
-        
\ No newline at end of file
+        
\ No newline at end of file
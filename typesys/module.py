@@ -1,6 +1,24 @@
 import builtins
+import strings
+import struct
+import structgraph
 import types
 
+# Symbol kinds, in the order a name defined as more than one of them resolves.
+STRUCT   = 0
+OBJECT   = 1
+FUNC     = 2
+CONSTANT = 3
+GLOBAL   = 4
+
+#  Incremented whenever any module adds an import.  Scoped paths resolved through other modules
+# are cached against it, since adding an import to an imported module can change them.
+import_generation = 0
+
+#  Incremented whenever any module adds or removes a constant or adds an import.  Folded constant
+# values are kept against it, since a constant can be defined in terms of another module's.
+constant_generation = 0
+
 class Module:
     """A module holds top-level items like structs, objects, functions, and constants.  It
     also holds imports of other modules, which allow it to resolve scoped namespaces."""
@@ -14,10 +32,20 @@ class Module:
         
         # Dictionary of constants.
         self.constants = {}
+        
+        #  Dictionary of constant name to its value folded at its declared type, as a (type id,
+        # value) pair, or None if it has no constant value.  Filled in by expr.solver.find_constant
+        # and emptied by getConstantValues when the constant generation changed.
+        self.constant_values = {}
+        self.values_generation = constant_generation
                 
         # Dictionary of structs
         self.structs = {}
         
+        #  The structgraph.StructGraph of the structs, built when it's first asked for after the
+        # structs change.
+        self.struct_graph = None
+        
         # Dictionary of objects
         self.objects = {}
         
@@ -27,13 +55,19 @@ class Module:
         # Dictionary of globals
         self.global_vars = {}
         
+        #  Dictionary of name to a (kind, definition) pair for every item above.  A name that is
+        # defined as more than one kind maps to the first kind in symbol kind order.
+        self.symbols = {}
+        
+        #  Dictionary of scoped name to the (module, name) it resolves to, and the import
+        # generation it was resolved in.
+        self.resolved = {}
+        self.resolved_generation = import_generation
+        
         #  The string table.  All string constants have their strings added in here.  When the
         # module is transformed, these are generated as native string constants, and then assigned
         # into metal string structures. 
-        self.string_table = []
-        
-        # The string set is used for fast lookup to make sure we don't dupe string constants.
-        self.string_set = set()
+        self.string_table = strings.new()
         
         # The string constant dictionary maps string constants to their constant object defintions.
         self.string_constants = {}
@@ -44,26 +78,53 @@ class Module:
         # The location for this module
         self.loc=None
         
+    def __getstate__(self):
+        "Drops the resolved names, which refer to other modules."
+        state = self.__dict__.copy()
+        state["resolved"] = {}
+        return state
+    
     def addRawStringConstant(self, value):
         """Adds a raw string constant into the string table for generation and lookup.  Returns the
-        index of the string.  Note that it eliminates duplicates for smaller tables."""
+        index of the string.  Duplicates are added once."""
+        return self.string_table.add(value)
         
-        if value not in self.string_set:
-            idx=len(self.string_table)
-            self.string_table.append(value)
-            self.string_set.add(value)
-            return idx
-        else:
-            return self.string_table.index(value)
+    def indexSymbol(self, name):
+        "Updates the symbol index entry for name from the item dictionaries."
+        for kind, items in ((STRUCT, self.structs), (OBJECT, self.objects), (FUNC, self.funcs),
+                            (CONSTANT, self.constants), (GLOBAL, self.global_vars)):
+            if name in items:
+                self.symbols[name] = (kind, items[name])
+                return
+            
+        self.symbols.pop(name, None)
+        
+    def findSymbol(self, name):
+        "Returns the (kind, definition) pair for the unscoped name, or None."
+        return self.symbols.get(name, None)
         
     def addImport(self, the_def):
+        global import_generation, constant_generation
+        
         self.imports[the_def.name] = the_def
+        import_generation+=1
+        constant_generation+=1
+        
+    def getConstantValues(self):
+        "Returns the dictionary of folded constant values, emptied first if any constant changed since."
+        if self.values_generation!=constant_generation:
+            self.constant_values = {}
+            self.values_generation = constant_generation
+        return self.constant_values
         
     def addConstant(self, the_def):
+        global constant_generation
         if the_def.name == None:
             the_def.name = "__CO%d" % len(self.constants)
             
         self.constants[the_def.name] = the_def
+        constant_generation+=1
+        self.indexSymbol(the_def.name)
         the_def.parent_scope = self
         
         # Adjust and consume initializer for string constant generation.
@@ -83,11 +144,14 @@ class Module:
                   
     def addGlobal(self, the_def):
         self.global_vars[the_def.name] = the_def
+        self.indexSymbol(the_def.name)
         the_def.parent_scope = self                   
     
     def addStruct(self, the_def):
         "Adds a struct to the object."
         self.structs[the_def.name] = the_def
+        self.indexSymbol(the_def.name)
+        self.struct_graph = None
         the_def.parent_scope = self
         
         # Now add type information
@@ -95,12 +159,14 @@ class Module:
         
     def addObject(self, the_def):
         self.objects[the_def.name] = the_def
+        self.indexSymbol(the_def.name)
         the_def.parent_scope = self
         
     def addFunc(self, the_def):
         """Adds a function to the module. Also registers the inbound and outbound
         variable struct definitions."""
         self.funcs[the_def.name] = the_def
+        self.indexSymbol(the_def.name)
         the_def.parent_scope = self
         
         # Add in the struct types for the function
@@ -110,7 +176,46 @@ class Module:
         # Do any necessary postprocessing
         the_def.onAdded(self)
 
+
+    def removeConstant(self, name):
+        "Removes a constant.  Its string, if it had one, stays in the string table."
+        global constant_generation
+        self.constants.pop(name, None)
+        constant_generation+=1
+        self.indexSymbol(name)
+        
+    def removeGlobal(self, name):
+        self.global_vars.pop(name, None)
+        self.indexSymbol(name)
+        
+    def removeStruct(self, name):
+        "Removes a struct, along with the type information that was added for it."
+        the_def = self.structs.pop(name, None)
+        self.indexSymbol(name)
+        self.struct_graph = None
+        if the_def!=None:
+            the_def.onRemoved(self)
+            
+    def removeObject(self, name):
+        self.objects.pop(name, None)
+        self.indexSymbol(name)
         
+    def removeFunc(self, name):
+        """Removes a function from the module, along with the inbound and outbound
+        variable struct definitions."""
+        the_def = self.funcs.pop(name, None)
+        self.indexSymbol(name)
+        if the_def!=None:
+            self.removeStruct(the_def.getInboundSignature())
+            self.removeStruct(the_def.getOutboundSignature())
+            the_def.onRemoved(self)
+        
+    def getStructGraph(self):
+        "Returns the dependency graph of the structs."
+        if self.struct_graph==None:
+            self.struct_graph = structgraph.new(self.structs)
+        return self.struct_graph
+    
     def getStructDef(self, name):
         return self.structs[name]
     
@@ -129,31 +234,45 @@ class Module:
     def hasConstant(self, name):
         if name in self.constants: return True
         
+    def resolveScope(self, scoped_name):
+        """Returns the (module, name) the scoped name refers to, and a list of the scopes in it that
+        weren't imported.  Names that resolve fully are cached until an import is added."""
+        if self.resolved_generation!=import_generation:
+            self.resolved = {}
+            self.resolved_generation = import_generation
+            
+        result = self.resolved.get(scoped_name, None)
+        if result!=None:
+            return result, []
+        
+        chain = scoped_name.split("::")
+        name = chain.pop(-1)
+        module = self
+        missing = []
+        
+        # Walk the chain of scopes
+        for scope_name in chain:
+            if not scope_name in module.imports:
+                missing.append(scope_name)
+            else:
+                module=module.imports[scope_name]
+                
+        if len(missing)==0:
+            self.resolved[scoped_name] = (module, name)
+            
+        return (module, name), missing
+    
     def hasDefinition(self, the_type, log):
-    	        # First check for scoped lookup rules
-        name=the_type.name
-        chain = name.split("::")
-        module=self
-        if len(chain)>0:
-            name=chain.pop(-1)
-            # Walk the chain of scopes
-            for scope_name in chain:
-                if not scope_name in module.imports:
-                    log.error(the_type.loc, "The scoped type name '%s' refers to a module '%s' that was not imported." % (the_type.name, scope_name))
-                else:
-                    module=module.imports[scope_name]
+        # First check for scoped lookup rules
+        (module, name), missing = self.resolveScope(the_type.name)
+        for scope_name in missing:
+            log.error(the_type.loc, "The scoped type name '%s' refers to a module '%s' that was not imported." % (the_type.name, scope_name))
                     
         # Update the definition scope and the name
         the_type.setDefinitionScope(module)
         the_type.setName(name)                        
         
-        if name in module.structs: return True    
-        if name in module.objects: return True    
-        if name in module.funcs: return True    
-        if name in module.constants: return True
-        if name in module.global_vars: return True
-        
-        return False
+        return name in module.symbols
     
     def updateType(self, the_type, log):
         if not the_type.hasDefinitionScope():
@@ -165,18 +284,18 @@ class Module:
             return the_type.definition_scope.updateType(the_type, log)            
                 
         # Find it and update it.
-        name=the_type.name
-        if name in self.structs: 
-            the_type.makeStruct(self.structs[the_type.name])
+        kind, the_def = self.symbols.get(the_type.name, (None, None))
+        if kind==STRUCT: 
+            the_type.makeStruct(the_def)
             
-        elif name in self.objects: 
-            the_type.makeObject(self.objects[the_type.name])
+        elif kind==OBJECT: 
+            the_type.makeObject(the_def)
         
-        elif name in self.funcs: 
-            the_type.makeFuncRef(self.funcs[the_type.name])
+        elif kind==FUNC: 
+            the_type.makeFuncRef(the_def)
             
-        elif name in self.constants:
-            the_type.makeConstant(self.constants[the_type.name])
+        elif kind==CONSTANT:
+            the_type.makeConstant(the_def)
             
         else:
             log.internal(the_type.loc, "The type named '%s' could not be found during type resolution.  It should never have gotten here." % the_type.name)
@@ -184,9 +303,41 @@ class Module:
            
         return True
        
+    def requireTypeInfo(self, type_info):
+        """Makes sure the type_t global for type_info is defined, along with the attribute tables
+        of the structs it reaches through their members.  Returns the name of the global.  Struct
+        type info is defined in the struct's own module.  Only needed with the type info mode
+        builtins.TYPE_INFO_REACHABLE, otherwise all of it is defined up front."""
+        name = type_info.getTypeInfoName()
+        if type_info.isStruct():
+            st = type_info.struct_def
+            m = st.parent_scope or self
+            if name not in m.global_vars:
+                st.addTypeInfo(m)
+                for member in st.members:
+                    m.requireTypeInfo(st.getMemberType(member))
+                m.addGlobal(st.getAttrTable())
+                
+        elif type_info.id in builtins.BUILTIN_TYPE_INFO_IDS and name not in self.global_vars:
+            self.addGlobal(builtins.create_builtin_type_info(self, type_info.id))
+            
+        return name
+        
     def bindMembers(self, log):
         for name in self.structs:
             self.structs[name].bindMembers(log)
+            
+        # Binding resolves the member types the graph is built from.
+        self.struct_graph = None
+            
+        # The fields are reordered once all the member types are known.
+        if struct.member_reordering:
+            for name in self.structs:
+                self.structs[name].reorderMembers()
+                
+            # Layouts computed while the loop reordered the structs they hold are stale.
+            for name in self.structs:
+                self.structs[name].layout = None
          
     
 def new(name):
@@ -0,0 +1,124 @@
+"""String tables.  A module adds the text of each string constant to its table once and refers to
+it by index.  Strings that are the tail of a longer string in the table are not stored on their
+own, they are placed at an offset into the longer one.  The tables of all the modules in a build
+are pooled at link time, so a string is stored once across the modules, tails included."""
+
+class StringTable:
+    "The distinct strings of a module, in the order they were added."
+    def __init__(self):
+        # The strings, by index.
+        self.strings = []
+
+        # Dictionary of string to its index.
+        self.indices = {}
+
+        # The number of strings added and the number that were already in the table.
+        self.lookups = 0
+        self.hits = 0
+
+        #  The placement of every string, as a list of (index of the string holding it, offset),
+        # or None until it is computed.
+        self.placements = None
+
+        #  The table pooling this one with the other modules' tables at link time, and the index of
+        # each string in it.  None until the table is linked.
+        self.pool = None
+        self.pool_indices = None
+
+        # For a pool, the table that added each string first, which is the one that stores it.
+        self.definers = None
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __iter__(self):
+        return iter(self.strings)
+
+    def __getitem__(self, idx):
+        return self.strings[idx]
+
+    def __contains__(self, value):
+        return value in self.indices
+
+    def add(self, value):
+        "Adds value if it isn't in the table yet.  Returns its index."
+        self.lookups+=1
+        idx = self.indices.get(value, None)
+        if idx!=None:
+            self.hits+=1
+            return idx
+
+        idx = self.indices[value] = len(self.strings)
+        self.strings.append(value)
+        self.placements = None
+        return idx
+
+    def getPlacement(self, idx):
+        """Returns (owner, offset), where string idx is stored at offset in the string at index owner.
+        A string that isn't the tail of another is its own owner, at offset 0."""
+        if self.placements==None:
+            self.placements = merge_suffixes(self.strings)
+        return self.placements[idx]
+
+    def isOwner(self, idx):
+        "Returns True if string idx has to be stored, False if it is placed inside another string."
+        return self.getPlacement(idx)[0]==idx
+
+    def isLinked(self):
+        "Returns True if the table has been pooled with other tables."
+        return self.pool!=None
+
+    def getLinkedPlacement(self, idx):
+        "Returns (owner, offset), where string idx is stored at offset in the string at index owner of the pool."
+        return self.pool.getPlacement(self.pool_indices[idx])
+
+    def getLinkedOwners(self):
+        """Returns the sorted pool indices of the strings that hold this table's strings, each with
+        True if this table stores it and False if another table does."""
+        owners = set([self.pool.getPlacement(idx)[0] for idx in self.pool_indices])
+        return [(owner, self.pool.definers[owner] is self) for owner in sorted(owners)]
+
+    def getStats(self):
+        "Returns a dictionary of the table statistics."
+        stored = sum([len(s) for idx, s in enumerate(self.strings) if self.isOwner(idx)])
+        return { "entries"  : len(self.strings),
+                 "bytes"    : sum([len(s) for s in self.strings]),
+                 "stored"   : stored,
+                 "lookups"  : self.lookups,
+                 "hits"     : self.hits,
+                 "hit_rate" : float(self.hits)/self.lookups if self.lookups else 0.0 }
+
+def merge_suffixes(strings):
+    """Returns the (owner, offset) placement of each of the distinct strings.  Sorted by their
+    reversed text, a string that is the tail of others comes right before the longest of them's
+    run, so one backward pass over the sorted order finds every owner."""
+    order = sorted(range(0, len(strings)), key=lambda idx: strings[idx][::-1])
+    placements = [None]*len(strings)
+
+    owner = None
+    for idx in reversed(order):
+        s = strings[idx]
+        if owner!=None and strings[owner].endswith(s):
+            placements[idx] = (owner, len(strings[owner])-len(s))
+        else:
+            owner = idx
+            placements[idx] = (idx, 0)
+
+    return placements
+
+def link(tables):
+    """Pools the strings of every table into a new table, with the lookup counts of all of them,
+    and links each table to it.  Each string is stored by the first table that has it."""
+    pool = StringTable()
+    pool.definers = []
+    for table in tables:
+        table.pool = pool
+        table.pool_indices = [pool.add(s) for s in table]
+        pool.definers.extend([table]*(len(pool)-len(pool.definers)))
+        pool.lookups+=table.lookups-len(table)
+        pool.hits+=table.hits
+
+    return pool
+
+def new():
+    return StringTable()
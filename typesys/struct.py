@@ -2,6 +2,55 @@ import builtins
 import globalvar
 import type
 
+#  When True, Module.bindMembers reorders the fields of every struct that isn't packed by
+# decreasing alignment, which leaves the least padding.
+member_reordering = False
+
+def setMemberReordering(enabled):
+    global member_reordering
+    member_reordering = enabled
+
+class Layout:
+    "The memory layout of a struct."
+    def __init__(self, size, alignment, offsets):
+        # The size in bytes, including the padding at the end.
+        self.size = size
+        
+        # The alignment in bytes
+        self.alignment = alignment
+        
+        # Dictionary of member name to its offset in bytes
+        self.offsets = offsets
+        
+def get_size_and_alignment(t):
+    """Returns the (size, alignment) in bytes of a value of the type t.  References, unbounded
+    arrays and types without a layout of their own are the size of a machine word."""
+    if t.isRef() or t.elem_count<0:
+        return type.WORD_SIZE, type.WORD_SIZE
+    
+    if t.isStruct():
+        layout = t.struct_def.getLayout()
+        size, alignment = layout.size, layout.alignment
+    elif t.id==type.STRING:
+        layout = builtins.STRING_STRUCT.getLayout()
+        size, alignment = layout.size, layout.alignment
+    elif t.id==type.TYPE:
+        layout = builtins.TYPE_STRUCT.getLayout()
+        size, alignment = layout.size, layout.alignment
+    elif t.id in type.id_to_size_map and t.id!=type.NULL:
+        size = alignment = type.id_to_size_map[t.id]
+    else:
+        size = alignment = type.WORD_SIZE
+        
+    if t.isArray():
+        size*=t.elem_count
+        
+    return size, alignment
+
+def align(offset, alignment):
+    "Returns offset rounded up to a multiple of alignment."
+    return (offset+alignment-1)//alignment*alignment
+
 class Struct:
     """A struct is basically a named tuple which is writable.  The members of the data
     structure are ordered and can be of many different types."""
@@ -19,6 +68,14 @@ class Struct:
         # The list of member names in order
         self.members = []
         
+        #  The member names in the order they are laid out in memory, and the dict of names to
+        # that order, or None when that is the order they were declared in.
+        self.field_order = None
+        self.field_index = None
+        
+        # The Layout, computed when it is first asked for.
+        self.layout = None
+        
         # The set of functions that are operators for this type.
         self.operators = []    
         
@@ -42,6 +99,11 @@ class Struct:
         self.member_types[name]=type
         self.member_index[name]=len(self.members)-1
         
+        if self.field_order!=None:
+            self.field_order.append(name)
+            self.field_index[name]=len(self.field_order)-1
+        self.layout = None
+        
     def hasMember(self, name):
         "Returns True if this struct has a member with that name."
         if name in self.member_types:
@@ -64,6 +126,59 @@ class Struct:
     def isPacked(self):
     	return self.is_packed
     
+    def getFieldNames(self):
+        "Returns the member names in the order they are laid out in memory."
+        return self.field_order if self.field_order!=None else self.members
+    
+    def getFieldIndex(self, name):
+        "Returns the position of the member in memory order, which is the index used by generated code."
+        if self.field_order==None:
+            return self.member_index[name]
+        return self.field_index[name]
+    
+    def getLayout(self):
+        """Returns the Layout of this struct.  Members are placed in field order, each at the next
+        offset that is a multiple of its alignment, and the size is padded to a multiple of the
+        largest alignment.  Packed structs have no padding and an alignment of 1."""
+        if self.layout!=None:
+            return self.layout
+        
+        offsets = {}
+        offset = 0
+        max_alignment = 1
+        for name in self.getFieldNames():
+            size, alignment = get_size_and_alignment(self.member_types[name])
+            if self.is_packed:
+                alignment = 1
+                
+            offset = align(offset, alignment)
+            offsets[name] = offset
+            offset+=size
+            max_alignment = max(max_alignment, alignment)
+            
+        self.layout = Layout(align(offset, max_alignment), max_alignment, offsets)
+        return self.layout
+    
+    def reorderMembers(self):
+        """Lays the members out by decreasing alignment, keeping declaration order among members
+        with the same alignment.  Packed structs keep their order.  The declaration order, which
+        constructors use, does not change.  An attribute table already added for this struct is
+        rebuilt in the new order."""
+        if self.is_packed:
+            return
+        
+        alignments = dict([(name, get_size_and_alignment(self.member_types[name])[1]) for name in self.members])
+        order = sorted(self.members, key=lambda name: -alignments[name])
+        if order!=self.members:
+            self.field_order = order
+            self.field_index = dict([(name, idx) for idx, name in enumerate(order)])
+        else:
+            self.field_order = self.field_index = None
+        self.layout = None
+        
+        if self.parent_scope!=None and "%s_attr_table" % self.name in self.parent_scope.global_vars:
+            self.parent_scope.addGlobal(self.getAttrTable())
+    
     def getTypeType(self):
     	"""Returns a global variable definition of type type_t with the initializer setup
     	to initialize it with type information for this struct's type."""
@@ -81,7 +196,7 @@ class Struct:
         to initialize it with type information for this struct's members."""
         
         attr_nodes = []
-        for item in self.members:
+        for item in self.getFieldNames():
         	type_info = self.member_types[item]
         	node = {
                      "name"      : self.parent_scope.findStringConstant(item, type_info.loc),
@@ -100,6 +215,11 @@ class Struct:
                                )
         return the_def    
     
+    def addTypeInfo(self, m):
+        "Adds the name constant and the type_t global for this struct to the module m."
+        m.addConstant(builtins.newConstString("%s_type_name" % self.name, self.name, self.loc))
+        m.addGlobal(self.getTypeType())
+    
     def onAdded(self, m):
     	"Called when the module adds this struct to itself."
     	
@@ -108,8 +228,14 @@ class Struct:
         self.addMember("previous_copy", type.newStructRef(self, self.loc))
         
     	# Add some constants to make sure that we have the information we need for the type info
-        m.addConstant(builtins.newConstString("%s_type_name" % self.name, self.name, self.loc))
-        m.addGlobal(self.getTypeType())
+        if builtins.isTypeInfoEager():
+            self.addTypeInfo(m)
+
+    def onRemoved(self, m):
+        "Called when the module removes this struct.  Takes out the type info added for it."
+        m.removeConstant("%s_type_name" % self.name)
+        m.removeGlobal("%s_type" % self.name)
+        m.removeGlobal("%s_attr_table" % self.name)
                
     def getStructDependencies(self):
          "Returns a list of struct names that this struct depends on."
@@ -143,7 +269,8 @@ class Struct:
                     return False
          
         # Add a global variable that contains the results of the attribute table resolution       
-        self.parent_scope.addGlobal(self.getAttrTable())
+        if builtins.isTypeInfoEager():
+            self.parent_scope.addGlobal(self.getAttrTable())
         return True        
        
 def new(name, loc, docstring=""):
@@ -0,0 +1,75 @@
+"""The dependency graph of the structs of a module.  A struct depends on the structs its members
+are, or refer to.  Structs are ordered so that each comes after the structs it depends on, except
+where a cycle leads back to a struct whose dependencies are still being ordered.  Dependencies on
+structs of other modules are left out."""
+
+# DFS states
+UNVISITED = 0
+VISITING  = 1
+DONE      = 2
+
+class StructGraph:
+    "The dependencies between the structs of one module."
+    def __init__(self, structs):
+        # The struct names, sorted so the order doesn't depend on dictionary order.
+        self.names = sorted(structs.keys())
+
+        # Dictionary of struct name to the sorted names of the structs of the module it depends on.
+        self.deps = {}
+
+        # Dictionary of struct name to the names of the structs that depend on it.
+        self.dependents = dict([(name, []) for name in self.names])
+
+        for name in self.names:
+            deps = sorted(set([dep for dep in structs[name].getStructDependencies() if dep in structs and dep!=name]))
+            self.deps[name] = deps
+            for dep in deps:
+                self.dependents[dep].append(name)
+
+        # The struct names, each after its dependencies.
+        self.order = []
+        self.sort()
+
+    def sort(self):
+        "Orders the structs depth first."
+        state = dict([(name, UNVISITED) for name in self.names])
+        for root in self.names:
+            if state[root]!=UNVISITED:
+                continue
+
+            state[root] = VISITING
+            stack = [(root, iter(self.deps[root]))]
+            while len(stack):
+                name, deps = stack[-1]
+                for dep in deps:
+                    if state[dep]==UNVISITED:
+                        state[dep] = VISITING
+                        stack.append((dep, iter(self.deps[dep])))
+                        break
+                else:
+                    stack.pop()
+                    state[name] = DONE
+                    self.order.append(name)
+
+    def getDependencies(self, name):
+        "Returns the names of the structs name depends on directly."
+        return self.deps[name]
+
+    def getDependents(self, name):
+        "Returns the names of the structs that depend on name directly."
+        return self.dependents[name]
+
+    def getAffected(self, names):
+        "Returns the set of the structs names, and every struct that depends on them through any path."
+        affected = set()
+        stack = [name for name in names if name in self.dependents]
+        while len(stack):
+            name = stack.pop()
+            if name not in affected:
+                affected.add(name)
+                stack.extend(self.dependents[name])
+
+        return affected
+
+def new(structs):
+    return StructGraph(structs)
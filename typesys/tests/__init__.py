@@ -1,4 +1,8 @@
 from test_struct import *
 from test_module import *
 from test_func import *
-from test_block import *
\ No newline at end of file
+from test_block import *
+from test_type import *
+from test_strings import *
+from test_type_info import *
+from test_structgraph import *
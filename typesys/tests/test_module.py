@@ -55,4 +55,23 @@ class TestModule(unittest.TestCase):
     	loc=err.location("unittest::testAddImport", 1, 1)
         t = typesys.type.new("test_module2::test_struct", loc)                
         self.assertTrue(self.m.hasDefinition(t, self.log))
-    
\ No newline at end of file
+    
+    def testSymbols(self):
+        self.assertEqual(self.m.findSymbol("test_struct"), (typesys.module.STRUCT, self.st))
+        self.assertEqual(self.m.findSymbol("test_const"), (typesys.module.CONSTANT, self.const1))
+        self.assertEqual(self.m.findSymbol("test_func")[0], typesys.module.FUNC)
+        self.assertEqual(self.m.findSymbol("missing"), None)
+        
+        self.m.removeConstant("test_const")
+        self.assertEqual(self.m.findSymbol("test_const"), None)
+        
+    def testResolveScope(self):
+        loc=err.location("unittest::testResolveScope", 1, 1)
+        self.assertEqual(self.m.resolveScope("test_module2::test_struct"), ((self.m2, "test_struct"), []))
+        self.assertEqual(self.m.resolveScope("nothing::test_struct"), ((self.m, "test_struct"), ["nothing"]))
+        
+        # A new import invalidates the resolved names
+        m3 = typesys.module.new("nothing")
+        self.m.addImport(m3)
+        self.assertEqual(self.m.resolveScope("nothing::test_struct"), ((m3, "test_struct"), []))
+        self.assertFalse(self.m.hasDefinition(typesys.type.new("nothing::test_struct", loc), self.log))
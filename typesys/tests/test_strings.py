@@ -0,0 +1,60 @@
+import unittest
+
+import typesys.strings
+
+class TestStrings(unittest.TestCase):
+    def setUp(self):
+        self.table = typesys.strings.new()
+        
+    def testAdd(self):
+        "Each distinct string is stored once."
+        self.assertEqual(self.table.add("hello"), 0)
+        self.assertEqual(self.table.add("world"), 1)
+        self.assertEqual(self.table.add("hello"), 0)
+        self.assertEqual(list(self.table), ["hello", "world"])
+        self.assertEqual(self.table[1], "world")
+        self.assertTrue("world" in self.table)
+        
+        stats = self.table.getStats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["lookups"], 3)
+        self.assertEqual(stats["hits"], 1)
+        
+    def testSuffixes(self):
+        "Strings that end a longer string are placed inside it."
+        for s in ["main", "domain", "in", "out", "", "layout"]:
+            self.table.add(s)
+            
+        self.assertEqual(self.table.getPlacement(1), (1, 0))
+        self.assertEqual(self.table.getPlacement(0), (1, 2))
+        self.assertEqual(self.table.getPlacement(2), (1, 4))
+        self.assertEqual(self.table.getPlacement(3), (5, 3))
+        self.assertTrue(self.table.isOwner(5))
+        self.assertFalse(self.table.isOwner(4))
+        self.assertEqual(self.table.getStats()["stored"], len("domain")+len("layout"))
+        
+        # Adding a longer string moves its tails into it.
+        self.table.add("subdomain")
+        self.assertEqual(self.table.getPlacement(1), (6, 3))
+        
+    def testLink(self):
+        "Tables are pooled across modules, merging the tails of other modules' strings."
+        other = typesys.strings.new()
+        self.table.add("a")
+        self.table.add("b")
+        self.table.add("a")
+        other.add("b")
+        other.add("cb")
+        
+        pool = typesys.strings.link([self.table, other])
+        self.assertEqual(list(pool), ["a", "b", "cb"])
+        self.assertEqual(pool.lookups, 5)
+        self.assertEqual(pool.hits, 2)
+        self.assertEqual(pool.getStats()["stored"], 3)
+        
+        # b is placed in cb, which the other table stores.
+        self.assertTrue(self.table.isLinked())
+        self.assertEqual(self.table.getLinkedPlacement(1), (2, 1))
+        self.assertEqual(other.getLinkedPlacement(0), (2, 1))
+        self.assertEqual(self.table.getLinkedOwners(), [(0, True), (2, False)])
+        self.assertEqual(other.getLinkedOwners(), [(2, True)])
@@ -47,4 +47,91 @@ class TestStruct(unittest.TestCase):
     	
         
         
-    	
\ No newline at end of file
+    	        
+    def makeStruct(self, name, members):
+        loc=err.location("unittest::makeStruct", 1, 1)
+        st = typesys.struct.new(name, loc)
+        for member_name, type_name in members:
+            st.addMember(member_name, typesys.type.new(type_name, loc))
+        return st
+        
+    def testLayout(self):
+        "Members are aligned to their size and the struct is padded to its alignment."
+        st = self.makeStruct("layout", [("a", "uint8_t"), ("b", "uint32_t"), ("c", "uint8_t"), ("d", "uint16_t")])
+        layout = st.getLayout()
+        self.assertEqual(layout.offsets, {"a" : 0, "b" : 4, "c" : 8, "d" : 10})
+        self.assertEqual(layout.size, 12)
+        self.assertEqual(layout.alignment, 4)
+        
+        st.is_packed = True
+        st.layout = None
+        self.assertEqual(st.getLayout().offsets, {"a" : 0, "b" : 1, "c" : 5, "d" : 6})
+        self.assertEqual(st.getLayout().size, 8)
+        self.assertEqual(st.getLayout().alignment, 1)
+        
+    def testNestedLayout(self):
+        "Struct members are laid out by value, references and unbounded arrays are a word."
+        loc=err.location("unittest::testNestedLayout", 1, 1)
+        inner = self.makeStruct("inner", [("x", "uint64_t"), ("y", "uint8_t")])
+        outer = self.makeStruct("outer", [("flag", "uint8_t")])
+        outer.addMember("inner", typesys.type.newStruct(inner, loc))
+        outer.addMember("ref", typesys.type.newStructRef(inner, loc))
+        outer.addMember("bytes", typesys.type.new("uint8_t", loc).makeBoundedArray(3))
+        
+        layout = outer.getLayout()
+        self.assertEqual(inner.getLayout().size, 16)
+        self.assertEqual(layout.offsets, {"flag" : 0, "inner" : 8, "ref" : 24, "bytes" : 28})
+        self.assertEqual(layout.size, 32)
+        
+    def testReorderMembers(self):
+        "Reordering leaves less padding without changing the declaration order."
+        st = self.makeStruct("reordered", [("a", "uint8_t"), ("b", "uint32_t"), ("c", "uint8_t"), ("d", "uint16_t")])
+        st.reorderMembers()
+        self.assertEqual(st.members, ["a", "b", "c", "d"])
+        self.assertEqual(st.getFieldNames(), ["b", "d", "a", "c"])
+        self.assertEqual(st.getFieldIndex("a"), 2)
+        self.assertEqual(st.getMemberIndex("a"), 0)
+        self.assertEqual(st.getLayout().size, 8)
+        
+        st.is_packed = True
+        st.field_order = st.field_index = None
+        st.reorderMembers()
+        self.assertEqual(st.getFieldNames(), ["a", "b", "c", "d"])
+        
+    def testReorderNested(self):
+        "Layouts computed while the structs they hold were still being reordered are computed again."
+        loc=err.location("unittest::testReorderNested", 1, 1)
+        inner = self.makeStruct("pixel", [("a", "uint8_t"), ("b", "uint32_t"), ("c", "uint8_t")])
+        outer = self.makeStruct("cell", [("flag", "uint8_t")])
+        outer.addMember("inner", typesys.type.newStruct(inner, loc))
+        top = self.makeStruct("line", [("outer", "cell")])
+        
+        # Named so the module reorders cell, then line, then pixel.
+        for st in [inner, outer, top]:
+            self.m.addStruct(st)
+            
+        typesys.struct.setMemberReordering(True)
+        try:
+            self.m.bindMembers(self.log)
+        finally:
+            typesys.struct.setMemberReordering(False)
+            
+        # Binding adds a word for the reference count and one for the previous copy.
+        self.assertEqual(inner.getLayout().size, 16)
+        self.assertEqual(outer.getLayout().offsets["inner"], 0)
+        self.assertEqual(outer.getLayout().size, 28)
+        self.assertEqual(top.getLayout().size, 36)
+        
+    def testReorderAttrTable(self):
+        "The attribute table follows the field order."
+        typesys.struct.setMemberReordering(True)
+        try:
+            st = self.makeStruct("reflected", [("a", "uint8_t"), ("b", "uint32_t")])
+            self.m.addStruct(st)
+            self.m.bindMembers(self.log)
+        finally:
+            typesys.struct.setMemberReordering(False)
+            
+        self.assertEqual(st.getFieldNames()[0], "b")
+        attrs = self.m.global_vars["reflected_attr_table"].initializer
+        self.assertEqual([self.m.getString(self.m.constants[node["name"]].initializer) for node in attrs], st.getFieldNames())
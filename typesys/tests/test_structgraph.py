@@ -0,0 +1,61 @@
+import unittest
+
+import err
+import typesys.builtins
+import typesys.module
+import typesys.struct
+import typesys.structgraph
+import typesys.type
+
+class TestStructGraph(unittest.TestCase):
+    def setUp(self):
+        self.loc = err.location("unittest::TestStructGraph::setUp", 1, 1)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+        self.m = typesys.module.new("test_module")
+        self.structs = {}
+        for name in ["list_t", "node_t", "value_t", "leaf_t"]:
+            self.structs[name] = typesys.struct.new(name, self.loc)
+            
+        # list_t and node_t refer to each other, node_t holds a value_t which holds a leaf_t.
+        self.addMember("list_t", "head", "node_t", True)
+        self.addMember("node_t", "owner", "list_t", True)
+        self.addMember("node_t", "value", "value_t", False)
+        self.addMember("value_t", "leaf", "leaf_t", False)
+        
+        for name in sorted(self.structs):
+            self.m.addStruct(self.structs[name])
+        
+    def addMember(self, name, member, type_name, is_ref):
+        st_def = self.structs[type_name]
+        t = typesys.type.newStructRef(st_def, self.loc) if is_ref else typesys.type.newStruct(st_def, self.loc)
+        self.structs[name].addMember(member, t)
+        
+    def testOrder(self):
+        "Structs come after the structs they depend on, except around a cycle."
+        graph = self.m.getStructGraph()
+        order = graph.order
+        for name in self.structs:
+            for dep in graph.getDependencies(name):
+                if name not in graph.getAffected([dep]):
+                    self.assertTrue(order.index(dep)<order.index(name), (dep, name))
+                    
+        self.assertTrue(order.index("leaf_t")<order.index("value_t")<order.index("node_t")<order.index("list_t"))
+        
+    def testAffected(self):
+        "A change reaches every struct that depends on it."
+        graph = self.m.getStructGraph()
+        self.assertEqual(graph.getDependents("value_t"), ["node_t"])
+        self.assertEqual(graph.getAffected(["leaf_t"]), set(["leaf_t", "value_t", "node_t", "list_t"]))
+        self.assertEqual(graph.getAffected(["list_t"]), set(["list_t", "node_t"]))
+        
+    def testCached(self):
+        "The graph is built once, until the structs change."
+        graph = self.m.getStructGraph()
+        self.assertTrue(self.m.getStructGraph() is graph)
+        
+        self.m.removeStruct("leaf_t")
+        self.assertFalse(self.m.getStructGraph() is graph)
+        self.assertEqual(self.m.getStructGraph().getDependencies("value_t"), [])
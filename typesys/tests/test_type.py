@@ -0,0 +1,94 @@
+import sys
+import unittest
+
+import err
+import typesys.builtins
+import typesys.const
+import typesys.struct
+import typesys.type
+
+import expr
+
+class TestType(unittest.TestCase):
+    def setUp(self):
+        self.loc = err.location("unittest::TestType::setUp", 1, 1)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+    def testIntern(self):
+        "Equal primitive types are the same shared instance."
+        t = typesys.type.intern(typesys.type.UINT16, is_const=True)
+        self.assertTrue(t is typesys.type.intern(typesys.type.UINT16, is_const=True))
+        self.assertFalse(t is typesys.type.intern(typesys.type.UINT16))
+        self.assertEqual(t.id, typesys.type.UINT16)
+        self.assertEqual(typesys.type.intern(typesys.type.NULL).id, typesys.type.NULL)
+        
+        self.assertTrue(expr.newInt(self.loc, 7).getType() is expr.newInt(self.loc, 9).getType())
+        self.assertTrue(expr.newString(self.loc, "a").getType().isSame(typesys.type.new("string_t", self.loc, is_const=True)))
+        
+    def testCopyOnWrite(self):
+        "Changing an interned type gives a copy and leaves the shared instance alone."
+        t = typesys.type.intern(typesys.type.UINT8)
+        
+        for change in [lambda t: t.makeRef(), lambda t: t.makeConst(), 
+                       lambda t: t.makeBoundedArray(4), lambda t: t.makeUnboundedArray()]:
+            changed = change(t)
+            self.assertFalse(changed is t)
+            self.assertFalse(changed.interned)
+            
+        self.assertFalse(t.isRef() or t.isConst() or t.isArray())
+        self.assertTrue(typesys.type.intern(typesys.type.UINT8) is t)
+        
+        # Types that aren't interned are changed in place.
+        t = typesys.type.new("uint8_t", self.loc)
+        self.assertTrue(t.makeRef() is t)
+        self.assertTrue(t.isRef())
+        
+    def testConstantOfInternedType(self):
+        "A constant declared with an interned type gets its own constant type."
+        t = typesys.type.intern(typesys.type.UINT32)
+        c = typesys.const.new("C", t, expr.newInt(self.loc, 1))
+        self.assertTrue(c.type_info.isConst())
+        self.assertFalse(t.isConst())
+        
+    def testPromotion(self):
+        "The promotion bitsets agree with the cast lists."
+        ids = typesys.type.id_to_name_map.keys()
+        for src in ids:
+            for dst in ids:
+                expected = dst in typesys.type.CAST.get(src, [])
+                self.assertEqual(typesys.type.intern(src).isPromotable(typesys.type.intern(dst)), expected, (src, dst))
+                
+        unresolved = typesys.type.new("some_struct_t", self.loc)
+        self.assertFalse(unresolved.isPromotable(typesys.type.intern(typesys.type.UINT8)))
+        self.assertFalse(typesys.type.intern(typesys.type.UINT8).isPromotable(unresolved))
+        
+    def testSame(self):
+        "Types are the same until one of them changes."
+        st = typesys.struct.new("test_struct_t", self.loc)
+        a = typesys.type.newStruct(st, self.loc)
+        b = typesys.type.newStruct(st, self.loc)
+        self.assertTrue(a.isSame(b))
+        
+        b = b.makeRef()
+        self.assertFalse(a.isSame(b))
+        
+        c = typesys.type.newStruct(typesys.struct.new("other_struct_t", self.loc), self.loc)
+        self.assertFalse(a.isSame(c))
+        c.makeStruct(st)
+        self.assertTrue(a.isSame(c))
+        
+        self.assertTrue(typesys.type.new("string_t", self.loc).isSame(typesys.type.newStruct(typesys.builtins.STRING_STRUCT, self.loc)))
+        self.assertFalse(typesys.type.new("string_t", self.loc).isSame(typesys.type.new("uint8_t", self.loc)))
+        
+    def testCommonSupertype(self):
+        "The common supertype is the most specific type both sides promote to."
+        t = lambda type_id: typesys.type.intern(type_id)
+        a = typesys.type.new("uint8_t", self.loc)
+        self.assertTrue(typesys.type.common_supertype(a, t(typesys.type.UINT8)) is a)
+        self.assertEqual(typesys.type.common_supertype(a, t(typesys.type.UINT32)).id, typesys.type.UINT32)
+        self.assertEqual(typesys.type.common_supertype(t(typesys.type.SINT8), a).id, typesys.type.SINT16)
+        self.assertEqual(typesys.type.common_supertype(t(typesys.type.UINT64), t(typesys.type.SINT64)).id, typesys.type.FLOAT64)
+        self.assertEqual(typesys.type.common_supertype(t(typesys.type.FLOAT32), t(typesys.type.SINT32)).id, typesys.type.FLOAT32)
+        self.assertEqual(typesys.type.common_supertype(t(typesys.type.BOOL), a), None)
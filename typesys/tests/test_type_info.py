@@ -0,0 +1,69 @@
+import sys
+import unittest
+
+import err
+import typesys.builtins
+import typesys.module
+import typesys.struct
+import typesys.type
+
+class TestTypeInfo(unittest.TestCase):
+    def setUp(self):
+        self.loc = err.location("unittest::TestTypeInfo::setUp", 1, 1)
+        
+        self.log = err.new(sys.stderr)
+        self.log.setIgnoreLevel(err.TRACE)
+        
+        typesys.type.setMachineSizes(typesys.type.UINT32, typesys.type.UINT8)
+        typesys.builtins.initialize()
+        
+    def tearDown(self):
+        typesys.builtins.setTypeInfoMode(typesys.builtins.TYPE_INFO_ALL)
+        
+    def makeModule(self):
+        m = typesys.module.new("test_module")
+        typesys.builtins.initialize_module(m)
+        
+        self.inner = typesys.struct.new("inner", self.loc)
+        self.inner.addMember("value", typesys.type.new("uint16_t", self.loc))
+        self.outer = typesys.struct.new("outer", self.loc)
+        self.outer.addMember("child", typesys.type.new("inner", self.loc))
+        self.unused = typesys.struct.new("unused", self.loc)
+        
+        m.addStruct(self.inner)
+        m.addStruct(self.outer)
+        m.addStruct(self.unused)
+        m.bindMembers(self.log)
+        return m
+        
+    def testAll(self):
+        "Every type gets its type info."
+        m = self.makeModule()
+        for name in ["inner_type", "inner_attr_table", "unused_type", "unused_attr_table", "uint16_t_type"]:
+            self.assertTrue(name in m.global_vars, name)
+        
+    def testReachable(self):
+        "Only the types reached from the types asked for get type info."
+        typesys.builtins.setTypeInfoMode(typesys.builtins.TYPE_INFO_REACHABLE)
+        m = self.makeModule()
+        self.assertEqual([name for name in m.global_vars if name.endswith("_type") or name.endswith("_attr_table")], [])
+        self.assertFalse("outer_type_name" in m.constants)
+        
+        self.assertEqual(m.requireTypeInfo(typesys.type.newStruct(self.outer, self.loc)), "outer_type")
+        for name in ["outer_type", "outer_attr_table", "inner_type", "inner_attr_table", "uint16_t_type", "uint32_t_type"]:
+            self.assertTrue(name in m.global_vars, name)
+        self.assertTrue("outer_type_name" in m.constants)
+        self.assertFalse("unused_type" in m.global_vars)
+        self.assertFalse("uint8_t_type" in m.global_vars)
+        
+        # Asking again adds nothing.
+        count = len(m.global_vars)
+        m.requireTypeInfo(typesys.type.newStruct(self.inner, self.loc))
+        self.assertEqual(len(m.global_vars), count)
+        
+    def testRemove(self):
+        "Removing a struct removes its type info."
+        m = self.makeModule()
+        m.removeStruct("unused")
+        self.assertFalse("unused_type" in m.global_vars)
+        self.assertEqual(m.findSymbol("unused_attr_table"), None)
@@ -1,5 +1,3 @@
-import copy
-
 # The types allowed by the language
 NULL    = 0
 UINT8   = 1
@@ -94,6 +92,45 @@ CAST = { SINT8  : SINT8_CAST,
 	   	 UINT64 : UINT64_CAST,
 	   	 FLOAT32 : FLOAT32_CAST }
 
+#  The promotion relation as a bitset per type id.  Bit n of promotion_masks[id] is set when
+# a value of type id is promotable to type id n.
+promotion_masks = [0]*(OPAQUE+1)
+for src in CAST:
+    for dst in CAST[src]:
+        promotion_masks[src] |= 1<<dst
+
+def is_promotable_id(src, dst):
+    "Returns True if a value of the type id src is promotable to the type id dst."
+    return src<len(promotion_masks) and (promotion_masks[src]>>dst)&1==1
+
+#  Dictionary of (id, id) to the id of the most specific type both are promotable to, or None.
+supertype_ids = {}
+
+def common_supertype_id(a, b):
+    """Returns the id of the most specific type that both type ids a and b are the same as or
+    promotable to, or None if there is no such type."""
+    key = (a, b)
+    if key in supertype_ids:
+        return supertype_ids[key]
+    
+    if a==b or is_promotable_id(b, a):
+        result = a
+    elif is_promotable_id(a, b):
+        result = b
+    else:
+        # Of the types both promote to, pick the one that promotes to all the others.
+        result = None
+        if a<len(promotion_masks) and b<len(promotion_masks):
+            shared = promotion_masks[a] & promotion_masks[b]
+            candidates = [n for n in range(0, len(promotion_masks)) if (shared>>n)&1]
+            for n in candidates:
+                if (promotion_masks[n]|(1<<n)) & shared == shared:
+                    result = n
+                    break
+                
+    supertype_ids[key] = result
+    return result
+
 
 
 PUBLIC=0
@@ -162,6 +199,13 @@ class Type(object):
         # If this type is castable, this will hold the casting class
         self.castable_to=None
         
+        #  True for the shared instances handed out by intern().  These must never be changed,
+        # the make* methods return a changed copy of them instead.
+        self.interned = False
+        
+        # The tuple isSame compares, made on first use.  Anything that changes the type resets it.
+        self.signature = None
+        
     def __str__(self):
     	t =""
     	if self.isConst(): t+="const ";
@@ -183,7 +227,17 @@ class Type(object):
     	
         
     def clone(self):
-    	return copy.copy(self)
+        "Returns a private copy of this type, which may be changed freely."
+        t = Type.__new__(Type)
+        t.__dict__.update(self.__dict__)
+        t.interned = False
+        t.signature = None
+        return t
+        
+    def mutable(self):
+        """Returns this type if it may be changed, or a private copy of it if it is a shared
+        interned type."""
+        return self.clone() if self.interned else self
         
     def encodeFlags(self):
     	"""Returns a binary representation of the type flags suitable for the
@@ -197,6 +251,7 @@ class Type(object):
     
     def setTypeId(self, id):
     	self.id = id
+    	self.signature = None
     	    	
     def setDefinitionScope(self, scope):
     	"Set the definition scope for this type."
@@ -204,6 +259,7 @@ class Type(object):
     	
     def setName(self, name):
     	self.name=name
+    	self.signature = None
     	
     def hasDefinitionScope(self):
     	return self.definition_scope!=None
@@ -257,43 +313,30 @@ class Type(object):
     def isFloat(self):
     	return self.id in FLOATS
     
+    def getSignature(self):
+        """Returns a tuple that is equal for two types exactly when they are the same type.  It is
+        made once and kept until the type changes."""
+        if self.signature==None:
+            if self.isString():
+                # Strings are all the same type, whatever their flags.
+                self.signature = (STRING,)
+            else:
+                definition = None
+                if self.isStruct(): definition = self.struct_def
+                elif self.isFunc(): definition = self.func_def
+                elif self.isObject(): definition = self.object_def
+                
+                self.signature = (self.id, self.isRef(), self.isArray(), self.isVector(), self.isConst(), definition)
+                
+        return self.signature
+    
     def isSame(self, ot):
-    	"Returns true if this type is the same as the other type."
-    	# Special case strings
-    	if self.isString() and ot.isString(): return True
-    	
-    	# Not the same id, not the same type
-    	if self.id != ot.id: return False
-    	
-    	if self.isRef() != ot.isRef(): return False
-    	if self.isArray() != ot.isArray(): return False
-    	if self.isVector() != ot.isVector(): return False
-    	if self.isConst() != ot.isConst(): return False
-    	    	
-    	if self.isStruct():
-    		if self.struct_def != ot.struct_def:
-    			return False
-    		
-    	if self.isFunc():
-            if self.func_def != ot.func_def:
-                return False
-               
-        if self.isObject():
-            if self.object_def != ot.object_def:
-                return False
-        
-        return True
+        "Returns true if this type is the same as the other type."
+        return self is ot or self.getSignature()==ot.getSignature()
        
     def isPromotable(self, ot):
-    	castable = CAST.get(self.id, None)
-    	if castable == None:
-    		return False
-    	
-    	if ot.id in castable:
-    		return True
-    	
-    	return False
-    	
+        "Returns true if a value of this type can be automatically cast to the other type."
+        return self.id<len(promotion_masks) and (promotion_masks[self.id]>>ot.id)&1==1
        
     def getTypeInfoName(self):
     	if self.id == STRUCT:
@@ -313,19 +356,38 @@ class Type(object):
     	return it
         	
     def makeBoundedArray(self, size):
-    	self.elem_count = size
-    	self.read_only  = False
+        "Makes this a bounded array.  Returns the changed type, which is a copy if this one is interned."
+        t = self.mutable()
+        t.elem_count = size
+        t.signature = None
+        t.read_only  = False
+        return t
     	
     def makeUnboundedArray(self):
-    	self.elem_count = -1
-    	self.read_only  = False
+        "Makes this an unbounded array.  Returns the changed type, which is a copy if this one is interned."
+        t = self.mutable()
+        t.elem_count = -1
+        t.signature = None
+        t.read_only  = False
+        return t
        
     def makeRef(self):
-    	self.ref=True
+        "Makes this a reference.  Returns the changed type, which is a copy if this one is interned."
+        t = self.mutable()
+        t.ref=True
+        t.signature = None
+        return t
     	
     def makeConst(self):
-    	self.const=True
-    	self.read_only=True
+        "Makes this constant.  Returns the changed type, which is a copy if this one is interned."
+        if self.const and self.read_only:
+            return self
+        
+        t = self.mutable()
+        t.const=True
+        t.read_only=True
+        t.signature = None
+        return t
        
     def makeFuncRef(self, func_def, environment=None):
         """Makes this type a reference to a function.
@@ -336,6 +398,7 @@ class Type(object):
         self.ref = True
         self.func_def = func_def
         self.environment=environment
+        self.signature = None
         
     def makeStruct(self, struct_def, is_ref=False):
         """Makes this a type of struct, specialized to the struct def given. Optionally, make it a 
@@ -344,6 +407,7 @@ class Type(object):
         self.id  = STRUCT
         if is_ref: self.ref = is_ref
         self.struct_def = struct_def
+        self.signature = None
         
     def makeObject(self, object_def, is_ref=False):
         """Makes this a type of object, specialized to the object def given. Optionally, make it a 
@@ -352,16 +416,44 @@ class Type(object):
         self.id  = OBJECT
         if is_ref: self.ref = is_ref
         self.object_def = object_def
+        self.signature = None
         
 def new(name, loc, **kw):
 	return Type(name, loc, **kw)
 
+def common_supertype(a, b):
+    """Returns the most specific type that both a and b are the same as or promotable to, or None
+    if there isn't one.  The result is a or b when one of them is that type, otherwise it is an
+    interned type."""
+    if a.isSame(b) or b.isPromotable(a):
+        return a
+    if a.isPromotable(b):
+        return b
+    
+    type_id = common_supertype_id(a.id, b.id)
+    return intern(type_id) if type_id!=None else None
+
+#  Dictionary of (id, const, ref, elem_count) to the shared instance of that type.
+interned_types = {}
+
+def intern(id, is_const=False, is_ref=False, elem_count=0):
+    """Returns the shared instance of a primitive type.  Literals and folded values use these so
+    equal types aren't allocated over and over.  Interned types have no location, and changing
+    one with a make* method gives a private copy."""
+    key = (id, is_const, is_ref, elem_count)
+    t = interned_types.get(key, None)
+    if t==None:
+        t = Type(id_to_name_map[id], None, is_const=is_const, is_ref=is_ref, elem_count=elem_count)
+        t.id = id
+        t.interned = True
+        interned_types[key] = t
+        
+    return t
+
 def newStruct(st_def, loc, **kw):
 	t=Type(st_def.name, loc, **kw)
 	t.makeStruct(st_def)			
 	return t
 	
 def newStructRef(st_def, loc, **kw):
-	t=newStruct(st_def, loc, **kw)
-	t.makeRef()
-	return t               
+	return newStruct(st_def, loc, **kw).makeRef()               
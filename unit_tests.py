@@ -1,5 +1,6 @@
 import unittest
 
+import driver
 import expr
 import mparser
 import typesys
@@ -15,6 +16,9 @@ unittest.TextTestRunner(verbosity=2).run(suite)
 suite = unittest.TestLoader().loadTestsFromModule(mparser.tests)
 unittest.TextTestRunner(verbosity=2).run(suite)
 
+suite = unittest.TestLoader().loadTestsFromModule(driver.tests)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
 # These tests can take a very long time, so you may want to
 # disable them while developing.
 suite = unittest.TestLoader().loadTestsFromModule(llvm.tests)